@@ -0,0 +1,177 @@
+"""
+AI 操作计划解析
+模型在回答中输出 { "thought": ..., "actions": [...] } 形式的操作计划。
+ActionPlanScanner 在 token 流到达时逐字符跟踪 JSON 的括号和字符串状态，
+顶层对象一闭合就解析出计划，不必等模型写完后面的说明文字；
+validate_plan 再按已知的表和字段检查每个操作，修正表名和字段大小写，去掉无法执行的操作。
+"""
+
+import re
+import json
+
+ACTION_TYPES = ('SEARCH', 'UPDATE', 'INSERT')
+
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+
+
+def parse_json_object(text):
+    """解析一个 JSON 对象；失败时去掉多余的结尾逗号再试一次（模型常见错误），仍失败返回 None"""
+    for candidate in (text, _TRAILING_COMMA_RE.sub(r'\1', text)):
+        try:
+            # strict=False 允许字符串中出现未转义的换行
+            value = json.loads(candidate, strict=False)
+        except ValueError:
+            continue
+        return value if isinstance(value, dict) else None
+    return None
+
+
+class ActionPlanScanner:
+    """
+    增量扫描流式文本中的顶层 JSON 对象。feed() 每次接收一段新文本，
+    返回本段中闭合的、包含 "actions" 的对象（dict）列表。
+    字符串中的括号和转义字符不影响计数；无法解析的对象从它的下一个 '{' 重新扫描，
+    说明文字中未闭合的 '{' 之后的计划在流结束时由 finish() 找出。
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        plans = []
+        for ch in text:
+            if self._depth == 0:
+                if ch == '{':
+                    self._buffer = [ch]
+                    self._depth = 1
+                continue
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = ''.join(self._buffer)
+                    self._reset()
+                    plan = parse_json_object(candidate)
+                    if plan is None:
+                        # 例如 "{a, b} 和 {"actions": ...}" 被当成一个对象：从下一个 '{' 重新扫描
+                        plans.extend(self.feed(candidate[1:]))
+                    elif 'actions' in plan:
+                        plans.append(plan)
+        return plans
+
+    def finish(self):
+        """
+        流结束时调用，返回剩余的计划。
+        仍未闭合的对象（说明文字中多出的 '{' 会吞掉后面的计划）从它的下一个 '{' 重新扫描。
+        """
+        plans = []
+        while self._buffer:
+            pending = ''.join(self._buffer[1:])
+            self._reset()
+            plans.extend(self.feed(pending))
+        return plans
+
+
+def _match_columns(values, columns, table, issues, where):
+    """把 {字段: 值} 的字段名对齐到实际大小写；有未知字段返回 None"""
+    if columns is None:
+        return values
+    by_upper = {col.upper(): col for col in columns}
+    matched = {}
+    for key, value in values.items():
+        actual = by_upper.get(str(key).upper())
+        if actual is None:
+            issues.append(f"{where}: unknown column '{key}' in {table}")
+            return None
+        matched[actual] = value
+    return matched
+
+
+def validate_plan(plan, known_tables=None, resolve_table=None):
+    """
+    检查操作计划，返回 {'thought', 'actions', 'issues'}：actions 只包含可以执行的操作。
+    known_tables: {表名: [字段...]}，为空时不检查表和字段。
+    resolve_table: 表名不存在时用于猜测实际表名的函数（例如把 'Sample.ta' 映射为 'GeoArea'）。
+    """
+    known_tables = known_tables or {}
+    tables_by_upper = {name.upper(): name for name in known_tables}
+    actions = []
+    issues = []
+    raw_actions = plan.get('actions')
+    if not isinstance(raw_actions, list):
+        raw_actions = [raw_actions] if isinstance(raw_actions, dict) else []
+        if plan.get('actions'):
+            issues.append("'actions' is not a list")
+
+    for index, action in enumerate(raw_actions, 1):
+        if not isinstance(action, dict):
+            issues.append(f"action {index}: not an object")
+            continue
+        action_type = str(action.get('type', '')).upper()
+        if action_type not in ACTION_TYPES:
+            issues.append(f"action {index}: unsupported type '{action.get('type')}'")
+            continue
+        table = action.get('table')
+        if not table or not isinstance(table, str):
+            issues.append(f"action {index}: missing table")
+            continue
+
+        columns = None
+        if known_tables:
+            actual = tables_by_upper.get(table.upper())
+            if actual is None and resolve_table:
+                guess = resolve_table(table)
+                actual = tables_by_upper.get(str(guess).upper()) if guess else None
+            if actual is None:
+                issues.append(f"action {index}: unknown table '{table}'")
+                continue
+            table = actual
+            columns = known_tables[table]
+
+        # 其余字段（例如 SEARCH 的 limit / offset）原样保留
+        checked = dict(action, type=action_type, table=table)
+        filter_criteria = action.get('filter')
+        if filter_criteria is not None:
+            if not isinstance(filter_criteria, dict):
+                issues.append(f"action {index}: 'filter' is not an object")
+                continue
+            filter_criteria = _match_columns(filter_criteria, columns, table, issues, f"action {index} filter")
+            if filter_criteria is None:
+                continue
+            checked['filter'] = filter_criteria
+        row_data = action.get('data')
+        if row_data is not None:
+            if not isinstance(row_data, dict):
+                issues.append(f"action {index}: 'data' is not an object")
+                continue
+            row_data = _match_columns(row_data, columns, table, issues, f"action {index} data")
+            if row_data is None:
+                continue
+            checked['data'] = row_data
+
+        if action_type in ('UPDATE', 'INSERT') and not row_data:
+            issues.append(f"action {index}: {action_type} without data")
+            continue
+        if action_type == 'UPDATE' and action.get('id') in (None, '') and filter_criteria is None:
+            issues.append(f"action {index}: UPDATE needs an id or a filter")
+            continue
+        actions.append(checked)
+
+    return {'thought': plan.get('thought'), 'actions': actions, 'issues': issues}
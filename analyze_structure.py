@@ -1,45 +1,63 @@
 import sqlite3
 import os
 
-def analyze_database_structure(db_path):
+def inspect_database_structure(db_path):
     """
-    Analyzes the SQLite database and returns a summary string of its structure.
-    Used to give the AI a 'Global Map' of the data.
+    Reads table/column/primary-key information from a SQLite database.
+    Returns {'table_count': int, 'tables': {table: {'columns': [...], 'primary_key': str|None}}}.
+    Raises on SQLite errors; callers decide how to report them.
     """
-    if not os.path.exists(db_path):
-        return f"Database not found: {db_path}"
-
-    summary = []
+    conn = sqlite3.connect(db_path)
     try:
-        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
-        
+
         # Get all tables
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        
-        summary.append(f"Database File: {os.path.basename(db_path)}")
-        summary.append(f"Total Tables: {len(tables)}")
-        
-        for table_row in tables:
+        table_rows = cursor.fetchall()
+
+        tables = {}
+        for table_row in table_rows:
             table_name = table_row[0]
             # Skip internal SQLite tables
             if table_name.startswith('sqlite_'):
                 continue
-                
-            summary.append(f"\nTable: {table_name}")
-            
+
             # Get columns
             cursor.execute(f"PRAGMA table_info({table_name})")
             columns = cursor.fetchall()
-            col_names = [col[1] for col in columns]
-            pk_col = next((col[1] for col in columns if col[5] == 1), "None")
-            
-            summary.append(f"  - Primary Key: {pk_col}")
-            summary.append(f"  - Columns: {', '.join(col_names)}")
-            
+            tables[table_name] = {
+                'columns': [col[1] for col in columns],
+                'primary_key': next((col[1] for col in columns if col[5] == 1), None)
+            }
+
+        return {'table_count': len(table_rows), 'tables': tables}
+    finally:
         conn.close()
-        return "\n".join(summary)
-        
+
+def format_database_structure(file_name, structure):
+    """Formats the result of inspect_database_structure as the AI 'Global Map' text."""
+    summary = []
+    summary.append(f"Database File: {file_name}")
+    summary.append(f"Total Tables: {structure['table_count']}")
+
+    for table_name, info in structure['tables'].items():
+        summary.append(f"\nTable: {table_name}")
+        summary.append(f"  - Primary Key: {info['primary_key'] or 'None'}")
+        summary.append(f"  - Columns: {', '.join(info['columns'])}")
+
+    return "\n".join(summary)
+
+def analyze_database_structure(db_path):
+    """
+    Analyzes the SQLite database and returns a summary string of its structure.
+    Used to give the AI a 'Global Map' of the data.
+    """
+    if not os.path.exists(db_path):
+        return f"Database not found: {db_path}"
+
+    try:
+        structure = inspect_database_structure(db_path)
+        return format_database_structure(os.path.basename(db_path), structure)
+
     except Exception as e:
         return f"Error analyzing database structure: {str(e)}"
@@ -1,15 +1,31 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory
 import os
 import json
 import sqlite3
+import time
 import fnmatch
+import logging
 import threading
-import tkinter as tk
-from tkinter import filedialog
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from geological_mapping import GEOLOGICAL_CATEGORIES
+from geological_classifier import GeologicalClassifier
 from analyze_structure import analyze_database_structure
+from schema_catalog import SchemaCatalog, ScanProgress
+from prompt_utils import build_schema_summary, estimate_tokens, PromptRetriever, trim_context, pack_context, context_key
+from db_pool import ConnectionPool
+from table_meta import TableMetaCache, column_name, coerce_value, coerce_id, coerce_updates
+from search_index import SearchIndex
+from point_index import PointIndex, SKIP_TABLES, key_columns
 
+from response_cache import ResponseCache, RESPONSE_CACHE_ENABLED, cache_key as response_cache_key
+from inference_scheduler import InferenceScheduler
+from action_plan import ActionPlanScanner, validate_plan
 import ollama_service
+import metrics
+from metrics import log_event, instrument_connect
+from profiler import RequestProfiler
+from folder_watcher import FolderWatcher, ChangeLog, DATA_EXTENSIONS, WATCH_MODE
+from table_query import SortIndexer, compile_view, view_query, count_query
 
 app = Flask(__name__)
 
@@ -18,10 +34,18 @@ OLLAMA_AVAILABLE = False
 # Global Cache for Database Schema
 GLOBAL_SCHEMA_CACHE = "No database loaded."
 
-def get_db_connection(db_path):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+# 数据文件连接池：按文件复用句柄，close() 归还而不是关闭
+DB_POOL = ConnectionPool()
+
+# 连接经过统计包装：获取次数、SQL 语句数/耗时和读取行数计入 /api/metrics（DGSS_METRICS=0 关闭）
+_acquire_connection = instrument_connect(DB_POOL.acquire)
+
+def get_db_connection(db_path, readonly=False):
+    """从连接池取得连接；只读操作传 readonly=True 以 mode=ro 打开"""
+    return _acquire_connection(db_path, readonly=readonly)
+
+# (文件, 表) -> 字段、类型与主键，按文件修改时间失效
+TABLE_META = TableMetaCache(connect=lambda path: get_db_connection(path, readonly=True))
 
 def categorize_file(filename):
     ext = os.path.splitext(filename)[1].lower()
@@ -35,12 +59,278 @@ def categorize_file(filename):
         return 'Notes'
     return 'Other'
 
+@app.before_request
+def start_request_metrics():
+    request.environ['dgss.start'] = time.perf_counter()
+    metrics.begin_request(request.endpoint or 'unknown')
+
+@app.after_request
+def finish_request_metrics(response):
+    """
+    请求结束（流式响应在最后一块发送完或浏览器断开）时记录耗时、响应字节数，
+    并输出一行汇总本次请求 SQL 次数和行数的结构化日志。
+    """
+    endpoint = request.endpoint or 'unknown'
+    method = request.method
+    start = request.environ.get('dgss.start', time.perf_counter())
+    stats = metrics.current_request()
+    sent = [0]
+    
+    def finish():
+        duration = time.perf_counter() - start
+        metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=method, status=response.status_code)
+        metrics.HTTP_DURATION.observe(duration, endpoint=endpoint)
+        metrics.HTTP_BYTES.inc(sent[0], endpoint=endpoint)
+        if metrics.current_request() is stats:
+            metrics.end_request()
+        log_event(logging.INFO, 'request', endpoint=endpoint, method=method, status=response.status_code,
+                  ms=round(duration * 1000, 2), bytes=sent[0],
+                  sql=stats['sql'] if stats else 0,
+                  sql_ms=round(stats['sql_seconds'] * 1000, 2) if stats else 0,
+                  rows=stats['rows'] if stats else 0)
+    
+    if response.is_streamed:
+        response.response = count_streamed_bytes(response.response, sent)
+        response.call_on_close(finish)
+    else:
+        sent[0] = response.content_length or 0
+        finish()
+    return response
+
+def count_streamed_bytes(body, sent):
+    """逐块统计流式响应的字节数；关闭时同时关闭原生成器（SSE 断开需要据此释放排队名额）"""
+    try:
+        for chunk in body:
+            sent[0] += len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 文本格式的运行指标"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# 按需的请求级性能分析（DGSS_PROFILE 或请求头 X-DGSS-Profile），结果见 /api/profiles
+PROFILER = RequestProfiler()
+
+@app.before_request
+def start_request_profile():
+    session = PROFILER.start(request.endpoint, request.headers.get('X-DGSS-Profile'))
+    if session:
+        request.environ['dgss.profile'] = session
+
+@app.after_request
+def finish_request_profile(response):
+    """流式响应要等正文发送完再停止分析，否则只量到生成器的创建"""
+    session = request.environ.get('dgss.profile')
+    if session:
+        response.headers['X-DGSS-Profile-Id'] = session.name
+        if response.is_streamed:
+            session.deferred = True
+            response.call_on_close(session.stop)
+        else:
+            session.stop()
+    return response
+
+@app.teardown_request
+def abort_request_profile(exc):
+    # 视图异常未走到 after_request 时也要停止分析，释放分析锁
+    session = request.environ.get('dgss.profile')
+    if session and not session.deferred:
+        session.stop()
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """已保存的请求分析结果（.prof 可用 snakeviz / pstats 打开）"""
+    return jsonify({'directory': PROFILER.directory, 'profiles': PROFILER.list_profiles()})
+
+@app.route('/api/profiles/<path:filename>', methods=['GET'])
+def get_profile_file(filename):
+    return send_from_directory(PROFILER.directory, filename, as_attachment=filename.endswith('.prof'))
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 # Global Cache for Database Files (for Search)
 GLOBAL_DB_FILES = []
+# 最近一次扫描的目录条目与根目录，提问时按相关表重新生成结构说明
+GLOBAL_SCHEMA_ENTRIES = []
+GLOBAL_SCAN_ROOT = None
+# 持久化的文件结构目录，重新扫描时跳过未变化的文件
+SCHEMA_CATALOG = SchemaCatalog()
+# 当前扫描进度，供 /api/scan/progress 轮询
+SCAN_PROGRESS = ScanProgress()
+# 预编译的地质分类规则
+GEOLOGICAL_CLASSIFIER = GeologicalClassifier()
+# 跨文件全文检索索引（映射字段的文本值），扫描后在后台增量更新
+SEARCH_INDEX = SearchIndex(classifier=GEOLOGICAL_CLASSIFIER,
+                           connect=lambda path: get_db_connection(path, readonly=True))
+# 跨表野外点索引：(ROUTECODE, GEOPOINT) -> (文件, 表, rowid)，用于组装 AI 上下文
+POINT_INDEX = PointIndex(connect=lambda path: get_db_connection(path, readonly=True))
+# 按用户指令检索相关的表/字段/上下文放进提示词（DGSS_PROMPT_RETRIEVAL=0 时使用全量提示词）
+PROMPT_RETRIEVER = PromptRetriever()
+PROMPT_RETRIEVAL = os.environ.get('DGSS_PROMPT_RETRIEVAL', '1') != '0'
+# 对话 ID -> Ollama 返回的 context，追问时只发送新增内容
+CONVERSATIONS = ollama_service.ConversationStore()
+# 模型 + 问题 + 上下文数据 + 结构 -> 已生成的回答
+RESPONSE_CACHE = ResponseCache()
+# 限制同时进行的生成数，其余请求排队
+INFERENCE_SCHEDULER = InferenceScheduler()
+# 排队和等待模型输出期间的心跳间隔（秒）
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('DGSS_SSE_HEARTBEAT', '1'))
+
+# /api/metrics 导出时读取的即时值
+metrics.REGISTRY.gauge_callback('dgss_sqlite_pool_open_handles', 'SQLite handles open in the pool',
+                                lambda: DB_POOL.stats()['open'])
+metrics.REGISTRY.gauge_callback('dgss_inference_active', 'AI generations running',
+                                lambda: INFERENCE_SCHEDULER.stats()['active'])
+metrics.REGISTRY.gauge_callback('dgss_inference_queued', 'AI generations waiting for a slot',
+                                lambda: INFERENCE_SCHEDULER.stats()['queued'])
+metrics.REGISTRY.gauge_callback('dgss_ollama_available', 'Whether Ollama answered the last health check',
+                                lambda: int(OLLAMA_AVAILABLE))
+# 扫描后监视根目录，新增/删除/修改的文件增量合并进结构目录和文件列表（DGSS_WATCH=0 关闭）
+FOLDER_WATCHER = None
+# 已应用的文件夹变化，前端按序号增量拉取（/api/watch/changes）
+FOLDER_CHANGES = ChangeLog()
+# 扫描与监视回调都会替换上面的全局结构，串行执行
+CATALOG_LOCK = threading.Lock()
+# AI SEARCH 每次返回的最大行数
+SEARCH_PAGE_SIZE = int(os.environ.get('DGSS_SEARCH_PAGE_SIZE', '50'))
+
+def walk_data_files(folder_path):
+    """遍历文件夹，返回所有支持的数据文件 (root, filename) 列表"""
+    found = []
+    for root, dirs, files_in_dir in os.walk(folder_path):
+        for f in files_in_dir:
+            if f.endswith(DATA_EXTENSIONS):
+                found.append((root, f))
+        SCAN_PROGRESS.found(len(found))
+    return found
+
+def load_schema_catalog(folder_path, data_paths):
+    """
+    [AI] Global Scan for Database Structure
+    所有支持的文件 (.ta, .la, .pa, .db) 都是 SQLite，并行读取结构并更新
+    GLOBAL_SCHEMA_CACHE / GLOBAL_DB_FILES，返回目录条目列表（顺序与 data_paths 一致）。
+    """
+    global GLOBAL_SCHEMA_CACHE, GLOBAL_DB_FILES, GLOBAL_SCHEMA_ENTRIES, GLOBAL_SCAN_ROOT
+    with CATALOG_LOCK:
+        # 结构信息来自持久化目录，只有大小或修改时间变化的文件才会被重新打开
+        entries = SCHEMA_CATALOG.refresh(data_paths, progress=SCAN_PROGRESS)
+        SCHEMA_CATALOG.prune(folder_path, data_paths)
+        # 相同结构的文件合并为一条，长度受 token 预算限制
+        GLOBAL_SCHEMA_CACHE = build_schema_summary(entries, root=folder_path)
+        GLOBAL_DB_FILES = [entry['path'] for entry in entries]
+        GLOBAL_SCHEMA_ENTRIES = entries
+        GLOBAL_SCAN_ROOT = folder_path
+        watch_folder(folder_path, entries)
+    log_event(logging.INFO, 'schema_catalog_loaded', root=folder_path, files=len(entries))
+    SEARCH_INDEX.update_async(entries, root=folder_path)
+    POINT_INDEX.update_async(entries, root=folder_path)
+    return entries
+
+def watch_folder(folder_path, entries):
+    """开始监视扫描的根目录；重新扫描同一目录时只更新比较起点"""
+    global FOLDER_WATCHER
+    if WATCH_MODE == '0':
+        return
+    known = {entry['path']: (entry['size'], entry['mtime_ns']) for entry in entries}
+    if FOLDER_WATCHER and FOLDER_WATCHER.root == folder_path:
+        FOLDER_WATCHER.resync(known)
+        return
+    if FOLDER_WATCHER:
+        FOLDER_WATCHER.stop()
+    FOLDER_CHANGES.reset(folder_path)
+    FOLDER_WATCHER = FolderWatcher(folder_path, apply_folder_changes, known=known).start()
+    log_event(logging.INFO, 'watch_started', root=folder_path, backend=FOLDER_WATCHER.backend)
+
+def apply_folder_changes(changes):
+    """
+    监视回调：只重新读取新增/修改的文件结构，删除的文件从目录中移除，
+    据此更新文件列表、结构说明和索引，并记录到 FOLDER_CHANGES 供前端增量刷新。
+    """
+    global GLOBAL_SCHEMA_CACHE, GLOBAL_DB_FILES, GLOBAL_SCHEMA_ENTRIES
+    root = changes['root']
+    with CATALOG_LOCK:
+        if root != GLOBAL_SCAN_ROOT:
+            return
+        changed = changes['added'] + changes['modified']
+        for path in changes['removed'] + changes['modified']:
+            DB_POOL.invalidate(path)
+        refreshed = {entry['path']: entry for entry in SCHEMA_CATALOG.refresh(changed)}
+        # 事件之后又被删除的文件同样按删除处理
+        removed = set(changes['removed']) | (set(changed) - set(refreshed))
+        SCHEMA_CATALOG.remove_many(sorted(removed))
+        
+        entries = []
+        for entry in GLOBAL_SCHEMA_ENTRIES:
+            if entry['path'] in removed:
+                continue
+            entries.append(refreshed.pop(entry['path'], entry))
+        entries.extend(refreshed[path] for path in changed if path in refreshed)
+        
+        GLOBAL_SCHEMA_CACHE = build_schema_summary(entries, root=root)
+        GLOBAL_DB_FILES = [entry['path'] for entry in entries]
+        GLOBAL_SCHEMA_ENTRIES = entries
+        added = [path for path in changes['added'] if path not in removed]
+        modified = [path for path in changes['modified'] if path not in removed]
+        seq = FOLDER_CHANGES.append(added, sorted(removed), modified)
+    log_event(logging.INFO, 'folder_changed', root=root, seq=seq,
+              added=len(added), removed=len(removed), modified=len(modified))
+    SEARCH_INDEX.update_async(entries, root=root)
+    POINT_INDEX.update_async(entries, root=root)
+
+def file_list_item(folder_path, full_path):
+    """原始文件列表中的一项"""
+    return {
+        'name': os.path.relpath(full_path, folder_path),
+        'category': categorize_file(full_path),
+        'path': full_path
+    }
+
+def geological_file_info(folder_path, full_path, tables):
+    """地质分类所需的文件信息"""
+    return {
+        'name': os.path.basename(full_path),
+        'relative_path': os.path.relpath(full_path, folder_path),
+        'full_path': full_path,
+        'parent_folder': os.path.basename(os.path.dirname(full_path)),
+        'tables': tables
+    }
+
+@app.route('/api/watch/changes', methods=['GET'])
+def folder_changes():
+    """
+    since 之后的文件夹变化：removed 为删除的路径，files / geological 为新增或修改的文件
+    在原始文件列表和地质分类中的新条目（前端先移除同路径的旧条目再加入）。
+    since 过旧或根目录已切换时返回 reset=true，需要重新扫描。
+    """
+    since = request.args.get('since', type=int)
+    body = {
+        'root': FOLDER_CHANGES.root,
+        'seq': FOLDER_CHANGES.seq,
+        'backend': FOLDER_WATCHER.backend if FOLDER_WATCHER else None
+    }
+    delta = FOLDER_CHANGES.since(since) if since is not None else None
+    if delta is None:
+        body['reset'] = since is not None
+        return jsonify(body)
+    
+    body['seq'], body['removed'], upserted = delta
+    root = FOLDER_CHANGES.root
+    tables_by_path = {entry['path']: entry['tables'] for entry in GLOBAL_SCHEMA_ENTRIES}
+    upserted = [path for path in upserted if path in tables_by_path]
+    body['files'] = [file_list_item(root, path) for path in upserted]
+    body['geological'] = GEOLOGICAL_CLASSIFIER.classify(
+        [geological_file_info(root, path, tables_by_path[path]) for path in upserted])
+    return jsonify(body)
+
+@app.route('/api/scan/progress', methods=['GET'])
+def scan_progress():
+    return jsonify(SCAN_PROGRESS.snapshot())
 
 @app.route('/api/scan', methods=['POST'])
 def scan_folder():
@@ -55,47 +345,30 @@ def scan_folder():
         return jsonify({'error': 'Path does not exist'}), 400
     
     files = []
-    # Reset schema cache on new scan
-    global GLOBAL_SCHEMA_CACHE
-    GLOBAL_SCHEMA_CACHE = ""
-    global GLOBAL_DB_FILES
-    GLOBAL_DB_FILES = []
+    SCAN_PROGRESS.start(folder_path)
+    # 扫描开始前的变化序号：之后的变化由 /api/watch/changes 增量补上（重复应用无副作用）
+    watch_seq = FOLDER_CHANGES.seq
     
     try:
-        for root, dirs, files_in_dir in os.walk(folder_path):
-            for f in files_in_dir:
-                if f.endswith(('.ta', '.la', '.pa', '.db')):
-                    # Create a relative path for display if it's in a subdir
-                    rel_path = os.path.relpath(os.path.join(root, f), folder_path)
-                    display_name = rel_path if root != folder_path else f
-                    full_path = os.path.join(root, f)
-                    
-                    category = categorize_file(f)
-                    
-                    # [AI] Global Scan for Database Structure
-                    # Scan all supported files (.ta, .la, .pa, .db) as they are all SQLite
-                    print(f"[AI] Scanning schema for: {f}")
-                    schema_part = analyze_database_structure(full_path)
-                    if schema_part:
-                       GLOBAL_SCHEMA_CACHE += schema_part + "\n\n"
-                       GLOBAL_DB_FILES.append(full_path)
-                    
-                    files.append({
-                        'name': display_name,
-                        'category': category,
-                        'path': full_path
-                    })
+        for root, f in walk_data_files(folder_path):
+            files.append(file_list_item(folder_path, os.path.join(root, f)))
+        
+        load_schema_catalog(folder_path, [f['path'] for f in files])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    finally:
+        SCAN_PROGRESS.finish()
     
-    return jsonify({'files': files})
+    response = jsonify({'files': files})
+    response.headers['X-DGSS-Watch-Seq'] = str(watch_seq)
+    return response
 
 
 
 def file_has_table(file_path, table_name):
     """检查文件中是否包含指定表"""
     try:
-        conn = get_db_connection(file_path)
+        conn = get_db_connection(file_path, readonly=True)
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", 
                       (table_name,))
@@ -105,44 +378,6 @@ def file_has_table(file_path, table_name):
     except:
         return False
 
-def table_has_fields(file_path, table_name, required_fields):
-    """检查表中是否包含所需字段"""
-    try:
-        conn = get_db_connection(file_path)
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [row[1] for row in cursor.fetchall()]
-        conn.close()
-        return all(field in columns for field in required_fields)
-    except:
-        return False
-
-def get_table_primary_key(conn, table_name):
-    """获取表的主键列名"""
-    try:
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns_info = cursor.fetchall()
-        
-        # 1. Check for defined primary key
-        for col_info in columns_info:
-            if col_info[5] == 1:
-                return col_info[1]
-                
-        # 2. Check for common ID names
-        for col_info in columns_info:
-            col_name = col_info[1]
-            # 扩展支持常见地质字段作为主键
-            # DGSS specific: ROUTECODE, GEOPOINT, GUID, etc.
-            if col_name.upper() in ('ROUTECODE', 'GEOPOINT', 'GUID', 'GEOLABEL', 'ID', '_ID', 'GEOID', 'CODE'):
-                return col_name
-                
-        return None
-    except:
-        return None
-
-
-
 @app.route('/api/scan-geological', methods=['POST'])
 def scan_geological():
     """按地质分类扫描数据"""
@@ -154,77 +389,228 @@ def scan_geological():
     if not os.path.exists(folder_path):
         return jsonify({'error': 'Path does not exist'}), 400
     
-    result = {}
+    SCAN_PROGRESS.start(folder_path)
+    watch_seq = FOLDER_CHANGES.seq
     
     try:
         # 遍历所有支持的文件
-        all_files = []
-        for root, dirs, files in os.walk(folder_path):
-            for f in files:
-                if f.endswith(('.ta', '.la', '.pa', '.db')):
-                    file_path = os.path.join(root, f)
-                    rel_path = os.path.relpath(file_path, folder_path)
-                    all_files.append({
-                        'name': f,
-                        'relative_path': rel_path,
-                        'full_path': file_path,
-                        'parent_folder': os.path.basename(root)
-                    })
-        
-        # 按地质分类匹配文件
+        file_paths = [os.path.join(root, f) for root, f in walk_data_files(folder_path)]
+        
+        # 并行读取文件结构，同时供 AI 搜索使用
+        entries = load_schema_catalog(folder_path, file_paths)
+        tables_by_path = {entry['path']: entry['tables'] for entry in entries}
+        all_files = [geological_file_info(folder_path, path, tables_by_path.get(path, {})) for path in file_paths]
+        
+        # 按地质分类匹配文件：每个文件只看一次表结构，不再逐规则打开文件
+        result = GEOLOGICAL_CLASSIFIER.classify(all_files)
+        
+        response = jsonify(result)
+        response.headers['X-DGSS-Watch-Seq'] = str(watch_seq)
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        SCAN_PROGRESS.finish()
+
+# /api/data 分页参数：默认每页行数与单页上限（可通过环境变量调整）
+DATA_PAGE_SIZE = int(os.environ.get('DGSS_PAGE_SIZE', '500'))
+DATA_MAX_PAGE_SIZE = int(os.environ.get('DGSS_MAX_PAGE_SIZE', '5000'))
+
+def choose_target_table(tables, requested_table):
+    """选择要显示的表：优先请求的表，否则第一个非系统表"""
+    if requested_table and requested_table in tables:
+        return requested_table
+    # Prioritize non-system tables if no specific table requested
+    target_table = tables[0]
+    for t in tables:
+        if t not in ['android_metadata', 'sqlite_sequence']:
+            target_table = t
+            break
+    return target_table
+
+def find_column_mapping(file_path, target_table):
+    """根据文件名和表名在 GEOLOGICAL_CATEGORIES 中查找字段映射"""
+    column_mapping = {}
+    try:
+        # 获取文件名（不含路径）
+        filename = os.path.basename(file_path)
+        
+        # 遍历所有配置规则寻找匹配
         for category, config in GEOLOGICAL_CATEGORIES.items():
-            result[category] = {
-                'icon': config['icon'],
-                'en_name': config['en_name'],
-                'items': []
-            }
-            
             for rule in config['rules']:
                 pattern = rule['file_pattern']
-                table_name = rule['table']
+                rule_table = rule.get('table')
                 
-                for file_info in all_files:
-                    # 检查文件是否匹配pattern
-                    if fnmatch.fnmatch(file_info['relative_path'], pattern) or \
-                       fnmatch.fnmatch(file_info['name'], pattern):
-                        
-                        # 检查该文件中是否有指定的表
-                        if file_has_table(file_info['full_path'], table_name):
-                            # 可选：检查字段
-                            if 'check_fields' in rule:
-                                if not table_has_fields(file_info['full_path'], 
-                                                       table_name, 
-                                                       rule['check_fields']):
-                                    continue
-                            
-                            # 避免重复添加
-                            item_key = f"{file_info['full_path']}:{table_name}"
-                            existing_keys = [f"{item['filePath']}:{item['tableName']}" 
-                                           for item in result[category]['items']]
-                            
-                            if item_key not in existing_keys:
-                                result[category]['items'].append({
-                                    'fileName': file_info['relative_path'],
-                                    'tableName': table_name,
-                                    'filePath': file_info['full_path'],
-                                    'description': rule.get('description', ''),
-                                    'rowFilter': rule.get('row_filter')
-                                })
+                # 检查文件名匹配 (处理带通配符的情况)
+                # 注意：这里简单的fnmatch可能不够，因为某些pattern可能是 "素描图/*.la"
+                # 我们先只匹配文件名部分，如果有目录前缀的pattern暂时忽略目录匹配或者简单处理
+                
+                is_match = False
+                
+                # 如果pattern包含路径分隔符，尝试匹配相对路径（这里简单化处理，只匹配文件名部分）
+                # 实际上geological_mapping.py里的pattern大多是文件名，除了 "素描图/*.la"
+                simple_pattern = os.path.basename(pattern)
+                
+                if fnmatch.fnmatch(filename, simple_pattern):
+                    # 检查表名是否匹配 (如果规则指定了特定表)
+                    if rule_table and rule_table == target_table:
+                        is_match = True
+                    # 如果规则没指定表，或者我们只是想找通用的映射(通常规则都会指定表)
+                    
+                if is_match:
+                    if 'fields' in rule:
+                        column_mapping = rule['fields']
+                    break
+            if column_mapping:
+                break
+    except Exception as e:
+        log_event(logging.WARNING, 'mapping_failed', file=file_path, table=target_table, error=str(e))
+    return column_mapping
+
+def parse_page_args(body):
+    """解析分页参数，返回 (limit, offset)"""
+    try:
+        limit = int(body.get('limit') or DATA_PAGE_SIZE)
+    except (TypeError, ValueError):
+        limit = DATA_PAGE_SIZE
+    try:
+        offset = int(body.get('offset') or 0)
+    except (TypeError, ValueError):
+        offset = 0
+    return max(1, min(limit, DATA_MAX_PAGE_SIZE)), max(0, offset)
+
+def build_keyset_query(table_name, pk_col, page_cursor):
+    """
+    构造按 (主键, rowid) 排序的键集查询，避免大 OFFSET 的全表跳读。
+    DGSS 表的"主键"可能是 ROUTECODE 之类的非唯一字段，所以用 rowid 打破平局。
+    查询结果末尾附加一列 rowid。
+    """
+    sql = f"SELECT *, rowid FROM {table_name}"
+    params = []
+    if page_cursor:
+        last_key, last_rowid = page_cursor
+        if last_key is None:
+            # NULL 排在最前，行值比较遇到 NULL 会整体失效，单独处理
+            sql += f" WHERE ({pk_col} IS NULL AND rowid > ?) OR {pk_col} IS NOT NULL"
+            params = [last_rowid]
+        else:
+            sql += f" WHERE {pk_col} > ? OR ({pk_col} = ? AND rowid > ?)"
+            params = [last_key, last_key, last_rowid]
+    sql += f" ORDER BY {pk_col}, rowid"
+    return sql, params
+
+def execute_table_page(cursor, table_name, pk_col, body, limit=None):
+    """
+    按请求参数执行整表（无视图）的分页查询，get_data 与 stream_table_rows 共用：
+    传 cursor 且有主键时按 (主键, rowid) 键集分页，结果末尾附加一列 rowid；
+    否则，或键集查询失败（WITHOUT ROWID 表没有 rowid）时按 offset 分页。
+    limit 为 None 时读到表尾。返回 'keyset' 或 'offset'。
+    """
+    limit = -1 if limit is None else limit
+    if 'cursor' in body and pk_col:
+        sql, params = build_keyset_query(table_name, pk_col, body.get('cursor'))
+        try:
+            cursor.execute(sql + " LIMIT ?", params + [limit])
+            return 'keyset'
+        except sqlite3.OperationalError as e:
+            log_event(logging.INFO, 'keyset_unavailable', table=table_name, error=str(e))
+    cursor.execute(f"SELECT * FROM {table_name} LIMIT ? OFFSET ?", (limit, parse_page_args(body)[1]))
+    return 'offset'
+
+def split_keyset_rows(cursor, raw_rows, pk_col, limit):
+    """去掉键集查询附加的 rowid 列，返回 (rows, next_cursor)；不足一页时 next_cursor 为 None"""
+    pk_index = [d[0] for d in cursor.description].index(pk_col)
+    next_cursor = None
+    if len(raw_rows) == limit:
+        last = raw_rows[-1]
+        next_cursor = [last[pk_index], last[-1]]
+    return [tuple(row)[:-1] for row in raw_rows], next_cursor
+
+# 经常排序的列在只读连接上建立临时排序索引（DGSS_AUTO_INDEX=0 关闭）
+SORT_INDEXER = SortIndexer()
+
+def fetch_view_rows(cursor, conn, file_path, table_name, view, table_total, limit=None, offset=0):
+    """按排序/筛选/搜索视图读取行；limit 为 None 时读到末尾。返回 (rows, 是否使用了排序索引)"""
+    sort_table = SORT_INDEXER.sort_table(conn, file_path, table_name, view, table_total)
+    try:
+        sql, params = view_query(table_name, view, sort_table)
+        cursor.execute(sql + " LIMIT ? OFFSET ?", params + [-1 if limit is None else limit, offset])
+    except sqlite3.OperationalError as e:
+        # WITHOUT ROWID 表没有 rowid，不用它打破平局
+        log_event(logging.INFO, 'view_rowid_unavailable', table=table_name, error=str(e))
+        sort_table = None
+        sql, params = view_query(table_name, view, rowid=False)
+        cursor.execute(sql + " LIMIT ? OFFSET ?", params + [-1 if limit is None else limit, offset])
+    return cursor, sort_table is not None
+
+# 流式导出时每次从游标读取的行数
+STREAM_FETCH_SIZE = 500
+
+def stream_table_rows(file_path, meta, body, view=None):
+    """
+    以 NDJSON 流式输出表数据，内存占用与表大小无关。
+    第一行为 {"meta": {...}}，之后每行是按 meta.allColumns 顺序排列的值数组，
+    最后一行为 {"done": true, "count": N}。
+    支持与分页相同的 cursor / offset 起点，从该位置一直读到表尾（与 get_data 共用 execute_table_page，
+    无法键集分页时同样回退到 offset，meta.paging 为实际使用的方式）；
+    有排序/筛选/搜索视图（view）时按视图顺序从 offset 开始读取。
+    """
+    table_name = meta['tableName']
+    pk_col = meta['primaryKey']
+    conn = get_db_connection(file_path, readonly=True)
+    try:
+        cursor = conn.cursor()
+        keyset = False
+        if view is not None:
+            cursor, _ = fetch_view_rows(cursor, conn, file_path, table_name, view,
+                                        meta.get('tableTotal', meta['total']), offset=parse_page_args(body)[1])
+        else:
+            keyset = execute_table_page(cursor, table_name, pk_col, body) == 'keyset'
+        meta = dict(meta, paging='keyset' if keyset else 'offset')
         
-        return jsonify(result)
+        yield json.dumps({'meta': meta}, ensure_ascii=False, default=str) + "\n"
+        
+        count = 0
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            count += len(rows)
+            lines = []
+            for row in rows:
+                values = list(row)[:-1] if keyset else list(row)
+                lines.append(json.dumps(values, ensure_ascii=False, default=str))
+            yield "\n".join(lines) + "\n"
+        
+        yield json.dumps({'done': True, 'count': count}) + "\n"
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        yield json.dumps({'error': str(e)}, ensure_ascii=False) + "\n"
+    finally:
+        conn.close()
 
 @app.route('/api/data', methods=['POST'])
 def get_data():
-    file_path = request.json.get('path')
-    requested_table = request.json.get('tableName')
+    """
+    读取表数据。默认分页返回：
+    - 传 cursor（首页传 null）使用主键键集分页，响应里带 nextCursor
+    - 否则按 offset/limit 分页，响应里带 nextOffset
+    - 传 all=true 时按旧行为一次性返回全部行
+    - 传 format="ndjson" 时流式返回（见 stream_table_rows）
+    - 传 sort / filters / search 时在服务端排序、筛选（见 table_query.compile_view），
+      按 offset/limit 返回该视图的一页，total 为筛选后的行数，tableTotal 为整表行数
+    """
+    body = request.json
+    file_path = body.get('path')
+    requested_table = body.get('tableName')
+    fetch_all = bool(body.get('all'))
+    limit, offset = parse_page_args(body)
     
     if not file_path or not os.path.exists(file_path):
         return jsonify({'error': 'File not found'}), 404
     
+    conn = None
     try:
-        conn = get_db_connection(file_path)
+        conn = get_db_connection(file_path, readonly=True)
         cursor = conn.cursor()
         
         # Get all tables
@@ -232,106 +618,80 @@ def get_data():
         tables = [row['name'] for row in cursor.fetchall()]
         
         data = {}
-        target_table = None
 
         if tables:
-            if requested_table and requested_table in tables:
-                target_table = requested_table
-            else:
-                # Prioritize non-system tables if no specific table requested
-                target_table = tables[0]
-                for t in tables:
-                    if t not in ['android_metadata', 'sqlite_sequence']:
-                        target_table = t
-                        break
+            target_table = choose_target_table(tables, requested_table)
             
-            # 直接查询表中的所有列，不添加额外的_id列
-            cursor.execute(f"SELECT * FROM {target_table}")
-            rows = cursor.fetchall()
-            
-            if rows:
-                columns = [description[0] for description in cursor.description]
-                data['columns'] = columns
-                # 手动创建字典，确保列名与值正确对应，避免sqlite3.Row转换问题
-                data['rows'] = []
-                for row in rows:
-                    row_dict = {}
-                    for i, col_name in enumerate(columns):
-                        row_dict[col_name] = row[i]
-                    data['rows'].append(row_dict)
-            else:
-                # Handle empty table case
-                cursor.execute(f"PRAGMA table_info({target_table})")
-                # 获取实际表结构，不添加额外的_id列
-                columns = [info[1] for info in cursor.fetchall()]
-                data['columns'] = columns
-                data['rows'] = []
-                
+            # 字段名（实际大小写）与主键来自元数据缓存，不必每次重新推断
+            table_meta = TABLE_META.get(file_path, target_table)
+            columns = list(table_meta['columns'])
+            data['columns'] = columns
             data['tableName'] = target_table
             data['allTables'] = tables
             
             # 查找字段映射
-            column_mapping = {}
-            try:
-                # 获取文件名（不含路径）
-                filename = os.path.basename(file_path)
-                
-                # 遍历所有配置规则寻找匹配
-                for category, config in GEOLOGICAL_CATEGORIES.items():
-                    for rule in config['rules']:
-                        pattern = rule['file_pattern']
-                        rule_table = rule.get('table')
-                        
-                        # 检查文件名匹配 (处理带通配符的情况)
-                        # 注意：这里简单的fnmatch可能不够，因为某些pattern可能是 "素描图/*.la"
-                        # 我们先只匹配文件名部分，如果有目录前缀的pattern暂时忽略目录匹配或者简单处理
-                        
-                        is_match = False
-                        
-                        # 如果pattern包含路径分隔符，尝试匹配相对路径（这里简单化处理，只匹配文件名部分）
-                        # 实际上geological_mapping.py里的pattern大多是文件名，除了 "素描图/*.la"
-                        simple_pattern = os.path.basename(pattern)
-                        
-                        if fnmatch.fnmatch(filename, simple_pattern):
-                            # 检查表名是否匹配 (如果规则指定了特定表)
-                            if rule_table and rule_table == target_table:
-                                is_match = True
-                            # 如果规则没指定表，或者我们只是想找通用的映射(通常规则都会指定表)
-                            
-                        if is_match:
-                            if 'fields' in rule:
-                                column_mapping = rule['fields']
-                            break
-                    if column_mapping:
-                        break
-            except Exception as e:
-                print(f"Error finding mapping: {e}")
-                
+            column_mapping = find_column_mapping(file_path, target_table)
             data['columnMapping'] = column_mapping
             
-            # Detect Primary Key
-            # Detect Primary Key
-            raw_primary_key = get_table_primary_key(conn, target_table)
+            final_primary_key = table_meta['primary_key']
+            data['primaryKey'] = final_primary_key
             
-            # Ensure the Primary Key matches the casing in cursor.description (data['columns'])
-            # PRAGMA table_info might return different casing than cursor.description
-            final_primary_key = None
-            if raw_primary_key and data['rows']:
-                # First check exact match in actual row data
-                if raw_primary_key in data['rows'][0]:
-                     final_primary_key = raw_primary_key
+            cursor.execute(f"SELECT COUNT(*) FROM {target_table}")
+            data['total'] = cursor.fetchone()[0]
+            
+            try:
+                view = compile_view(table_meta, body)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if view is not None:
+                data['view'] = view['echo']
+                data['tableTotal'] = data['total']
+                if view['where']:
+                    cursor.execute(*count_query(target_table, view))
+                    data['total'] = cursor.fetchone()[0]
+            
+            if body.get('format') == 'ndjson':
+                # 流式输出另开连接，这里的连接在 finally 中归还
+                meta = dict(data)
+                meta['allColumns'] = columns
+                # 与普通响应一致：有映射时只显示映射列
+                if column_mapping:
+                    filtered_columns = [col for col in column_mapping.keys() if col in columns]
+                    if filtered_columns:
+                        meta['columns'] = filtered_columns
+                return Response(stream_table_rows(file_path, meta, body, view),
+                                mimetype='application/x-ndjson')
+            
+            if view is not None:
+                # 视图按 offset 分页（排序列不一定唯一，键集游标只用于主键顺序）
+                view_limit, view_offset = (None, 0) if fetch_all else (limit, offset)
+                view_cursor, data['indexed'] = fetch_view_rows(
+                    cursor, conn, file_path, target_table, view, data['tableTotal'], view_limit, view_offset)
+                raw_rows = view_cursor.fetchall()
+                data['paging'] = 'all' if fetch_all else 'offset'
+                data['offset'] = view_offset
+                data['nextOffset'] = view_offset + len(raw_rows)
+                data['hasMore'] = view_offset + len(raw_rows) < data['total']
+            elif fetch_all:
+                cursor.execute(f"SELECT * FROM {target_table}")
+                raw_rows = cursor.fetchall()
+                data['paging'] = 'all'
+                data['hasMore'] = False
+            else:
+                data['paging'] = execute_table_page(cursor, target_table, final_primary_key, body, limit)
+                raw_rows = cursor.fetchall()
+                if data['paging'] == 'keyset':
+                    raw_rows, next_cursor = split_keyset_rows(cursor, raw_rows, final_primary_key, limit)
+                    data['nextCursor'] = next_cursor
+                    data['hasMore'] = next_cursor is not None
                 else:
-                     # Check case-insensitive match
-                     for col in data['rows'][0].keys():
-                         if col.lower() == raw_primary_key.lower():
-                             final_primary_key = col
-                             break
+                    data['offset'] = offset
+                    data['nextOffset'] = offset + len(raw_rows)
+                    data['hasMore'] = offset + len(raw_rows) < data['total']
+            data['limit'] = limit
             
-            # If not found in rows (empty table) or matched, use raw
-            if not final_primary_key:
-                final_primary_key = raw_primary_key
-
-            data['primaryKey'] = final_primary_key
+            # 手动创建字典，确保列名与值正确对应，避免sqlite3.Row转换问题
+            data['rows'] = [dict(zip(columns, row)) for row in raw_rows]
             
             # 如果存在有效的字段映射，过滤并重排序显示的列
             # 仅显示映射中定义的列，并保持映射定义的顺序
@@ -344,16 +704,18 @@ def get_data():
                 if filtered_columns:
                     data['columns'] = filtered_columns
             
-            # Debug logging
-            print(f"DEBUG Table: {target_table}, Found PK: {raw_primary_key}, Final PK: {final_primary_key}")
-            if data['rows']:
-                print(f"DEBUG First Row Keys: {list(data['rows'][0].keys())}")
+            log_event(logging.DEBUG, 'get_data', table=target_table, primary_key=final_primary_key,
+                      paging=data['paging'], rows=len(data['rows']), total=data['total'],
+                      row_keys=list(data['rows'][0].keys()) if data['rows'] else [])
             
-        conn.close()
         return jsonify(data)
     except Exception as e:
 
         return jsonify({'error': str(e)}), 500
+    finally:
+        # 任何异常路径上都归还连接，避免句柄借出后只能等垃圾回收
+        if conn is not None:
+            conn.close()
 
 @app.route('/api/update', methods=['POST'])
 def update_data():
@@ -367,64 +729,154 @@ def update_data():
         return jsonify({'error': 'Missing required fields'}), 400
         
     try:
-        conn = get_db_connection(file_path)
-        cursor = conn.cursor()
-        
-        # 自动检测表的主键列
-        primary_key_col = get_table_primary_key(conn, table_name)
+        meta = TABLE_META.get(file_path, table_name)
+        primary_key_col = meta['primary_key'] if meta else None
         
         # 如果仍然没有找到合适的主键列，返回错误
         if not primary_key_col:
-            print(f"Update failed: No primary key found for table {table_name}")
-            conn.close()
+            log_event(logging.WARNING, 'update_failed', table=table_name, reason='no primary key')
             return jsonify({'error': '无法确定表的主键列'}), 400
         
+        # ID 与值预先转换为字段的存储类型，只执行一条 UPDATE
+        try:
+            updates = coerce_updates(meta, updates)
+        except KeyError as e:
+            return jsonify({'error': f'Unknown column: {e.args[0]}'}), 400
+        row_id = coerce_id(meta, row_id)
+        
         # Construct SQL update
         set_clause = ", ".join([f"{col} = ?" for col in updates.keys()])
         values = list(updates.values())
         values.append(row_id)
         
-        print(f"Updating {table_name}: PK={primary_key_col}, ID={row_id}, Updates={updates}")
-        
         # 使用正确的主键列作为更新条件
         query = f"UPDATE {table_name} SET {set_clause} WHERE {primary_key_col} = ?"
         
-        cursor.execute(query, values)
+        conn = get_db_connection(file_path)
+        try:
+            with conn:
+                affected = conn.execute(query, values).rowcount
+        finally:
+            conn.close()
+        TABLE_META.touch(file_path)
         
-        # 如果更新行数为0，尝试转换ID类型重试
-        if cursor.rowcount == 0:
-            print(f"Initial update affected 0 rows. Retrying with type conversion for ID: {row_id} (type: {type(row_id)})")
-            
-            # 尝试转换类型
-            new_row_id = None
-            if isinstance(row_id, str):
-                if row_id.isdigit():
-                    new_row_id = int(row_id)
-            elif isinstance(row_id, int):
-                new_row_id = str(row_id)
-            
-            if new_row_id is not None:
-                print(f"Retrying with new ID: {new_row_id} (type: {type(new_row_id)})")
-                values[-1] = new_row_id
-                cursor.execute(query, values)
-                if cursor.rowcount > 0:
-                    print("Retry successful!")
-                else:
-                    print("Retry failed.")
+        if affected == 0:
+            log_event(logging.INFO, 'update_not_found', table=table_name, primary_key=primary_key_col, id=row_id)
+        
+        return jsonify({'success': True, 'primaryKeyUsed': primary_key_col, 'updated': affected})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def is_scalar(value):
+    """JSON 中的字符串或数字（不含布尔值）"""
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+def resolve_row_ids(cursor, meta, row_ids):
+    """
+    把 ID 转换为主键的存储类型，并用一次查询确认哪些行存在。
+    返回 {原始 ID: 库中的值}，找不到的 ID 不在结果中。
+    """
+    table_name, primary_key_col = meta['table'], meta['primary_key']
+    coerced = {row_id: coerce_id(meta, row_id) for row_id in row_ids}
+    lookup = list(dict.fromkeys(coerced.values()))
+    existing = set()
+    # SQLite 默认变量上限 999，分块查询
+    for i in range(0, len(lookup), 500):
+        chunk = lookup[i:i + 500]
+        placeholders = ", ".join("?" for _ in chunk)
+        cursor.execute(f"SELECT {primary_key_col} FROM {table_name} WHERE {primary_key_col} IN ({placeholders})", chunk)
+        existing.update(row[0] for row in cursor.fetchall())
+    return {row_id: value for row_id, value in coerced.items() if value in existing}
+
+@app.route('/api/update-batch', methods=['POST'])
+def update_data_batch():
+    """
+    批量修改单元格：edits 为 [{id, column, value}, ...]。
+    所有修改在一个事务中按字段分组用 executemany 执行，一次提交；
+    返回每条修改的结果（updated / not_found / invalid_column）。
+    """
+    data = request.json
+    file_path = data.get('path')
+    table_name = data.get('tableName')
+    edits = data.get('edits')
+    
+    if not all([file_path, table_name]) or not isinstance(edits, list) or not edits:
+        return jsonify({'error': 'Missing required fields'}), 400
+    if any(not isinstance(e, dict) or e.get('id') is None or not e.get('column') for e in edits):
+        return jsonify({'error': 'Each edit needs id and column'}), 400
+    # id 会作为字典键和 SQL 参数使用，列表/对象会导致 TypeError；值同样只能是标量
+    invalid = [index for index, e in enumerate(edits)
+               if not is_scalar(e['id']) or not isinstance(e['column'], str)
+               or not (e.get('value') is None or is_scalar(e.get('value')))]
+    if invalid:
+        return jsonify({'error': 'Edit id and value must be strings or numbers, column a string',
+                        'invalid': invalid}), 400
+        
+    conn = None
+    try:
+        meta = TABLE_META.get(file_path, table_name)
+        primary_key_col = meta['primary_key'] if meta else None
+        if not primary_key_col:
+            log_event(logging.WARNING, 'update_batch_failed', table=table_name, reason='no primary key')
+            return jsonify({'error': '无法确定表的主键列'}), 400
+        
+        conn = get_db_connection(file_path)
+        cursor = conn.cursor()
+        resolved = resolve_row_ids(cursor, meta, list(dict.fromkeys(e['id'] for e in edits)))
+        
+        results = []
+        # 字段 -> [(值, 库中的ID)]；同一单元格多次修改时以最后一次为准
+        by_column = {}
+        for index, edit in enumerate(edits):
+            column = column_name(meta, edit['column'])
+            outcome = {'index': index, 'id': edit['id'], 'column': edit['column']}
+            if column is None:
+                outcome['status'] = 'invalid_column'
+            elif edit['id'] not in resolved:
+                outcome['status'] = 'not_found'
             else:
-                print("No type conversion possible.")
-                
+                outcome['status'] = 'updated'
+                by_column.setdefault(column, {})[resolved[edit['id']]] = coerce_value(edit.get('value'), meta['affinity'][column])
+            results.append(outcome)
+        
+        log_event(logging.DEBUG, 'update_batch', table=table_name, primary_key=primary_key_col,
+                  edits=len(edits), columns=len(by_column))
+        
+        for column, values in by_column.items():
+            cursor.executemany(
+                f"UPDATE {table_name} SET {column} = ? WHERE {primary_key_col} = ?",
+                [(value, row_id) for row_id, value in values.items()]
+            )
         conn.commit()
-        conn.close()
+        TABLE_META.touch(file_path)
         
-        return jsonify({'success': True, 'primaryKeyUsed': primary_key_col})
+        updated = sum(1 for r in results if r['status'] == 'updated')
+        return jsonify({
+            'success': updated == len(results),
+            'primaryKeyUsed': primary_key_col,
+            'updated': updated,
+            'failed': len(results) - updated,
+            'results': results
+        })
     except Exception as e:
+        # 任何一步失败都回滚整批修改，写连接不能带着未提交的事务归还到池中
+        if conn is not None:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
         return jsonify({'error': str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 
 
 def open_folder_dialog():
     """打开文件夹选择对话框，支持高DPI屏幕"""
+    # 只在弹出对话框时导入，没有 Tk 的环境（服务器、基准测试）也能加载本模块
+    import tkinter as tk
+    from tkinter import filedialog
     try:
         # 在Windows上启用高DPI感知
         import platform
@@ -481,6 +933,8 @@ def select_folder():
 
 def open_file_dialog():
     """打开文件选择对话框，支持高DPI屏幕"""
+    import tkinter as tk
+    from tkinter import filedialog
     try:
         # 在Windows上启用高DPI感知
         import platform
@@ -548,7 +1002,7 @@ def get_file_info():
         return jsonify({'error': 'File not found'}), 404
     
     try:
-        conn = get_db_connection(file_path)
+        conn = get_db_connection(file_path, readonly=True)
         cursor = conn.cursor()
         
         # 获取所有表
@@ -590,33 +1044,38 @@ def analyze_structure_api():
 
 
 
+def on_ollama_status_change(available, models):
+    global OLLAMA_AVAILABLE
+    OLLAMA_AVAILABLE = available
+
+# 后台检查 Ollama 状态与模型列表，接口直接返回缓存结果
+OLLAMA_MONITOR = ollama_service.OllamaMonitor(on_change=on_ollama_status_change)
+
 @app.route('/api/ollama/status', methods=['GET'])
 def get_ollama_status():
-    global OLLAMA_AVAILABLE
-    OLLAMA_AVAILABLE = ollama_service.check_ollama_status()
-    return jsonify({'available': OLLAMA_AVAILABLE})
+    OLLAMA_MONITOR.start()
+    status = OLLAMA_MONITOR.snapshot()
+    return jsonify({'available': status['available'], 'checkedAt': status['checkedAt']})
 
 @app.route('/api/ollama/models', methods=['GET'])
 def get_models():
+    OLLAMA_MONITOR.start()
     if not OLLAMA_AVAILABLE:
         # Try checking again just in case it started
-        if ollama_service.check_ollama_status():
-            return jsonify({'models': ollama_service.get_available_models()})
+        OLLAMA_MONITOR.poke()
         return jsonify({'error': 'Ollama service is not running'}), 503
     
-    models = ollama_service.get_available_models()
-    return jsonify({'models': models})
+    return jsonify({'models': OLLAMA_MONITOR.snapshot()['models']})
 
-def get_context_data(file_path, route_code=None, geo_point=None):
-    """
-    Fetch related geological data based on RouteCode and GeoPoint.
-    """
-    if not file_path or not os.path.exists(file_path):
-        return None
-    
+# 每张表取出的最多行数；实际放进提示词的行由 pack_context 按 token 预算挑选
+CONTEXT_ROWS_PER_ROUTE = int(os.environ.get('DGSS_CONTEXT_ROWS_PER_ROUTE', '20'))
+CONTEXT_ROWS_PER_POINT = int(os.environ.get('DGSS_CONTEXT_ROWS_PER_POINT', '5'))
+
+def scan_context_file(file_path, route_code, geo_point, limit):
+    """逐表扫描一个文件中与路线号/点号匹配的行（点索引尚未覆盖该文件时使用）"""
     context = {}
+    conn = get_db_connection(file_path, readonly=True)
     try:
-        conn = get_db_connection(file_path)
         cursor = conn.cursor()
         
         # Get all table names
@@ -624,45 +1083,108 @@ def get_context_data(file_path, route_code=None, geo_point=None):
         tables = [row['name'] for row in cursor.fetchall()]
         
         for table in tables:
-            if table in ['android_metadata', 'sqlite_sequence']:
+            if table in SKIP_TABLES:
                 continue
                 
             # Check if table has ROUTECODE or GEOPOINT fields
-            cursor.execute(f"PRAGMA table_info({table})")
-            columns = [info[1].upper() for info in cursor.fetchall()]
+            route_col, point_col = key_columns(TABLE_META.get(file_path, table)['columns'])
             
             query_parts = []
             params = []
             
-            if route_code and 'ROUTECODE' in columns:
-                query_parts.append("ROUTECODE = ?")
+            if route_code and route_col:
+                query_parts.append(f"{route_col} = ?")
                 params.append(route_code)
                 
-            if geo_point and 'GEOPOINT' in columns:
-                query_parts.append("GEOPOINT = ?")
+            if geo_point and point_col:
+                query_parts.append(f"{point_col} = ?")
                 params.append(geo_point)
             
             if query_parts:
                 where_clause = " AND ".join(query_parts)
-                # Limit to prevent token overflow, e.g. 5 records per table if only route, 1 if precise point
-                limit = 5 if not geo_point else 1
                 sql = f"SELECT * FROM {table} WHERE {where_clause} LIMIT {limit}"
                 
                 cursor.execute(sql, params)
                 rows = cursor.fetchall()
                 if rows:
-                    context[table] = [dict(row) for row in rows]
-        
+                    context[context_key(file_path, table)] = [dict(row) for row in rows]
+    finally:
         conn.close()
+    return context
+
+def fetch_point_rows(hits, limit):
+    """按点索引命中的 (文件, 表, rowid) 读取行，按 context_key（文件名:表名）分组，每组最多 limit 行"""
+    context = {}
+    grouped = {}
+    taken = {}
+    for source, table_name, rowid in hits:
+        key = context_key(source, table_name)
+        if taken.get(key, 0) >= limit:
+            continue
+        taken[key] = taken.get(key, 0) + 1
+        grouped.setdefault((source, table_name), []).append(rowid)
+    for (source, table_name), rowids in grouped.items():
+        conn = get_db_connection(source, readonly=True)
+        try:
+            placeholders = ", ".join("?" for _ in rowids)
+            rows = conn.execute(f"SELECT * FROM {table_name} WHERE rowid IN ({placeholders}) ORDER BY rowid",
+                                rowids).fetchall()
+            context.setdefault(context_key(source, table_name), []).extend(dict(row) for row in rows)
+        finally:
+            conn.close()
+    return context
+
+def route_folders(file_path, route_code, sources):
+    """
+    请求的路线所在的目录：当前文件所在目录，以及工程中以路线号命名的目录或文件所在目录。
+    没有路线号时以当前文件名（如 L0002.db）作为路线号。
+    只按点号匹配的行（如 .db 中的 GPOINT）只在这些目录中查找。
+    """
+    folders = {os.path.dirname(file_path)}
+    route = str(route_code or os.path.splitext(os.path.basename(file_path))[0]).strip().upper()
+    if route:
+        for source in sources:
+            folder = os.path.dirname(source)
+            stem = os.path.splitext(os.path.basename(source))[0]
+            if os.path.basename(folder).upper() == route or stem.upper() == route:
+                folders.add(folder)
+    return folders
+
+def get_context_data(file_path, route_code=None, geo_point=None):
+    """
+    Fetch related geological data based on RouteCode and GeoPoint.
+    已扫描工程时通过点索引在整个工程中查找（当前打开的文件优先），
+    否则（或当前文件修改后索引尚未更新）退回对当前文件逐表扫描。
+    结果按来源图层分组（"Sample.ta:GeoArea"），每个图层最多取行数上限。
+    """
+    if not file_path or not os.path.exists(file_path):
+        return None
+    if not route_code and not geo_point:
+        return {}
+    
+    # 行数上限只防止读取过多；是否放进提示词由 token 预算决定
+    limit = CONTEXT_ROWS_PER_POINT if geo_point else CONTEXT_ROWS_PER_ROUTE
+    context = {}
+    try:
+        sources = POINT_INDEX.fresh_files(set(GLOBAL_DB_FILES) | {file_path})
+        if file_path not in sources:
+            context = scan_context_file(file_path, route_code, geo_point, limit)
+        if sources:
+            hits = POINT_INDEX.lookup(route_code, geo_point, sources=sources,
+                                      point_scope=route_folders(file_path, route_code, sources))
+            # 当前文件的行排在前面，其次是工程中的其他文件
+            hits.sort(key=lambda hit: hit[0] != file_path)
+            for key, rows in fetch_point_rows(hits, limit).items():
+                merged = context.setdefault(key, [])
+                merged.extend(rows[:max(0, limit - len(merged))])
     except Exception as e:
-        print(f"Error fetching context: {e}")
+        log_event(logging.WARNING, 'context_failed', file=file_path, route=route_code, point=geo_point, error=str(e))
     
     return context
 
 @app.route('/api/ollama/query', methods=['POST'])
 def query_ollama():
-    if not OLLAMA_AVAILABLE:
-        return jsonify({'error': 'Ollama service is not running'}), 503
+    OLLAMA_MONITOR.start()
     
     data = request.json
     if not data:
@@ -683,26 +1205,196 @@ def query_ollama():
         context_data = get_context_data(file_path, route_code, geo_point)
     
     # 2. Build Full Prompt
-    full_prompt = ollama_service.build_geological_prompt(prompt, context_data, GLOBAL_SCHEMA_CACHE)
+    # 同一对话的追问复用上一轮的 KV 上下文；数据库结构变化（重新扫描）后重新开始
+    conversation_id = data.get('conversationId')
+    prefix_key = hash(GLOBAL_SCHEMA_CACHE)
+    conversation = CONVERSATIONS.get(conversation_id, model, prefix_key)
+    full_prompt, prompt_stats, sent = build_prompt(prompt, context_data, file_path, conversation, geo_point)
+    
+    # 相同模型、问题、上下文数据和结构的回答直接重放（Ollama 离线时也可用）
+    cache_key = None
+    cached = None
+    if RESPONSE_CACHE_ENABLED:
+        cache_key = response_cache_key(model, prompt, context_data, GLOBAL_SCHEMA_CACHE,
+                                       history=conversation['context'] if conversation else None)
+        cached = RESPONSE_CACHE.get(cache_key)
+    
+    if cached is None and not OLLAMA_AVAILABLE:
+        return jsonify({'error': 'Ollama service is not running'}), 503
+    
+    # 3. Stream Response（SSE：queue 排队位置 / token 生成内容 / actions 操作计划 / done 结束 / error 出错）
+    # 回答中的操作计划一闭合就校验并单独推送，确认卡片不必等模型写完后面的文字
+    scanner = ActionPlanScanner()
+    def plan_events(token=None):
+        # token 为 None 表示回答结束：找出被未闭合的 '{' 挡住的计划
+        plans = scanner.finish() if token is None else scanner.feed(token)
+        for plan in plans:
+            yield sse_event('actions', check_action_plan(plan, file_path))
+    
+    def replay():
+        for token in cached['tokens']:
+            yield sse_event('token', {'text': token})
+            yield from plan_events(token)
+        yield from plan_events()
+        CONVERSATIONS.save(conversation_id, model, prefix_key, cached['context'], sent['rules'], sent['tables'])
+        yield sse_event('done', {'cache': 'HIT'})
     
-    # 3. Stream Response
     def generate():
-        ollama_response = ollama_service.query_ollama(model, full_prompt, stream=True)
-        if isinstance(ollama_response, str):
-            yield ollama_response
-            return
-
+        # 浏览器断开时写入失败，生成器被关闭：排队中的请求出队，生成中的请求取消上游 Ollama 流
+        # 追问（复用上下文）的预填充很短，优先执行
+        ticket = INFERENCE_SCHEDULER.enqueue(priority=0 if conversation else 1)
+        stream = None
+        tokens = []
+        # 生成耗时：started 为获得名额、开始请求 Ollama 的时间
+        timing = {'started': None, 'first_token': None, 'result': 'cancelled'}
         try:
-            for line in ollama_response.iter_lines():
-                if line:
-                    json_response = json.loads(line)
-                    token = json_response.get('response', '')
-                    if token:
-                        yield token
+            if not ticket.granted:
+                # 排队期间定期报告位置，同时作为心跳检测浏览器是否已断开
+                yield sse_event('queue', {'position': ticket.position()})
+                while not ticket.wait(SSE_HEARTBEAT_SECONDS):
+                    yield sse_event('queue', {'position': ticket.position()})
+            
+            timing['started'] = time.perf_counter()
+            stream = ollama_service.stream_generate(
+                model, full_prompt, context=conversation['context'] if conversation else None,
+                idle_interval=SSE_HEARTBEAT_SECONDS)
+            for json_response in stream:
+                if json_response is None:
+                    # 模型仍在预填充，暂无输出
+                    yield ": ping\n\n"
+                    continue
+                token = json_response.get('response', '')
+                if token:
+                    if timing['first_token'] is None:
+                        timing['first_token'] = time.perf_counter()
+                    tokens.append(token)
+                    yield sse_event('token', {'text': token})
+                    yield from plan_events(token)
+                if json_response.get('done'):
+                    CONVERSATIONS.save(conversation_id, model, prefix_key, json_response.get('context'),
+                                       sent['rules'], sent['tables'])
+                    # 只缓存完整生成的回答
+                    if cache_key:
+                        RESPONSE_CACHE.put(cache_key, model, tokens, json_response.get('context'))
+            timing['result'] = 'ok'
+            yield from plan_events()
+            yield sse_event('done', {'cache': 'MISS' if cache_key else 'BYPASS'})
+        except ollama_service.OllamaStreamError as e:
+            timing['result'] = 'error'
+            # 可能是 Ollama 已经停止，让后台监视立即重新检查
+            OLLAMA_MONITOR.poke()
+            yield sse_event('error', {'error': str(e)})
         except Exception as e:
-            yield f"Error streaming: {str(e)}"
+            timing['result'] = 'error'
+            yield sse_event('error', {'error': f"Error streaming: {str(e)}"})
+        finally:
+            if stream is not None:
+                stream.close()
+            ticket.release()
+            if timing['started'] is not None:
+                metrics.record_generation(model, timing['started'], timing['first_token'],
+                                          time.perf_counter(), len(tokens), timing['result'])
+
+    if cached is not None:
+        log_event(logging.INFO, 'response_cache_hit', model=model, tokens=len(cached['tokens']))
+    response = Response(replay() if cached is not None else generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Cache'] = 'HIT' if cached is not None else ('MISS' if cache_key else 'BYPASS')
+    response.headers['X-Prompt-Tokens'] = str(prompt_stats['tokens'])
+    response.headers['X-Prompt-Tokens-Saved'] = str(prompt_stats['saved'])
+    response.headers['X-Context-Reused'] = '1' if conversation else '0'
+    return response
+
+def known_table_columns(file_path=None):
+    """{表名: [字段...]}：已扫描工程中所有文件（以及当前文件）的表，同名表的字段合并"""
+    entries = list(GLOBAL_SCHEMA_ENTRIES)
+    if file_path and file_path not in GLOBAL_DB_FILES and os.path.exists(file_path):
+        entries.extend(SCHEMA_CATALOG.refresh([file_path]))
+    tables = {}
+    for entry in entries:
+        for name, info in (entry['tables'] or {}).items():
+            columns = tables.setdefault(name, [])
+            columns.extend(col for col in info['columns'] if col not in columns)
+    return tables
+
+def check_action_plan(plan, file_path=None):
+    """按已知表和字段校验模型给出的操作计划，返回 {'thought', 'actions', 'issues'}"""
+    checked = validate_plan(plan, known_table_columns(file_path), resolve_table=guess_table_name)
+    if checked['issues']:
+        log_event(logging.INFO, 'action_plan_issues', valid=len(checked['actions']), issues=checked['issues'])
+    return checked
+
+def sse_event(event, data):
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/ollama/queue', methods=['GET'])
+def ollama_queue():
+    return jsonify(INFERENCE_SCHEDULER.stats())
 
-    return Response(generate(), mimetype='text/plain')
+@app.route('/api/ollama/cache', methods=['GET', 'DELETE'])
+def ollama_cache():
+    """回答缓存的命中统计；DELETE 清空缓存"""
+    if request.method == 'DELETE':
+        RESPONSE_CACHE.clear()
+    return jsonify(RESPONSE_CACHE.stats())
+
+def rule_key(item):
+    return (item['category'], item['rule']['file_pattern'], item['rule']['table'])
+
+def build_prompt(user_input, context_data, file_path=None, conversation=None, geo_point=None):
+    """
+    生成发送给模型的提示词，返回 (prompt, stats, sent)。
+    启用检索时前缀仍是固定的结构摘要和表索引（字节不变，可复用 KV 缓存），
+    只有与指令和当前数据相关的 top-k 表的字段说明和上下文追加在前缀之后，
+    并与全量提示词比较估算节省的 token 数。
+    conversation 为可复用的对话状态时，模型的 context 里已经有静态前缀和之前的问答，
+    只发送本轮数据、指令以及之前没有发送过的字段说明。
+    sent 为本轮之后模型已经见过的 {'rules', 'tables'}。
+    """
+    full_prompt = ollama_service.build_geological_prompt(user_input, context_data, GLOBAL_SCHEMA_CACHE)
+    full_tokens = estimate_tokens(full_prompt)
+    sent = {'rules': set(), 'tables': set()}
+    if conversation:
+        sent = {'rules': set(conversation['sent_rules']), 'tables': set(conversation['sent_tables'])}
+    
+    selection = None
+    if PROMPT_RETRIEVAL:
+        selection = PROMPT_RETRIEVER.retrieve(user_input, context_data,
+                                              file_name=os.path.basename(file_path) if file_path else None)
+        context_tables = selection['tables'] if selection['rules'] else None
+        context_data = trim_context(context_data, context_tables)
+    
+    # 当前数据按 token 预算打包：只保留映射字段，长文本截断，离选中点近的行优先
+    packed = pack_context(context_data, geo_point=geo_point)
+    if packed['dropped'] or packed['truncated']:
+        log_event(logging.INFO, 'context_packed', rows=packed['rows'], tokens=packed['tokens'],
+                  dropped=packed['dropped'], truncated=packed['truncated'])
+    context_data = packed['text']
+    
+    if selection:
+        # 前缀只含完整的结构摘要和所有表的一行索引，不随问题变化，
+        # 检索到的表的字段说明作为本轮内容追加在前缀之后，已发送过的不再重复
+        new_rules = [item for item in selection['rules'] if rule_key(item) not in sent['rules']]
+        extra_mapping = None
+        if new_rules:
+            extra_mapping = ollama_service.get_mapping_definition({'rules': new_rules, 'others': []})
+        sent['rules'].update(rule_key(item) for item in new_rules)
+        sent['tables'].update(selection['tables'])
+        prompt = ollama_service.build_turn_prompt(user_input, context_data, extra_mapping=extra_mapping)
+        if not conversation:
+            prefix = ollama_service.build_prompt_prefix(GLOBAL_SCHEMA_CACHE, ollama_service.get_mapping_index())
+            prompt = f"{prefix}\n\n{prompt}"
+    elif conversation:
+        prompt = ollama_service.build_turn_prompt(user_input, context_data)
+    else:
+        prompt = ollama_service.build_geological_prompt(user_input, context_data, GLOBAL_SCHEMA_CACHE)
+    
+    tokens = estimate_tokens(prompt)
+    saved = max(0, full_tokens - tokens)
+    log_event(logging.INFO, 'prompt_built', tokens=tokens, full_tokens=full_tokens, saved=saved,
+              reused_context=bool(conversation))
+    return prompt, {'tokens': tokens, 'full_tokens': full_tokens, 'saved': saved}, sent
 
 
 def resolve_table_name(file_path, input_name):
@@ -712,7 +1404,11 @@ def resolve_table_name(file_path, input_name):
     # 1. Verification: If table exists as-is, return it.
     if file_has_table(file_path, input_name):
         return input_name
-        
+    
+    return guess_table_name(input_name)
+
+def guess_table_name(input_name):
+    """Map a filename or category-like name to the actual table name, without opening any file."""
     # 2. Heuristic: Check against Geological Categories (Reverse Lookup)
     input_lower = input_name.lower()
     for category, data in GEOLOGICAL_CATEGORIES.items():
@@ -734,6 +1430,204 @@ def resolve_table_name(file_path, input_name):
         
     return input_name
 
+# 逐文件扫描搜索的并发线程数
+SEARCH_WORKERS = int(os.environ.get('DGSS_SEARCH_WORKERS', '8'))
+
+def search_file(target_db, table, filter_criteria, limit):
+    """在单个文件中用 LIKE 扫描搜索，只借出一次连接；表不存在时返回空列表"""
+    s_conn = get_db_connection(target_db, readonly=True)
+    try:
+        s_cursor = s_conn.cursor()
+        s_cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        file_tables = {row[0] for row in s_cursor.fetchall()}
+        
+        # Resolve Table Name per file
+        actual_table = table if table in file_tables else guess_table_name(table)
+        if actual_table not in file_tables:
+            return []
+        
+        # Build Query
+        sql = f"SELECT * FROM {actual_table}"
+        values = []
+        if filter_criteria:
+            where_parts = []
+            for k, v in filter_criteria.items():
+                # Handle wildcard '*' -> Treat as "Match Any" (ignore this condition)
+                if str(v).strip() == '*':
+                    continue
+                where_parts.append(f"{k} LIKE ?") # Use LIKE for broader search
+                values.append(f"%{v}%")
+            if where_parts:
+                sql += " WHERE " + " AND ".join(where_parts)
+        
+        sql += " LIMIT ?"
+        values.append(limit)
+        
+        s_cursor.execute(sql, values)
+        results = []
+        for row in s_cursor.fetchall():
+            res = dict(row)
+            res['_source'] = os.path.basename(target_db)
+            results.append(res)
+        return results
+    finally:
+        s_conn.close()
+
+def fan_out_search(targets, table, filter_criteria, limit, debug_log, stats=None):
+    """
+    在线程池中并发扫描多个文件，按完成顺序产出 (文件序号, 行列表)。
+    累计找到 limit 行后取消尚未开始的文件；调用方提前停止迭代（如客户端断开）时同样取消。
+    提前停止或某个文件达到 limit 行时，匹配总数只是下限，stats['exact'] 置为 False。
+    """
+    stop = threading.Event()
+    
+    def task(index, target_db):
+        if stop.is_set():
+            return index, target_db, [], None
+        try:
+            return index, target_db, search_file(target_db, table, filter_criteria, limit), None
+        except Exception as e:
+            return index, target_db, [], e
+    
+    pool = ThreadPoolExecutor(max_workers=max(1, SEARCH_WORKERS), thread_name_prefix='dgss-search')
+    futures = [pool.submit(task, i, t) for i, t in enumerate(targets)]
+    found = 0
+    done = 0
+    try:
+        for future in as_completed(futures):
+            index, target_db, rows, error = future.result()
+            done += 1
+            if error:
+                debug_log.append(f"Error searching {target_db}: {error}")
+                continue
+            if not rows:
+                continue
+            if stats is not None and len(rows) >= limit - found:
+                stats['exact'] = False
+            rows = rows[:limit - found]
+            found += len(rows)
+            debug_log.append(f"Found {len(rows)} in {os.path.basename(target_db)}")
+            yield index, rows
+            if found >= limit:
+                if done < len(futures):
+                    debug_log.append(f"Result limit {limit} reached, remaining files skipped")
+                break
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def parse_int(value, default):
+    """把整数参数转换为 int；为空或无法转换时返回 default"""
+    try:
+        return int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        return default
+
+def run_search_action(action, file_path, debug_log, stats):
+    """
+    执行一个 SEARCH 动作，按可用顺序产出 (序号, 行列表)：先是索引命中，再是逐文件扫描的结果。
+    匹配总数累加到 stats['total']；逐文件扫描凑够条数后提前停止，这时总数只是下限，stats['exact'] 为 False。
+    offset 只能用于全部由索引回答的搜索（结果按相关度排序，翻页稳定）；
+    需要逐文件扫描时（结果按完成先后到达）offset 大于 0 抛出 ValueError。
+    """
+    table = action.get('table')
+    filter_criteria = action.get('filter')
+    # limit / offset 来自模型输出，非数字时取默认值，limit 不超过每页上限
+    limit = max(1, min(parse_int(action.get('limit'), SEARCH_PAGE_SIZE), SEARCH_PAGE_SIZE))
+    offset = max(0, parse_int(action.get('offset'), 0))
+    
+    debug_log.append(f"SEARCHing for {table} with {filter_criteria}")
+    
+    # Search all known DB files
+    # If no global files (e.g. no scan done), try current file
+    targets = GLOBAL_DB_FILES if GLOBAL_DB_FILES else ([file_path] if file_path else [])
+    
+    # 条件字段都已建索引时，已索引的文件由一次索引查询覆盖
+    active_filters = {k: v for k, v in (filter_criteria or {}).items() if str(v).strip() != '*'}
+    table_names = list(dict.fromkeys([table, guess_table_name(table)]))
+    indexed_targets = set()
+    if active_filters and SEARCH_INDEX.covers(table_names, active_filters.keys()):
+        # 条件字段中有数值等非文本值的文件不在索引里，仍然逐文件扫描
+        indexed_targets = SEARCH_INDEX.fresh_files(targets, table_names, active_filters.keys())
+    scan_targets = [t for t in targets if t not in indexed_targets]
+    if offset and scan_targets:
+        raise ValueError(f"SEARCH offset is only supported when the search index covers every file "
+                         f"({len(scan_targets)} file(s) need a scan for {table})")
+    
+    # 1. 索引检索
+    if indexed_targets:
+        try:
+            total, hits = SEARCH_INDEX.search(table_names, active_filters, indexed_targets,
+                                              limit=limit, offset=offset)
+            stats['total'] += total
+            debug_log.append(f"Index: {total} match(es) in {len(indexed_targets)} indexed file(s)")
+            rows = fetch_indexed_rows(hits)
+            limit -= len(rows)
+            if rows:
+                yield -1, rows
+        except Exception as e:
+            debug_log.append(f"Index search failed, scanning files instead: {e}")
+            if offset:
+                raise ValueError(f"SEARCH offset needs the search index: {e}")
+            scan_targets = targets
+    
+    # 2. 尚未建立索引的文件并发扫描，凑够剩余条数后停止
+    if scan_targets and limit > 0:
+        for index, rows in fan_out_search(scan_targets, table, filter_criteria, limit, debug_log, stats):
+            stats['total'] += len(rows)
+            yield index, rows
+    elif scan_targets:
+        # 索引命中已经凑满一页，未扫描的文件中的匹配没有计入总数
+        stats['exact'] = False
+
+def fetch_indexed_rows(hits):
+    """按索引命中的 (文件, 表, rowid) 读取完整行，保持相关度顺序"""
+    grouped = {}
+    for source, table_name, rowid in hits:
+        grouped.setdefault((source, table_name), []).append(rowid)
+    
+    rows_by_key = {}
+    for (source, table_name), rowids in grouped.items():
+        conn = get_db_connection(source, readonly=True)
+        try:
+            placeholders = ", ".join("?" for _ in rowids)
+            cursor = conn.execute(f"SELECT *, rowid FROM {table_name} WHERE rowid IN ({placeholders})", rowids)
+            columns = [d[0] for d in cursor.description][:-1]
+            for row in cursor.fetchall():
+                res = dict(zip(columns, tuple(row)[:-1]))
+                res['_source'] = os.path.basename(source)
+                rows_by_key[(source, table_name, row[-1])] = res
+        finally:
+            conn.close()
+    
+    return [rows_by_key[hit] for hit in hits if hit in rows_by_key]
+
+def stream_search_actions(actions, file_path):
+    """
+    以 NDJSON 流式执行 SEARCH 动作：
+    {"type": "results", "rows": [...]} 每批结果一行，最后一行 {"type": "done", ...}。
+    客户端断开时生成器被关闭，未完成的文件搜索随之取消。
+    """
+    debug_log = []
+    search_total = 0
+    total_exact = True
+    count = 0
+    try:
+        for action in actions:
+            if not action.get('table'):
+                continue
+            stats = {'total': 0, 'exact': True}
+            for _, rows in run_search_action(action, file_path, debug_log, stats):
+                count += len(rows)
+                yield json.dumps({'type': 'results', 'rows': rows}, ensure_ascii=False, default=str) + "\n"
+            search_total += stats['total']
+            total_exact = total_exact and stats['exact']
+        yield json.dumps({'type': 'done', 'success': True, 'count': count,
+                          'search_total': search_total, 'search_total_exact': total_exact,
+                          'debug': debug_log}, ensure_ascii=False) + "\n"
+    except Exception as e:
+        yield json.dumps({'type': 'error', 'error': str(e), 'debug': debug_log}, ensure_ascii=False) + "\n"
+
 @app.route('/api/ollama/execute', methods=['POST'])
 def execute_actions():
     data = request.json
@@ -742,6 +1636,10 @@ def execute_actions():
     
     if not actions:
         return jsonify({'error': 'Missing actions'}), 400
+    
+    # 纯查询且请求流式返回时，每个文件搜索完成就推送一批结果
+    if data.get('stream') and all(a.get('type', '').upper() == 'SEARCH' for a in actions):
+        return Response(stream_search_actions(actions, file_path), mimetype='application/x-ndjson')
         
     # File path is optional for SEARCH, but required for UPDATE
     if any(a.get('type') != 'SEARCH' for a in actions) and (not file_path or not os.path.exists(file_path)):
@@ -752,6 +1650,8 @@ def execute_actions():
     
     # Store search results
     search_results = []
+    search_total = 0
+    total_exact = True
     
     try:
         # Separate connection for Updates (single file) vs Search (global)
@@ -765,57 +1665,14 @@ def execute_actions():
             table = action.get('table')
             
             if action_type == 'SEARCH':
-                filter_criteria = action.get('filter')
                 if not table: continue
-                
-                debug_log.append(f"SEARCHing for {table} with {filter_criteria}")
-                
-                # Search all known DB files
-                global GLOBAL_DB_FILES
-                # If no global files (e.g. no scan done), try current file
-                targets = GLOBAL_DB_FILES if GLOBAL_DB_FILES else ([file_path] if file_path else [])
-                
-                for target_db in targets:
-                    try:
-                        # Resolve Table Name per file
-                        actual_table = resolve_table_name(target_db, table)
-                        
-                        # Quick check if table exists
-                        if not file_has_table(target_db, actual_table):
-                            continue
-                            
-                        s_conn = get_db_connection(target_db)
-                        s_cursor = s_conn.cursor()
-                        
-                        # Build Query
-                        sql = f"SELECT * FROM {actual_table}"
-                        values = []
-                        if filter_criteria:
-                            where_parts = []
-                            for k, v in filter_criteria.items():
-                                # Handle wildcard '*' -> Treat as "Match Any" (ignore this condition)
-                                if str(v).strip() == '*':
-                                    continue
-                                where_parts.append(f"{k} LIKE ?") # Use LIKE for broader search
-                                values.append(f"%{v}%")
-                            if where_parts:
-                                sql += " WHERE " + " AND ".join(where_parts)
-                        
-                        sql += " LIMIT 20" # Safety limit per file
-                        
-                        s_cursor.execute(sql, values)
-                        rows = s_cursor.fetchall()
-                        s_conn.close()
-                        
-                        if rows:
-                            for row in rows:
-                                res = dict(row)
-                                res['_source'] = os.path.basename(target_db)
-                                search_results.append(res)
-                            debug_log.append(f"Found {len(rows)} in {os.path.basename(target_db)}")
-                    except Exception as e:
-                        debug_log.append(f"Error searching {target_db}: {e}")
-                
+                stats = {'total': 0, 'exact': True}
+                # 非流式返回时按 索引命中 -> 文件顺序 排列，结果与完成先后无关
+                batches = sorted(run_search_action(action, file_path, debug_log, stats), key=lambda b: b[0])
+                for _, rows in batches:
+                    search_results.extend(rows)
+                search_total += stats['total']
+                total_exact = total_exact and stats['exact']
                 continue
 
             row_data = action.get('data')
@@ -835,10 +1692,12 @@ def execute_actions():
                 filter_criteria = action.get('filter')
                 
                 if row_id:
-                    pk_col = get_table_primary_key(conn, table)
+                    meta = TABLE_META.get(file_path, table)
+                    pk_col = meta['primary_key'] if meta else None
                     if not pk_col:
                         debug_log.append(f"Skipped UPDATE on {table}: Could not determine Primary Key")
                         continue
+                    row_id = coerce_id(meta, row_id)
                         
                     set_clause = ", ".join([f"{k} = ?" for k in row_data.keys()])
                     values = list(row_data.values())
@@ -904,14 +1763,23 @@ def execute_actions():
         if conn:
             conn.commit()
             conn.close()
+            TABLE_META.touch(file_path)
             
         return jsonify({
             'success': True, 
             'count': count, 
             'debug': debug_log,
-            'search_results': search_results
+            'search_results': search_results,
+            'search_total': search_total,
+            'search_total_exact': total_exact
         })
         
+    except ValueError as e:
+        # 动作参数无效（例如无法按索引翻页的 SEARCH offset）
+        if conn:
+            conn.rollback()
+            conn.close()
+        return jsonify({'error': str(e), 'debug': debug_log}), 400
     except Exception as e:
         if conn:
             conn.rollback()
@@ -919,13 +1787,10 @@ def execute_actions():
         return jsonify({'error': str(e), 'debug': debug_log}), 500
 
 if __name__ == '__main__':
-    # Initial check
-    print("Checking Ollama status...")
-    try:
-        OLLAMA_AVAILABLE = ollama_service.check_ollama_status()
-        print(f"Ollama Available: {OLLAMA_AVAILABLE}")
-    except Exception as e:
-        print(f"Ollama Check Failed: {e}")
+    logging.basicConfig(level=os.environ.get('DGSS_LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    # Ollama 状态在后台检查，启动不等待网络
+    OLLAMA_MONITOR.start()
 
     import webbrowser
     from threading import Timer
@@ -0,0 +1,182 @@
+"""
+合成 DGSS 工程生成器
+按 GEOLOGICAL_CATEGORIES 中的表结构生成指定规模的工程目录，供基准测试使用：
+每条路线一个文件夹，包含 Gpoint.ta、Attitude.ta、Sample.ta、Photo.ta、Boundary.la、Groute.la
+以及一个 <路线号>.db（GPOINT / ROUTE / ROUTING / BOUNDARY 描述表）。
+相同的参数和随机种子总是生成相同的数据。
+
+    python benchmarks/make_project.py D:\\bench\\project --routes 200 --points 40
+"""
+
+import os
+import sys
+import random
+import sqlite3
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geological_mapping import GEOLOGICAL_CATEGORIES
+
+ROCKS = ['花岗岩', '二长花岗岩', '花岗闪长岩', '闪长岩', '玄武岩', '安山岩', '流纹岩', '凝灰岩',
+         '砂岩', '粉砂岩', '泥岩', '灰岩', '白云岩', '片岩', '片麻岩', '石英岩', '大理岩', '角岩']
+COLORS = ['灰白色', '浅灰色', '深灰色', '肉红色', '灰绿色', '紫红色', '灰黑色']
+GRAINS = ['细粒', '中粒', '粗粒', '中细粒', '斑状']
+UNITS = ['J3g', 'K1g', 'K1c', 'J3x', 'T3w', 'P1q', 'C2h', 'O1y', 'Qh', 'ηγK1', 'γδJ3']
+SENTENCES = [
+    '露头良好，岩石较新鲜。', '节理发育，主要有两组，产状稳定。', '见石英脉穿插，脉宽 2-5cm。',
+    '岩石风化较强，表面呈土黄色。', '与上覆地层呈角度不整合接触。', '局部见黄铁矿化，呈星点状分布。',
+    '层理清楚，单层厚 10-30cm。', '沿路线向北岩性逐渐过渡。', '采集薄片样品一件。', '拍摄露头照片两张。',
+]
+
+REAL_FIELDS = {'XX', 'YY', 'ALTITUDE', 'WEIGHT', 'DEPTH'}
+INT_FIELDS = {'DIP', 'DIP_ANG', 'TREND', 'DIRECTION', 'AMOUNT', 'BLOCKS', 'NUMBER'}
+TEXT_FIELDS = {'DESC', 'DESCRIBE', 'TASK', 'LOCATION'}
+
+# 每个地质点平均生成的附属记录数
+PER_POINT = {'Attitude.ta': 1.0, 'Sample.ta': 0.3, 'Photo.ta': 1.5, 'Boundary.la': 0.2}
+
+
+def collect_schemas(categories=GEOLOGICAL_CATEGORIES):
+    """{文件名模式: {表名: [字段...]}}，同一文件的同名表字段合并"""
+    schemas = {}
+    for config in categories.values():
+        for rule in config['rules']:
+            tables = schemas.setdefault(rule['file_pattern'], {})
+            columns = tables.setdefault(rule['table'], [])
+            columns.extend(f for f in rule.get('fields', {}) if f not in columns)
+    return schemas
+
+
+def column_type(field):
+    if field in REAL_FIELDS:
+        return 'REAL'
+    if field in INT_FIELDS:
+        return 'INTEGER'
+    return 'TEXT'
+
+
+def create_table(conn, table, columns, with_id):
+    """.ta/.la 图层表带自增主键 GeoID；.db 描述表没有声明主键，与实际数据一致"""
+    defs = [f"{col} {column_type(col)}" for col in columns]
+    if with_id:
+        defs.insert(0, "GeoID INTEGER PRIMARY KEY")
+    conn.execute(f"CREATE TABLE {table} ({', '.join(defs)})")
+
+
+def field_value(field, row, rng):
+    """按字段名生成一个看起来合理的值；row 提供路线号、点号、坐标等公共值"""
+    if field in row:
+        return row[field]
+    if field in ('DIP', 'TREND', 'DIRECTION'):
+        return rng.randint(0, 359)
+    if field == 'DIP_ANG':
+        return rng.randint(5, 85)
+    if field == 'ALTITUDE':
+        return round(rng.uniform(20, 1500), 1)
+    if field in ('WEIGHT', 'DEPTH'):
+        return round(rng.uniform(0.2, 5), 1)
+    if field in ('AMOUNT', 'BLOCKS', 'NUMBER'):
+        return rng.randint(1, 5)
+    if field.startswith('LITHO') or field == 'NAME':
+        return f"{rng.choice(COLORS)}{rng.choice(GRAINS)}{rng.choice(ROCKS)}"
+    if field.startswith('STRAPH') or field in ('GEOUNIT', 'RIGHT_BODY', 'LEFT_BODY'):
+        return rng.choice(UNITS)
+    if field in TEXT_FIELDS:
+        return ''.join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 6)))
+    if field.endswith('_PZ') or field == 'ROUTE_JC':
+        return '' if rng.random() < 0.8 else rng.choice(SENTENCES)
+    return f"{field[:2]}{rng.randint(1, 99)}"
+
+
+def insert_rows(conn, table, columns, rows, rng):
+    placeholders = ", ".join("?" for _ in columns)
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        [[field_value(col, row, rng) for col in columns] for row in rows]
+    )
+
+
+def make_route(folder, route_code, first_point, points, rng, schemas):
+    """生成一条路线的所有文件，返回生成的行数"""
+    os.makedirs(folder, exist_ok=True)
+    x0, y0 = rng.uniform(40400000, 40600000), rng.uniform(3200000, 3400000)
+    date = (datetime.date(2023, 3, 1) + datetime.timedelta(days=rng.randint(0, 600))).isoformat()
+    point_rows = []
+    for i in range(points):
+        point_rows.append({
+            'ROUTECODE': route_code,
+            'GEOPOINT': f"D{first_point + i:05d}",
+            'XX': round(x0 + i * rng.uniform(50, 300), 2),
+            'YY': round(y0 + i * rng.uniform(-200, 200), 2),
+            'DATE': date,
+        })
+
+    def children(prefix, rate):
+        rows = []
+        for point in point_rows:
+            # 随机取整，平均每点 rate 条
+            for _ in range(int(rng.uniform(0, 2 * rate) + rng.random())):
+                rows.append(dict(point, CODE=f"{prefix}{len(rows) + 1}", R_CODE=f"R{len(rows) + 1}",
+                                 SUBPOINT=f"B{len(rows) + 1}", B_CODE=f"B{len(rows) + 1}"))
+        return rows
+
+    layer_rows = {
+        'Gpoint.ta': point_rows,
+        'Groute.la': [{'ROUTECODE': route_code, 'DATE': date}],
+        'Attitude.ta': children('', PER_POINT['Attitude.ta']),
+        'Sample.ta': children('Bb', PER_POINT['Sample.ta']),
+        'Photo.ta': children('P', PER_POINT['Photo.ta']),
+        'Boundary.la': children('B', PER_POINT['Boundary.la']),
+    }
+    db_rows = {
+        'GPOINT': point_rows,
+        'ROUTE': [{'ROUTECODE': route_code}],
+        'ROUTING': [dict(p, R_CODE=f"R{i + 1}") for i, p in enumerate(point_rows)],
+        'BOUNDARY': layer_rows['Boundary.la'],
+    }
+
+    total = 0
+    for pattern, tables in schemas.items():
+        is_db = pattern.startswith('*')
+        path = os.path.join(folder, f"{route_code}.db" if is_db else pattern)
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                for table, columns in tables.items():
+                    rows = db_rows.get(table, []) if is_db else layer_rows.get(pattern, [])
+                    create_table(conn, table, columns, with_id=not is_db)
+                    insert_rows(conn, table, columns, rows, rng)
+                    total += len(rows)
+        finally:
+            conn.close()
+    return total
+
+
+def make_project(root, routes=20, points=30, seed=0):
+    """在 root 下生成 routes 条路线、每条 points 个地质点的工程，返回 {'routes', 'files', 'rows'}"""
+    if os.path.exists(root) and os.listdir(root):
+        raise FileExistsError(f"{root} is not empty")
+    rng = random.Random(seed)
+    schemas = collect_schemas()
+    rows = 0
+    for r in range(routes):
+        route_code = f"L{r + 1:04d}"
+        rows += make_route(os.path.join(root, route_code), route_code, r * points + 1, points, rng, schemas)
+    return {'routes': routes, 'files': routes * len(schemas), 'rows': rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic DGSS project for benchmarks")
+    parser.add_argument('root', help="output folder (must be empty or missing)")
+    parser.add_argument('--routes', type=int, default=20, help="number of route folders")
+    parser.add_argument('--points', type=int, default=30, help="geological points per route")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    stats = make_project(args.root, args.routes, args.points, args.seed)
+    print(f"Generated {stats['routes']} routes, {stats['files']} files, {stats['rows']} rows in {args.root}")
+
+
+if __name__ == '__main__':
+    main()
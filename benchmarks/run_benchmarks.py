@@ -0,0 +1,332 @@
+"""
+基准测试
+生成（或复用）一个合成 DGSS 工程，通过 Flask test client 调用各个接口，
+报告每项的延迟分位数（毫秒）、吞吐（行/秒）和进程峰值内存。AI 问答使用内置的 Ollama 模拟服务，
+不需要真实模型。所有旁路数据（结构目录、索引、缓存）写入临时目录，不影响本机的 ~/.dgss_viewer。
+
+    python benchmarks/run_benchmarks.py --routes 50 --points 30 --json after.json --compare before.json
+
+比较两次提交的性能：在修改前后各运行一次（相同参数和种子），用 --compare 查看 p50 的变化。
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import contextlib
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.make_project import make_project
+from benchmarks.stub_ollama import start_stub_ollama, STUB_MODEL
+
+
+def percentile(values, p):
+    """线性插值分位数，values 非空"""
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），无法获取时返回 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+                       [(name, ctypes.c_size_t) for name in (
+                           'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                           'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                           'PagefileUsage', 'PeakPagefileUsage')]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / 1024 / 1024
+    except Exception:
+        pass
+    return None
+
+
+class Benchmark:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.first_event = []
+        self.rows = 0
+        self.errors = 0
+        self.last_error = None
+
+    def summary(self):
+        if not self.latencies:
+            return {'name': self.name, 'runs': 0, 'errors': self.errors, 'last_error': self.last_error}
+        ms = [t * 1000 for t in self.latencies]
+        total = sum(self.latencies)
+        result = {
+            'name': self.name,
+            'runs': len(ms),
+            'errors': self.errors,
+            'p50_ms': percentile(ms, 50),
+            'p90_ms': percentile(ms, 90),
+            'p99_ms': percentile(ms, 99),
+            'max_ms': max(ms),
+            'rows': self.rows,
+            'rows_per_s': self.rows / total if total > 0 else None,
+            'peak_rss_mb': peak_rss_mb()
+        }
+        if self.first_event:
+            result['first_token_p50_ms'] = percentile([t * 1000 for t in self.first_event], 50)
+        return result
+
+
+def run(bench, repeat, call):
+    """重复调用 call()，call 返回本次处理的行数；接口返回错误时计入 errors"""
+    for i in range(repeat):
+        start = time.perf_counter()
+        try:
+            rows = call(i)
+        except AssertionError as e:
+            bench.errors += 1
+            bench.last_error = str(e)
+            continue
+        bench.latencies.append(time.perf_counter() - start)
+        bench.rows += rows or 0
+    return bench
+
+
+def post_json(client, url, body):
+    response = client.post(url, json=body)
+    assert response.status_code == 200, f"{url}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}"
+    return response.get_json()
+
+
+def build_suite(client, project, files, rng, allow_writes):
+    """返回 [(名称, 重复次数倍数, call)]；call(i) 返回处理的行数"""
+    gpoint_files = [f for f in files if f.endswith('Gpoint.ta')]
+    point_rows = []
+    for path in gpoint_files[:20]:
+        data = post_json(client, '/api/data', {'path': path, 'all': True})
+        point_rows.extend((path, row) for row in data['rows'])
+
+    def scan_warm(i):
+        return len(post_json(client, '/api/scan', {'path': project})['files'])
+
+    def data_page(i):
+        path = rng.choice(files)
+        return len(post_json(client, '/api/data', {'path': path, 'cursor': None, 'limit': 500})['rows'])
+
+    def data_sorted(i):
+        # 翻页也算排序请求，大表上第二次起走临时排序索引
+        body = {'path': rng.choice(gpoint_files), 'limit': 500, 'offset': 500 * (i % 3),
+                'sort': {'column': rng.choice(['GEOPOINT', 'ROUTECODE', 'XX']), 'direction': rng.choice(['asc', 'desc'])}}
+        return len(post_json(client, '/api/data', body)['rows'])
+
+    def data_search(i):
+        body = {'path': rng.choice(gpoint_files), 'limit': 500, 'search': rng.choice(['花岗岩', '砂岩', 'D000'])}
+        return len(post_json(client, '/api/data', body)['rows'])
+
+    def data_all(i):
+        return len(post_json(client, '/api/data', {'path': rng.choice(gpoint_files), 'all': True})['rows'])
+
+    def data_stream(i):
+        response = client.post('/api/data', json={'path': rng.choice(gpoint_files), 'format': 'ndjson'})
+        assert response.status_code == 200
+        last = json.loads(response.get_data(as_text=True).splitlines()[-1])
+        assert 'error' not in last, last
+        return last['count']
+
+    def search(i):
+        rock = rng.choice(['花岗岩', '砂岩', '片麻岩', '灰岩'])
+        result = post_json(client, '/api/ollama/execute', {
+            'actions': [{'type': 'SEARCH', 'table': 'GeoArea', 'filter': {'LITHO_A': rock}}],
+            'filePath': gpoint_files[0]
+        })
+        return len(result['search_results'])
+
+    def update_single(i):
+        path, row = rng.choice(point_rows)
+        post_json(client, '/api/update', {'path': path, 'tableName': 'GeoArea', 'id': row['GeoID'],
+                                          'updates': {'LOCATION': f"bench {i}"}})
+        return 1
+
+    def update_batch(i):
+        path = rng.choice(gpoint_files)
+        ids = [row['GeoID'] for p, row in point_rows if p == path]
+        edits = [{'id': row_id, 'column': 'LOCATION', 'value': f"batch {i}"} for row_id in ids]
+        result = post_json(client, '/api/update-batch', {'path': path, 'tableName': 'GeoArea', 'edits': edits})
+        return result.get('updated', len(edits))
+
+    def ai_query(i):
+        path, row = rng.choice(point_rows)
+        start = time.perf_counter()
+        response = client.post('/api/ollama/query', buffered=False, json={
+            'model': STUB_MODEL,
+            'prompt': f"这个点的岩石名称是什么？{i}",
+            'context': {'filePath': path, 'routeCode': row['ROUTECODE'], 'geoPoint': row['GEOPOINT']}
+        })
+        assert response.status_code == 200
+        tokens = 0
+        for chunk in response.response:
+            text = chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+            if 'event: token' in text and not tokens:
+                suite_state['first_event'] = time.perf_counter() - start
+            tokens += text.count('event: token')
+        response.close()
+        return tokens
+
+    suite_state = {}
+    suite = [
+        ('scan_warm', 1, scan_warm),
+        ('get_data_page', 5, data_page),
+        ('get_data_sorted', 5, data_sorted),
+        ('get_data_search', 2, data_search),
+        ('get_data_all', 2, data_all),
+        ('get_data_ndjson', 2, data_stream),
+        ('search', 2, search),
+        ('ai_query', 1, ai_query),
+    ]
+    if allow_writes:
+        suite += [('update_single', 5, update_single), ('update_batch', 1, update_batch)]
+    return suite, suite_state
+
+
+def print_table(results, baseline=None):
+    header = f"{'benchmark':<18}{'runs':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'rows/s':>12}{'RSS MB':>9}"
+    if baseline:
+        header += f"{'p50 vs base':>13}"
+    print(header)
+    print('-' * len(header))
+    base = {r['name']: r for r in (baseline or [])}
+    for r in results:
+        if not r['runs']:
+            print(f"{r['name']:<18}{0:>6}  (all {r['errors']} runs failed: {r['last_error']})")
+            continue
+        rps = f"{r['rows_per_s']:.0f}" if r['rows_per_s'] is not None else '-'
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else '-'
+        line = (f"{r['name']:<18}{r['runs']:>6}{r['p50_ms']:>10.2f}{r['p90_ms']:>10.2f}"
+                f"{r['p99_ms']:>10.2f}{r['max_ms']:>10.2f}{rps:>12}{rss:>9}")
+        old = base.get(r['name'])
+        if baseline and old and old.get('p50_ms'):
+            line += f"{(r['p50_ms'] / old['p50_ms'] - 1) * 100:>+12.1f}%"
+        if r['errors']:
+            line += f"  ({r['errors']} errors)"
+        if 'first_token_p50_ms' in r:
+            line += f"  first token p50 {r['first_token_p50_ms']:.2f} ms"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DGSS viewer benchmarks")
+    parser.add_argument('--routes', type=int, default=20)
+    parser.add_argument('--points', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20, help="base number of runs per benchmark")
+    parser.add_argument('--project', help="benchmark an existing project folder instead (read-only benchmarks only)")
+    parser.add_argument('--only', help="comma-separated benchmark names")
+    parser.add_argument('--tokens', type=int, default=60, help="tokens per stub Ollama answer")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="seconds between stub tokens")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--compare', help="baseline results file from an earlier --json run")
+    parser.add_argument('--verbose', action='store_true', help="show the app's own log output")
+    parser.add_argument('--keep', action='store_true', help="keep the temporary folder")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='dgss-bench-')
+    # 在导入 app 之前设置：旁路数据写入临时目录，关闭回答缓存以测量实际生成路径，
+    # 关闭文件夹监视（写入基准会触发后台增量更新，干扰计时）
+    os.environ['DGSS_DATA_DIR'] = os.path.join(workdir, 'data')
+    os.environ.setdefault('DGSS_RESPONSE_CACHE', '0')
+    os.environ.setdefault('DGSS_WATCH', '0')
+
+    project = args.project
+    if not project:
+        project = os.path.join(workdir, 'project')
+        start = time.perf_counter()
+        stats = make_project(project, args.routes, args.points, args.seed)
+        print(f"Generated {stats['routes']} routes / {stats['files']} files / {stats['rows']} rows "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    log = io.StringIO()
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log)
+    stub, stub_url = start_stub_ollama(tokens=args.tokens, delay=args.token_delay)
+    results = []
+    try:
+        with quiet:
+            import app as dgss_app
+            import ollama_service
+            ollama_service.OLLAMA_BASE_URL = stub_url
+            dgss_app.OLLAMA_MONITOR.check()
+            client = dgss_app.app.test_client()
+
+            # 冷扫描：结构目录为空，每个文件都要打开
+            cold = Benchmark('scan_cold')
+            files = []
+
+            def scan_cold(i):
+                files.extend(f['path'] for f in post_json(client, '/api/scan', {'path': project})['files'])
+                return len(files)
+            run(cold, 1, scan_cold)
+            results.append(cold.summary())
+
+            # 等后台索引建完再测其它项，结果才可重复
+            start = time.perf_counter()
+            dgss_app.SEARCH_INDEX.update(dgss_app.GLOBAL_SCHEMA_ENTRIES)
+            dgss_app.POINT_INDEX.update(dgss_app.GLOBAL_SCHEMA_ENTRIES)
+            index_bench = Benchmark('index_build')
+            index_bench.latencies.append(time.perf_counter() - start)
+            index_bench.rows = len(files)
+            results.append(index_bench.summary())
+
+            rng = random.Random(args.seed)
+            suite, state = build_suite(client, project, files, rng, allow_writes=not args.project)
+            only = set(args.only.split(',')) if args.only else None
+            for name, factor, call in suite:
+                if only and name not in only:
+                    continue
+                bench = Benchmark(name)
+
+                def timed(i, call=call, bench=bench):
+                    state.pop('first_event', None)
+                    rows = call(i)
+                    if 'first_event' in state:
+                        bench.first_event.append(state['first_event'])
+                    return rows
+                run(bench, max(1, args.repeat * factor), timed)
+                results.append(bench.summary())
+    finally:
+        stub.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Kept {workdir}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_table(results, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+离线基准测试用的 Ollama 模拟服务
+实现 GET /、GET /api/tags 和流式 POST /api/generate（chunked NDJSON），
+按固定的 token 数和间隔输出一段带操作计划的回答，使 AI 问答路径的测量不依赖真实模型。
+
+    python benchmarks/stub_ollama.py --port 11435 --tokens 60 --delay 0.005
+"""
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_MODEL = 'stub:latest'
+
+PLAN = ('{"thought": "查找花岗岩", "actions": [{"type": "SEARCH", "table": "GeoArea", '
+        '"filter": {"LITHO_A": "花岗岩"}}]}')
+
+
+def answer_tokens(count):
+    """正好 count 个 token：一句说明、一个操作计划，其余为重复的结尾文字（count 太小时计划不完整）"""
+    tokens = ['好的，', '需要查询数据：\n']
+    tokens += [PLAN[i:i + 8] for i in range(0, len(PLAN), 8)]
+    while len(tokens) < count:
+        tokens.append('以上为查询条件。')
+    return tokens[:count]
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    tokens = 60
+    delay = 0.0
+    prefill = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, value):
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/':
+            body = b'Ollama is running'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/api/tags':
+            self._send_json(200, {'models': [{'name': STUB_MODEL}]})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def _chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        req = json.loads(self.rfile.read(length) or b'{}')
+        if self.path != '/api/generate':
+            self._send_json(404, {'error': 'not found'})
+            return
+        tokens = answer_tokens(self.tokens)
+        if not req.get('stream', True):
+            self._send_json(200, {'model': req.get('model'), 'response': ''.join(tokens), 'done': True})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            # 预填充耗时大致与提示词长度成正比
+            time.sleep(self.prefill * len(req.get('prompt', '')) / 1000)
+            for token in tokens:
+                self._chunk((json.dumps({'response': token, 'done': False}, ensure_ascii=False) + '\n').encode('utf-8'))
+                if self.delay:
+                    time.sleep(self.delay)
+            context = list(req.get('context') or []) + list(range(len(tokens)))
+            self._chunk((json.dumps({'response': '', 'done': True, 'context': context}) + '\n').encode('utf-8'))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_stub_ollama(port=0, tokens=60, delay=0.0, prefill=0.0):
+    """
+    在后台线程中启动模拟服务，返回 (server, base_url)；用完调用 server.shutdown()。
+    delay 为每个 token 的间隔（秒），prefill 为每 1000 个提示词字符的预填充耗时（秒）。
+    """
+    handler = type('Handler', (StubOllamaHandler,), {'tokens': tokens, 'delay': delay, 'prefill': prefill})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stub-ollama', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama server for offline benchmarks")
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--tokens', type=int, default=60)
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds between tokens")
+    parser.add_argument('--prefill', type=float, default=0.0, help="seconds per 1000 prompt characters")
+    args = parser.parse_args()
+    server, url = start_stub_ollama(args.port, args.tokens, args.delay, args.prefill)
+    print(f"Stub Ollama listening on {url} (set DGSS_OLLAMA_URL to use it)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
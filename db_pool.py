@@ -0,0 +1,229 @@
+"""
+SQLite 数据文件连接池
+按 (文件, 只读/读写) 缓存已打开的连接，LRU 淘汰并限制同时打开的句柄数，
+文件修改时间变化（例如平板同步覆盖了文件）后自动重新打开。
+借出的连接对调用方透明：close() 会把连接归还到池中而不是真正关闭。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# 同时打开的最大句柄数（空闲 + 借出）
+POOL_MAX_HANDLES = int(os.environ.get('DGSS_POOL_MAX_HANDLES', '64'))
+# 空闲超过该秒数的句柄会被关闭；Windows 下打开的句柄会阻止其他程序替换文件
+POOL_IDLE_SECONDS = float(os.environ.get('DGSS_POOL_IDLE_SECONDS', '60'))
+
+
+def _file_mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _connect(path, readonly):
+    if readonly:
+        # mode=ro：只读句柄不会意外创建空文件，也不会持有写锁
+        uri = Path(os.path.abspath(path)).as_uri() + '?mode=ro'
+        try:
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        except sqlite3.OperationalError:
+            if not os.path.exists(path):
+                raise
+            # 个别情况（如 WAL 文件缺少 -shm 且目录只读）只读打开失败，退回普通方式
+            conn = sqlite3.connect(path, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class PooledConnection:
+    """从连接池借出的连接，接口与 sqlite3.Connection 相同；close() 归还连接"""
+
+    def __init__(self, pool, key, conn, mtime_ns, pooled):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._mtime_ns = mtime_ns
+        self._pooled = pooled
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pool._release(self)
+
+    def __del__(self):
+        # 调用方异常路径上忘记 close 时，不让池的计数泄漏
+        if not getattr(self, '_closed', True):
+            self._closed = True
+            self._pool._discard(self)
+
+
+class ConnectionPool:
+    def __init__(self, max_handles=POOL_MAX_HANDLES, idle_seconds=POOL_IDLE_SECONDS):
+        self.max_handles = max_handles
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # (path, readonly) -> [(conn, mtime_ns, released_at), ...]，按最近使用排序
+        self._idle = OrderedDict()
+        self._open_count = 0
+        self._last_sweep = time.monotonic()
+
+    def acquire(self, path, readonly=False):
+        key = (os.path.abspath(path), bool(readonly))
+        mtime_ns = _file_mtime_ns(path)
+        stale = []
+        conn = None
+        pooled = True
+
+        with self._lock:
+            stale.extend(self._sweep_idle_locked())
+            idle_list = self._idle.get(key)
+            while idle_list:
+                candidate, candidate_mtime, _ = idle_list.pop()
+                if candidate_mtime == mtime_ns:
+                    conn = candidate
+                    break
+                # 文件已被修改或替换，旧句柄作废
+                stale.append(candidate)
+                self._open_count -= 1
+            if key in self._idle:
+                if idle_list:
+                    self._idle.move_to_end(key)
+                else:
+                    del self._idle[key]
+
+            if conn is None:
+                if self._open_count >= self.max_handles:
+                    evicted = self._evict_lru_locked()
+                    if evicted is not None:
+                        stale.append(evicted)
+                    else:
+                        # 所有句柄都在使用中：临时打开一个，用完即关
+                        pooled = False
+                if pooled:
+                    self._open_count += 1
+
+        for old in stale:
+            old.close()
+
+        if conn is None:
+            try:
+                conn = _connect(path, readonly)
+            except Exception:
+                if pooled:
+                    with self._lock:
+                        self._open_count -= 1
+                raise
+
+        return PooledConnection(self, key, conn, mtime_ns, pooled)
+
+    def _sweep_idle_locked(self):
+        """关闭空闲过久的句柄（最多每秒检查一次），返回需要关闭的连接"""
+        now = time.monotonic()
+        if now - self._last_sweep < 1:
+            return []
+        self._last_sweep = now
+        expired = []
+        for key in list(self._idle.keys()):
+            idle_list = self._idle[key]
+            keep = [item for item in idle_list if now - item[2] < self.idle_seconds]
+            expired.extend(item[0] for item in idle_list if now - item[2] >= self.idle_seconds)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        self._open_count -= len(expired)
+        return expired
+
+    def _evict_lru_locked(self):
+        """淘汰最久未使用的一个空闲句柄，返回该连接（由调用方在锁外关闭）"""
+        for key in list(self._idle.keys()):
+            idle_list = self._idle[key]
+            if idle_list:
+                conn = idle_list.pop(0)[0]
+                if not idle_list:
+                    del self._idle[key]
+                self._open_count -= 1
+                return conn
+            del self._idle[key]
+        return None
+
+    def _release(self, pooled_conn):
+        conn = pooled_conn._conn
+        try:
+            # 与直接 close() 语义一致：未提交的修改丢弃
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            self._discard(pooled_conn)
+            return
+
+        if not pooled_conn._pooled:
+            conn.close()
+            return
+
+        # 本连接自己的写入也会改变修改时间，记录归还时的时间，避免下次误判为过期
+        mtime_ns = _file_mtime_ns(pooled_conn._key[0]) if not pooled_conn._key[1] else pooled_conn._mtime_ns
+        with self._lock:
+            self._idle.setdefault(pooled_conn._key, []).append((conn, mtime_ns, time.monotonic()))
+            self._idle.move_to_end(pooled_conn._key)
+
+    def _discard(self, pooled_conn):
+        try:
+            pooled_conn._conn.close()
+        except Exception:
+            pass
+        if pooled_conn._pooled:
+            with self._lock:
+                self._open_count -= 1
+
+    def invalidate(self, path):
+        """关闭某个文件的所有空闲句柄（例如文件被删除或替换时）"""
+        path = os.path.abspath(path)
+        closing = []
+        with self._lock:
+            for key in [k for k in self._idle if k[0] == path]:
+                closing.extend(item[0] for item in self._idle.pop(key))
+            self._open_count -= len(closing)
+        for conn in closing:
+            conn.close()
+
+    def close_all(self):
+        closing = []
+        with self._lock:
+            for idle_list in self._idle.values():
+                closing.extend(item[0] for item in idle_list)
+            self._idle.clear()
+            self._open_count -= len(closing)
+        for conn in closing:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            idle = sum(len(v) for v in self._idle.values())
+            return {'open': self._open_count, 'idle': idle, 'max': self.max_handles}
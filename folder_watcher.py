@@ -0,0 +1,358 @@
+"""
+文件夹监视
+扫描完成后监视工程根目录，把野外平板同步进来的新增、删除、修改的数据文件（.ta/.la/.pa/.db）
+以增量形式交给回调，不必重新遍历整个目录。
+Linux 上使用 inotify（ctypes 直接调用 libc），其他平台、网络盘或 inotify 不可用时退回定时轮询；
+同一批变化在安静 DGSS_WATCH_DEBOUNCE 秒后合并为一次回调（复制大文件时会连续产生很多修改事件）。
+DGSS_WATCH=0 关闭监视，DGSS_WATCH=poll 强制轮询（inotify 收不到 SMB/NFS 共享上其他机器的修改）。
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+
+from metrics import log_event
+
+DATA_EXTENSIONS = ('.ta', '.la', '.pa', '.db')
+
+WATCH_MODE = os.environ.get('DGSS_WATCH', '1').strip().lower()
+# 最后一个事件之后等待多久再处理（秒）；持续有事件时最多等待 WATCH_MAX_DELAY
+WATCH_DEBOUNCE = float(os.environ.get('DGSS_WATCH_DEBOUNCE', '1.0'))
+WATCH_MAX_DELAY = float(os.environ.get('DGSS_WATCH_MAX_DELAY', '10'))
+# 轮询模式下两次遍历的间隔（秒）
+WATCH_POLL_INTERVAL = float(os.environ.get('DGSS_WATCH_POLL', '5'))
+
+# inotify 事件位（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT = struct.Struct('iIII')
+
+
+def is_data_file(name):
+    return name.endswith(DATA_EXTENSIONS)
+
+
+def scan_tree(root):
+    """遍历 root 下的数据文件，返回 {路径: (size, mtime_ns)}；目录不存在时返回空字典"""
+    found = {}
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif is_data_file(entry.name):
+                            st = entry.stat()
+                            found[entry.path] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return found
+
+
+class Inotify:
+    """最小的 inotify 封装：递归监视目录，read() 返回 [(路径, 事件位)]"""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = self._get_errno()
+            raise OSError(err, os.strerror(err))
+        # wd -> 目录
+        self._dirs = {}
+
+    def add_tree(self, root):
+        """监视 root 及其所有子目录；超出 max_user_watches 时抛出 OSError(ENOSPC)"""
+        self.add(root)
+        for folder, dirs, _ in os.walk(root):
+            for name in dirs:
+                self.add(os.path.join(folder, name))
+
+    def add(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = self._get_errno()
+            if err == errno.ENOENT:
+                return
+            raise OSError(err, os.strerror(err), path)
+        self._dirs[wd] = path
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            folder = self._dirs.get(wd)
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+            if folder is None:
+                continue
+            events.append((os.path.join(folder, os.fsdecode(name)) if name else folder, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    监视 root 下的数据文件。known 为扫描结果 {路径: (size, mtime_ns)}，作为比较的起点。
+    on_change({'root', 'added', 'removed', 'modified'}) 在监视线程中调用，各项为路径列表。
+    """
+
+    def __init__(self, root, on_change, known=None, mode=WATCH_MODE, debounce=WATCH_DEBOUNCE,
+                 max_delay=WATCH_MAX_DELAY, poll_interval=WATCH_POLL_INTERVAL):
+        self.root = root
+        self.on_change = on_change
+        self.mode = mode
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.backend = None
+        self._known = dict(known or {})
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._inotify = None
+        self._thread = None
+        # 待确认的文件和目录（目录需重新遍历，用于新建/移入/删除的整个文件夹和事件溢出）
+        self._dirty_files = set()
+        self._dirty_dirs = set()
+        self._first_event = None
+        self._last_event = None
+
+    def start(self):
+        if self.mode != 'poll' and sys.platform.startswith('linux'):
+            try:
+                self._inotify = Inotify()
+                self._inotify.add_tree(self.root)
+                self.backend = 'inotify'
+            except OSError as e:
+                self._close_inotify()
+                log_event(logging.WARNING, 'inotify_unavailable', root=self.root, error=str(e),
+                          poll_interval=self.poll_interval)
+        if self.backend is None:
+            self.backend = 'poll'
+        self._thread = threading.Thread(target=self._run, name='dgss-watch', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    def resync(self, known):
+        """重新扫描同一目录后以新的扫描结果作为比较起点"""
+        with self._lock:
+            self._known = dict(known)
+
+    def _close_inotify(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+
+    def _mark(self, path, is_dir):
+        now = time.monotonic()
+        with self._lock:
+            (self._dirty_dirs if is_dir else self._dirty_files).add(path)
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                if self.backend == 'inotify':
+                    self._wait_inotify()
+                else:
+                    self._stop.wait(self.poll_interval)
+                    self._mark(self.root, True)
+                if self._due():
+                    self.flush()
+        finally:
+            self._close_inotify()
+
+    def _wait_inotify(self):
+        timeout = 0.5
+        if self._last_event is not None:
+            timeout = max(0.0, min(timeout, self._last_event + self.debounce - time.monotonic()))
+        try:
+            events = self._inotify.read(timeout)
+        except OSError as e:
+            self._fall_back(e)
+            return
+        for path, mask in events:
+            if path is None:
+                # 事件队列溢出：丢失的变化只能通过重新遍历找回
+                self._mark(self.root, True)
+            elif mask & IN_ISDIR or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self._inotify.add_tree(path)
+                    except OSError as e:
+                        self._fall_back(e)
+                        return
+                # 新目录在加上监视之前可能已经写入了文件，删除/移走的目录需要找出其中已知的文件
+                self._mark(path, True)
+            elif is_data_file(path):
+                self._mark(path, False)
+
+    def _fall_back(self, error):
+        log_event(logging.WARNING, 'inotify_failed', root=self.root, error=str(error),
+                  poll_interval=self.poll_interval)
+        self._close_inotify()
+        self.backend = 'poll'
+        self._mark(self.root, True)
+
+    def _due(self):
+        if self._last_event is None:
+            return False
+        now = time.monotonic()
+        return (self.backend == 'poll' or now - self._last_event >= self.debounce
+                or now - self._first_event >= self.max_delay)
+
+    def flush(self):
+        """确认待处理的路径，与已知状态比较后调用回调；返回变化（没有变化时为 None）"""
+        with self._lock:
+            files, dirs = self._dirty_files, self._dirty_dirs
+            self._dirty_files, self._dirty_dirs = set(), set()
+            self._first_event = self._last_event = None
+            known = dict(self._known)
+
+        current = {}
+        for folder in dirs:
+            found = scan_tree(folder)
+            prefix = os.path.join(folder, '')
+            for path in known:
+                if path.startswith(prefix) and path not in found:
+                    current[path] = None
+            current.update(found)
+        for path in files:
+            if path in current:
+                continue
+            try:
+                st = os.stat(path)
+                current[path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                current[path] = None
+
+        changes = {'root': self.root, 'added': [], 'removed': [], 'modified': []}
+        for path in sorted(current):
+            signature, previous = current[path], known.get(path)
+            if signature == previous:
+                continue
+            if signature is None:
+                changes['removed'].append(path)
+            elif previous is None:
+                changes['added'].append(path)
+            else:
+                changes['modified'].append(path)
+        if not (changes['added'] or changes['removed'] or changes['modified']):
+            return None
+
+        with self._lock:
+            for path, signature in current.items():
+                if signature is None:
+                    self._known.pop(path, None)
+                else:
+                    self._known[path] = signature
+        try:
+            self.on_change(changes)
+        except Exception as e:
+            log_event(logging.WARNING, 'folder_changes_failed', root=self.root, changes=len(changes), error=str(e))
+        return changes
+
+
+class ChangeLog:
+    """
+    按序号记录已应用的文件夹变化，供前端增量拉取。
+    序号单调递增；切换根目录或记录被挤出后，过旧的序号需要前端重新扫描。
+    """
+
+    def __init__(self, max_events=200):
+        self.max_events = max_events
+        self.root = None
+        self.seq = 0
+        self._floor = 0
+        self._events = []
+        self._lock = threading.Lock()
+
+    def reset(self, root):
+        with self._lock:
+            self.root = root
+            self._events = []
+            self._floor = self.seq
+
+    def append(self, added, removed, modified):
+        with self._lock:
+            self.seq += 1
+            self._events.append((self.seq, added, removed, modified))
+            if len(self._events) > self.max_events:
+                dropped = self._events[:len(self._events) - self.max_events]
+                self._events = self._events[len(dropped):]
+                self._floor = dropped[-1][0]
+            return self.seq
+
+    def since(self, seq):
+        """
+        合并 seq 之后的变化，返回 (最新序号, 删除的路径, 新增或修改的路径)；
+        seq 早于保留的记录时返回 None。
+        """
+        with self._lock:
+            if seq < self._floor or seq > self.seq:
+                return None
+            removed = set()
+            upserted = {}
+            for event_seq, added, gone, modified in self._events:
+                if event_seq <= seq:
+                    continue
+                for path in added + modified:
+                    removed.discard(path)
+                    upserted[path] = True
+                for path in gone:
+                    upserted.pop(path, None)
+                    removed.add(path)
+            return self.seq, sorted(removed), list(upserted)
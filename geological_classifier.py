@@ -0,0 +1,89 @@
+"""
+地质分类引擎
+把 GEOLOGICAL_CATEGORIES 预编译为按表名索引的规则表：
+每个文件只读取一次表结构（来自结构目录），按表名 O(1) 找到候选规则，
+再用预编译的文件名模式和字段集合判断是否匹配，不再为每条规则重复打开文件。
+"""
+
+import os
+import re
+import fnmatch
+
+from geological_mapping import GEOLOGICAL_CATEGORIES
+
+
+class GeologicalClassifier:
+    def __init__(self, categories=GEOLOGICAL_CATEGORIES):
+        self.categories = categories
+        # 表名 -> [编译后的规则]
+        self._rules_by_table = {}
+        for category, config in categories.items():
+            for rule_order, rule in enumerate(config['rules']):
+                # 与 fnmatch.fnmatch 一致：模式与文件名都先做 normcase（Windows 下不区分大小写）
+                pattern = re.compile(fnmatch.translate(os.path.normcase(rule['file_pattern'])))
+                self._rules_by_table.setdefault(rule['table'], []).append({
+                    'category': category,
+                    'rule': rule,
+                    'rule_order': rule_order,
+                    'match': pattern.match,
+                    'check_fields': set(rule.get('check_fields', []))
+                })
+
+    def match_file(self, relative_path, file_name, tables):
+        """
+        返回文件命中的编译规则列表。
+        tables 为结构目录中的 {表名: {'columns': [...], ...}}。
+        """
+        rel_key = os.path.normcase(relative_path)
+        name_key = os.path.normcase(file_name)
+        matched = []
+        for table_name, info in tables.items():
+            for compiled in self._rules_by_table.get(table_name, ()):
+                # 检查文件是否匹配pattern
+                if not (compiled['match'](rel_key) or compiled['match'](name_key)):
+                    continue
+                # 可选：检查字段
+                if compiled['check_fields'] and not compiled['check_fields'].issubset(info['columns']):
+                    continue
+                matched.append(compiled)
+        return matched
+
+    def classify(self, files):
+        """
+        对文件列表分类，返回与 /api/scan-geological 相同结构的结果。
+        files 中每项需包含 name / relative_path / full_path / tables。
+        同一分类内按规则顺序、再按文件顺序排列。
+        """
+        result = {}
+        collected = {}
+        for category, config in self.categories.items():
+            result[category] = {
+                'icon': config['icon'],
+                'en_name': config['en_name'],
+                'items': []
+            }
+            collected[category] = []
+
+        # 避免重复添加：同一 (分类, 文件, 表) 只保留规则顺序最靠前的一条，与逐条规则匹配时的优先级一致
+        best = {}
+        for file_index, file_info in enumerate(files):
+            for compiled in self.match_file(file_info['relative_path'], file_info['name'], file_info['tables']):
+                item_key = (compiled['category'], file_info['full_path'], compiled['rule']['table'])
+                current = best.get(item_key)
+                if current is None or compiled['rule_order'] < current[0]['rule_order']:
+                    best[item_key] = (compiled, file_index, file_info)
+
+        for compiled, file_index, file_info in best.values():
+            rule = compiled['rule']
+            collected[compiled['category']].append((compiled['rule_order'], file_index, {
+                'fileName': file_info['relative_path'],
+                'tableName': rule['table'],
+                'filePath': file_info['full_path'],
+                'description': rule.get('description', ''),
+                'rowFilter': rule.get('row_filter')
+            }))
+
+        for category, items in collected.items():
+            items.sort(key=lambda item: (item[0], item[1]))
+            result[category]['items'] = [item for _, _, item in items]
+        return result
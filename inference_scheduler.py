@@ -0,0 +1,94 @@
+"""
+推理调度器
+本地 Ollama 同时只能高效处理少量生成请求。所有 AI 问答先在这里排队：
+同时进行的生成数不超过上限，其余请求按优先级、再按到达顺序等待，并可以随时查询自己的排队位置。
+排队中的请求被取消（浏览器断开）时直接出队，不会占用生成名额。
+"""
+
+import os
+import heapq
+import itertools
+import threading
+
+# 同时进行的生成数
+OLLAMA_CONCURRENCY = int(os.environ.get('DGSS_OLLAMA_CONCURRENCY', '2'))
+
+
+class Ticket:
+    """一个排队中的请求；wait() 返回 True 后持有一个生成名额，用完必须 release()"""
+
+    def __init__(self, scheduler, priority, seq):
+        self._scheduler = scheduler
+        self.priority = priority
+        self.seq = seq
+        self.granted = False
+        self.released = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wait(self, timeout=None):
+        return self._scheduler._wait(self, timeout)
+
+    def position(self):
+        """在队列中的位置，1 表示下一个执行；已获得名额时为 0"""
+        return self._scheduler._position(self)
+
+    def release(self):
+        self._scheduler._release(self)
+
+
+class InferenceScheduler:
+    def __init__(self, max_concurrent=OLLAMA_CONCURRENCY):
+        self.max_concurrent = max(1, max_concurrent)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._active = 0
+        self._seq = itertools.count()
+
+    def enqueue(self, priority=0):
+        """加入队列；priority 越小越先执行，相同优先级先到先得"""
+        with self._cond:
+            ticket = Ticket(self, priority, next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            self._dispatch_locked()
+            return ticket
+
+    def _dispatch_locked(self):
+        granted = False
+        while self._queue and self._active < self.max_concurrent:
+            ticket = heapq.heappop(self._queue)
+            ticket.granted = True
+            self._active += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _wait(self, ticket, timeout):
+        with self._cond:
+            if not ticket.granted:
+                self._cond.wait_for(lambda: ticket.granted, timeout)
+            return ticket.granted
+
+    def _position(self, ticket):
+        with self._cond:
+            if ticket.granted or ticket.released:
+                return 0
+            return 1 + sum(1 for other in self._queue if other < ticket)
+
+    def _release(self, ticket):
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.granted:
+                self._active -= 1
+            else:
+                # 排队中取消：出队
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+            self._dispatch_locked()
+
+    def stats(self):
+        with self._cond:
+            return {'active': self._active, 'queued': len(self._queue), 'max': self.max_concurrent}
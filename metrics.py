@@ -0,0 +1,328 @@
+"""
+运行指标
+进程内的计数器和直方图（线程安全），以 Prometheus 文本格式从 /api/metrics 导出：
+每个接口的请求数、耗时和响应字节数；SQLite 连接的获取次数/耗时/占用时间、执行的语句数和耗时、读取的行数；
+Ollama 首 token 延迟和生成速度。
+每个请求结束时另外输出一行结构化日志（JSON），汇总本次请求的 SQL 次数、耗时和行数。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+METRICS_ENABLED = os.environ.get('DGSS_METRICS', '1') != '0'
+
+log = logging.getLogger('dgss')
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def log_event(level, event, **fields):
+    """输出一行结构化日志：{"event": ..., 字段...}"""
+    if log.isEnabledFor(level):
+        log.log(level, json.dumps(dict(event=event, **fields), ensure_ascii=False, default=str))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [各分桶计数..., 总数, 总和]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets + (float('inf'),), state[:len(self.buckets)] + [state[-2]]):
+                    le = 'le="' + _format_number(bound) + '"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {state[-2]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_number(state[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._gauges = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_callback(self, name, help_text, callback):
+        """导出时调用 callback() 取当前值（例如连接池打开的句柄数）"""
+        self._gauges.append((name, help_text, callback))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, callback in self._gauges:
+            try:
+                value = callback()
+            except Exception:
+                continue
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_format_number(value)}"])
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter('dgss_http_requests_total', 'HTTP requests by endpoint and status',
+                                 ('endpoint', 'method', 'status'))
+HTTP_DURATION = REGISTRY.histogram('dgss_http_request_duration_seconds',
+                                   'Wall time per request, including streamed bodies', ('endpoint',))
+HTTP_BYTES = REGISTRY.counter('dgss_http_response_bytes_total', 'Response bytes serialized', ('endpoint',))
+SQL_CONNECTIONS = REGISTRY.counter('dgss_sqlite_connections_total', 'SQLite connections acquired', ('mode',))
+SQL_CONNECT_SECONDS = REGISTRY.counter('dgss_sqlite_connect_seconds_total',
+                                       'Cumulative time spent acquiring SQLite connections', ('mode',))
+SQL_HELD_SECONDS = REGISTRY.counter('dgss_sqlite_connection_held_seconds_total',
+                                    'Cumulative time SQLite connections were held by callers', ('mode',))
+SQL_STATEMENTS = REGISTRY.counter('dgss_sqlite_statements_total', 'SQL statements executed', ('endpoint', 'kind'))
+SQL_DURATION = REGISTRY.histogram('dgss_sqlite_statement_duration_seconds', 'SQL statement execution time',
+                                  ('kind',))
+SQL_ROWS = REGISTRY.counter('dgss_sqlite_rows_returned_total', 'Rows fetched from SQLite', ('endpoint',))
+OLLAMA_FIRST_TOKEN = REGISTRY.histogram('dgss_ollama_first_token_seconds',
+                                        'Time from request to the first generated token', ('model',),
+                                        buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120))
+OLLAMA_TOKENS_PER_SECOND = REGISTRY.histogram('dgss_ollama_tokens_per_second',
+                                              'Generation speed after the first token', ('model',),
+                                              buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200))
+OLLAMA_GENERATIONS = REGISTRY.counter('dgss_ollama_generations_total', 'AI generations by outcome',
+                                      ('model', 'result'))
+
+
+# ----------------------------------------------------------------------
+# 请求级统计：当前线程正在处理的请求
+# ----------------------------------------------------------------------
+
+_local = threading.local()
+
+
+def begin_request(endpoint):
+    _local.request = {'endpoint': endpoint, 'sql': 0, 'sql_seconds': 0.0, 'rows': 0}
+
+
+def current_request():
+    return getattr(_local, 'request', None)
+
+
+def end_request():
+    stats = current_request()
+    _local.request = None
+    return stats
+
+
+def _current_endpoint():
+    stats = current_request()
+    return stats['endpoint'] if stats else 'background'
+
+
+# ----------------------------------------------------------------------
+# SQLite 连接包装：统计语句数、耗时和读取的行数
+# ----------------------------------------------------------------------
+
+def statement_kind(sql):
+    word = sql.lstrip().split(None, 1)[0].upper() if sql and sql.strip() else ''
+    return word if word in ('SELECT', 'UPDATE', 'INSERT', 'DELETE', 'PRAGMA', 'CREATE', 'WITH') else 'OTHER'
+
+
+def _record_statement(sql, seconds):
+    kind = statement_kind(sql)
+    SQL_STATEMENTS.inc(endpoint=_current_endpoint(), kind=kind)
+    SQL_DURATION.observe(seconds, kind=kind)
+    stats = current_request()
+    if stats:
+        stats['sql'] += 1
+        stats['sql_seconds'] += seconds
+
+
+def _record_rows(count):
+    if not count:
+        return
+    SQL_ROWS.inc(count, endpoint=_current_endpoint())
+    stats = current_request()
+    if stats:
+        stats['rows'] += count
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(sql, *args)
+        finally:
+            _record_statement(sql, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, *args)
+        finally:
+            _record_statement(sql, time.perf_counter() - start)
+        return self
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        _record_rows(1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        _record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        _record_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        count = 0
+        try:
+            for row in self._cursor:
+                count += 1
+                yield row
+        finally:
+            _record_rows(count)
+
+
+class InstrumentedConnection:
+    """包装 get_db_connection 返回的连接；接口不变，close() 时记录占用时间"""
+
+    def __init__(self, conn, mode):
+        self._conn = conn
+        self._mode = mode
+        self._opened = time.perf_counter()
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def cursor(self):
+        return InstrumentedCursor(self._conn.cursor())
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            SQL_HELD_SECONDS.inc(time.perf_counter() - self._opened, mode=self._mode)
+        self._conn.close()
+
+
+def instrument_connect(connect):
+    """包装 connect(path, readonly=False)，返回统计连接、语句和行数的连接"""
+    if not METRICS_ENABLED:
+        return connect
+
+    def instrumented(path, readonly=False):
+        mode = 'ro' if readonly else 'rw'
+        start = time.perf_counter()
+        conn = connect(path, readonly=readonly)
+        SQL_CONNECTIONS.inc(mode=mode)
+        SQL_CONNECT_SECONDS.inc(time.perf_counter() - start, mode=mode)
+        return InstrumentedConnection(conn, mode)
+    return instrumented
+
+
+def record_generation(model, started, first_token_at, finished, tokens, result):
+    """记录一次 AI 生成：首 token 延迟、首 token 之后的生成速度和结果"""
+    OLLAMA_GENERATIONS.inc(model=model or '', result=result)
+    if first_token_at is None:
+        return
+    OLLAMA_FIRST_TOKEN.observe(first_token_at - started, model=model or '')
+    if tokens > 1 and finished > first_token_at:
+        OLLAMA_TOKENS_PER_SECOND.observe((tokens - 1) / (finished - first_token_at), model=model or '')
@@ -0,0 +1,158 @@
+"""
+Ollama 异步流式客户端
+用标准库 asyncio 实现 /api/generate 的流式请求（HTTP/1.1，支持 chunked），不额外引入依赖。
+所有生成流共用一个后台事件循环线程：上游连接的读取、超时和取消都在事件循环中完成，
+同时进行的多个对话不再各自占用一个阻塞在 socket 上的线程。
+在 ASGI 服务器中可以直接 async for 使用 stream_generate；
+WSGI（Flask）请求通过 AsyncStreamRunner.iter_generate 以普通迭代器的方式取结果。
+"""
+
+import json
+import queue
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+
+class OllamaStreamError(Exception):
+    pass
+
+
+async def _read_headers(reader, read_timeout):
+    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), read_timeout)
+    lines = head.decode('latin-1').split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+async def _iter_body(reader, headers, read_timeout):
+    """按到达顺序产出响应体数据块，处理 chunked / Content-Length / 读到连接关闭三种情况"""
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        while True:
+            size_line = await asyncio.wait_for(reader.readline(), read_timeout)
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # 读掉结尾的空行（以及可能的 trailer）
+                await asyncio.wait_for(reader.readline(), read_timeout)
+                return
+            chunk = await asyncio.wait_for(reader.readexactly(size + 2), read_timeout)
+            yield chunk[:-2]
+    elif 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        while remaining > 0:
+            chunk = await asyncio.wait_for(reader.read(min(remaining, 65536)), read_timeout)
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await asyncio.wait_for(reader.read(65536), read_timeout)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def stream_generate(base_url, payload, connect_timeout=3, read_timeout=120):
+    """
+    向 Ollama 发送流式 /api/generate 请求，逐个产出 NDJSON 事件（dict）。
+    read_timeout 为两次收到数据之间的最长等待，模型卡死时抛出 asyncio.TimeoutError。
+    """
+    url = urlsplit(base_url)
+    host = url.hostname or 'localhost'
+    port = url.port or (443 if url.scheme == 'https' else 80)
+    path = (url.path.rstrip('/') or '') + '/api/generate'
+
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=(url.scheme == 'https') or None), connect_timeout)
+    try:
+        body = json.dumps(dict(payload, stream=True)).encode('utf-8')
+        writer.write(
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+        status, headers = await _read_headers(reader, read_timeout)
+        if status != 200:
+            detail = b"".join([chunk async for chunk in _iter_body(reader, headers, read_timeout)])
+            raise OllamaStreamError(f"Error from Ollama ({status}): {detail.decode('utf-8', 'replace')}")
+
+        buffer = b""
+        async for chunk in _iter_body(reader, headers, read_timeout):
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+        if buffer.strip():
+            yield json.loads(buffer)
+    finally:
+        writer.close()
+
+
+_DONE = object()
+
+
+class AsyncStreamRunner:
+    """在一个后台事件循环中运行所有生成流，供同步代码迭代"""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='dgss-ollama-loop', daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def iter_generate(self, base_url, payload, connect_timeout=3, read_timeout=120, idle_interval=None):
+        """
+        同步迭代器：逐个返回事件。调用方停止迭代（例如浏览器断开）时取消上游请求，
+        Ollama 随即停止生成。
+        给定 idle_interval 时，超过该秒数没有新事件就返回 None，调用方可借此发送心跳。
+        """
+        loop = self._ensure_loop()
+        events = queue.Queue()
+
+        async def pump():
+            try:
+                async for event in stream_generate(base_url, payload, connect_timeout, read_timeout):
+                    events.put(event)
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                events.put(OllamaStreamError(f"Ollama did not respond within {read_timeout}s"))
+            except Exception as e:
+                events.put(e if isinstance(e, OllamaStreamError) else OllamaStreamError(str(e)))
+            finally:
+                events.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=idle_interval)
+                except queue.Empty:
+                    yield None
+                    continue
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
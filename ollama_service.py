@@ -1,14 +1,65 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
 
+from ollama_async import AsyncStreamRunner, OllamaStreamError
+from metrics import log_event
+
+
+OLLAMA_BASE_URL = os.environ.get('DGSS_OLLAMA_URL', 'http://localhost:11434')
+# 连接超时，以及读取超时（流式生成时为两次收到数据之间的最长等待），单位秒
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get('DGSS_OLLAMA_CONNECT_TIMEOUT', '3'))
+OLLAMA_READ_TIMEOUT = float(os.environ.get('DGSS_OLLAMA_READ_TIMEOUT', '120'))
+# 复用的 HTTP 连接数
+OLLAMA_POOL_SIZE = int(os.environ.get('DGSS_OLLAMA_POOL_SIZE', '16'))
+# 后台健康检查间隔（秒）；离线时按指数退避，最长 OLLAMA_MONITOR_MAX_BACKOFF 秒
+OLLAMA_MONITOR_INTERVAL = float(os.environ.get('DGSS_OLLAMA_MONITOR_INTERVAL', '5'))
+OLLAMA_MONITOR_MAX_BACKOFF = float(os.environ.get('DGSS_OLLAMA_MONITOR_MAX_BACKOFF', '60'))
+# 在线时模型列表的刷新间隔（秒）
+OLLAMA_MODELS_TTL = float(os.environ.get('DGSS_OLLAMA_MODELS_TTL', '30'))
+# 流式生成走后台 asyncio 事件循环（DGSS_OLLAMA_ASYNC=0 时改用 requests 同步读取）
+OLLAMA_ASYNC_STREAM = os.environ.get('DGSS_OLLAMA_ASYNC', '1') != '0'
+# 模型在显存/内存中保留的时间（Ollama 默认 5 分钟），数字按秒，也可写 "30m"、"-1"（常驻）
+OLLAMA_KEEP_ALIVE = os.environ.get('DGSS_OLLAMA_KEEP_ALIVE', '30m')
+# 保存 KV 上下文的对话数和空闲过期时间（秒）
+CONVERSATION_MAX = int(os.environ.get('DGSS_CONVERSATION_MAX', '32'))
+CONVERSATION_TTL = float(os.environ.get('DGSS_CONVERSATION_TTL', '1800'))
+
+
+def keep_alive_value(value=None):
+    """Ollama 把 JSON 数字解释为秒数、字符串解释为时长；"-1" 这类纯数字需要按数字发送"""
+    value = OLLAMA_KEEP_ALIVE if value is None else value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+def _create_session():
+    """共享的 HTTP 会话：连接池 + keep-alive；状态与模型列表等 GET 请求在连接失败或 502/503/504 时重试"""
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset(['GET', 'HEAD']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=OLLAMA_POOL_SIZE, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+SESSION = _create_session()
+ASYNC_RUNNER = AsyncStreamRunner()
 
-OLLAMA_BASE_URL = "http://localhost:11434"
 
 def check_ollama_status():
     """Check if Ollama is running."""
     try:
         # Timeout set to 2 seconds to avoid hanging startup if offline
-        response = requests.get(f"{OLLAMA_BASE_URL}", timeout=2)
+        response = SESSION.get(f"{OLLAMA_BASE_URL}", timeout=(OLLAMA_CONNECT_TIMEOUT, 2))
         return response.status_code == 200
     except:
         return False
@@ -16,109 +67,197 @@ def check_ollama_status():
 def get_available_models():
     """Get list of available models."""
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
+        response = SESSION.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=(OLLAMA_CONNECT_TIMEOUT, 5))
         if response.status_code == 200:
             data = response.json()
             return [model['name'] for model in data.get('models', [])]
         return []
     except Exception as e:
-        print(f"Error fetching models: {e}")
+        log_event(logging.WARNING, 'ollama_models_failed', error=str(e))
         return []
 
 
+class OllamaMonitor:
+    """
+    后台线程定期探测 Ollama 是否在线并缓存模型列表，接口直接读取内存中的结果。
+    离线时检查间隔按指数退避；poke() 可以要求立即重新检查（例如生成请求失败后）。
+    """
+
+    def __init__(self, interval=OLLAMA_MONITOR_INTERVAL, max_backoff=OLLAMA_MONITOR_MAX_BACKOFF,
+                 models_ttl=OLLAMA_MODELS_TTL, on_change=None):
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.models_ttl = models_ttl
+        self.on_change = on_change
+        self.available = False
+        self.models = []
+        self.checked_at = None
+        self._models_at = 0
+        self._failures = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """启动后台线程（重复调用无副作用），不等待第一次检查完成"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='dgss-ollama-monitor', daemon=True)
+                self._thread.start()
+
+    def poke(self):
+        self._wake.set()
+
+    def check(self):
+        """执行一次检查并更新缓存"""
+        available = check_ollama_status()
+        models = self.models
+        now = time.monotonic()
+        if available and (not self.available or now - self._models_at >= self.models_ttl):
+            models = get_available_models()
+            self._models_at = now
+        elif not available:
+            models = []
+        changed = available != self.available or models != self.models
+        self.available = available
+        self.models = models
+        self.checked_at = time.time()
+        self._failures = 0 if available else self._failures + 1
+        if changed:
+            log_event(logging.INFO, 'ollama_status', available=available, models=len(models))
+            if self.on_change:
+                self.on_change(available, models)
+        return available
+
+    def _next_delay(self):
+        if self._failures == 0:
+            return self.interval
+        return min(self.max_backoff, self.interval * (2 ** (self._failures - 1)))
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                log_event(logging.WARNING, 'ollama_monitor_failed', error=str(e))
+            self._wake.wait(self._next_delay())
+            self._wake.clear()
+
+    def snapshot(self):
+        return {
+            'available': self.available,
+            'models': list(self.models),
+            'checkedAt': self.checked_at
+        }
+
+
 from geological_mapping import GEOLOGICAL_CATEGORIES
 
-def get_mapping_definition():
+def get_mapping_definition(selection=None):
     """
     Generates a readable mapping definition from GEOLOGICAL_CATEGORIES.
+    selection: PromptRetriever.retrieve() result; only the retrieved rules/fields
+    are described in full, the remaining tables are listed in one line each.
     """
     lines = []
     try:
-        for category, data in GEOLOGICAL_CATEGORIES.items():
-            lines.append(f"### {category} ({data.get('en_name', '')})")
-            for rule in data.get('rules', []):
-                file_pattern = rule.get('file_pattern')
-                table = rule.get('table')
-                desc = rule.get('description')
-                lines.append(f"- 表名: {table} (对应文件: {file_pattern}) | 说明: {desc}")
-                
-                fields = rule.get('fields', {})
-                field_strs = [f"{k}={v}" for k, v in fields.items()]
-                lines.append(f"  字段: {'; '.join(field_strs)}")
-            lines.append("")
+        if selection is None:
+            rules = [(category, rule, list(rule.get('fields', {})))
+                     for category, data in GEOLOGICAL_CATEGORIES.items()
+                     for rule in data.get('rules', [])]
+        else:
+            rules = [(item['category'], item['rule'], item['fields']) for item in selection['rules']]
+
+        current_category = None
+        for category, rule, field_names in rules:
+            if category != current_category:
+                if current_category is not None:
+                    lines.append("")
+                data = GEOLOGICAL_CATEGORIES.get(category, {})
+                lines.append(f"### {category} ({data.get('en_name', '')})")
+                current_category = category
+            file_pattern = rule.get('file_pattern')
+            table = rule.get('table')
+            desc = rule.get('description')
+            lines.append(f"- 表名: {table} (对应文件: {file_pattern}) | 说明: {desc}")
+            
+            fields = rule.get('fields', {})
+            field_strs = [f"{k}={fields[k]}" for k in field_names]
+            lines.append(f"  字段: {'; '.join(field_strs)}")
+        lines.append("")
+
+        if selection is not None and selection['others']:
+            others = [f"{item['rule']['table']}({item['rule']['file_pattern']}, {item['rule'].get('description', '')})"
+                      for item in selection['others']]
+            lines.append(f"其他可用表: {'; '.join(others)}")
             
         return "\n".join(lines)
     except Exception as e:
-        print(f"Error parsing mapping definition: {e}")
+        log_event(logging.WARNING, 'mapping_definition_failed', error=str(e))
         return "Error generating mapping definitions."
 
-def build_geological_prompt(user_input, context_data=None, global_schema=""):
-    mapping_text = get_mapping_definition()
-    
-    data_context_str = "无关联数据"
-    if context_data:
-        try:
-            data_context_str = json.dumps(context_data, ensure_ascii=False, indent=2)
-        except:
-            data_context_str = str(context_data)
+def get_mapping_index():
+    """
+    所有表各一行（表名、对应文件、说明），不含字段说明。
+    只随字典变化，检索模式下放在静态前缀中；检索到的表的字段说明随每轮提示词追加。
+    """
+    lines = []
+    for category, data in GEOLOGICAL_CATEGORIES.items():
+        rules = data.get('rules', [])
+        if not rules:
+            continue
+        tables = [f"{rule.get('table')}({rule.get('file_pattern')}, {rule.get('description', '')})" for rule in rules]
+        lines.append(f"{category} ({data.get('en_name', '')}): {'; '.join(tables)}")
+    return "\n".join(lines)
 
-    prompt = f"""
+# 角色与回答要求是固定文本，放在提示词最前面；之后依次是数据库结构和字典，
+# 每轮变化的当前数据与用户指令放在最后，使前缀在多轮之间保持字节一致，
+# Ollama 可以复用已计算的 KV 缓存而不必重新预填充。
+PROMPT_INSTRUCTIONS = """
 [Role]
 You are an expert geological field assistant.
 Your goal is to help geologists analyze and manage field data based on the provided dictionary and context.
 
-[Database Structure (Global Knowledge)]
-{global_schema}
-
-[Dictionary & Field Mappings]
-{mapping_text}
-
-[Current Data Context]
-{data_context_str}
-
-[User Instruction]
-{user_input}
-
 [Requirement]
 1. Language: You MUST answer in Simplified Chinese (简体中文).
 2. Thinking Process: Think silently. DO NOT output <thought> tags.
 3. Response: 
    - If the user asks a question, answer efficiently in Chinese.
    - If you need to FIND data not in the current context, return:
-   {{
+   {
       "thought": "I need to find points with specific lithology...",
       "actions": [
-          {{
+          {
               "type": "SEARCH",
               "table": "TableName",
-              "filter": {{ "ColumnName": "Value" }}
-          }}
+              "filter": { "ColumnName": "Value" }
+          }
       ]
-   }}
+   }
 
    - If the user wants to MODIFY or GENERATE data, you MUST return a JSON object:
    
-   {{
+   {
       "thought": "Reasoning...",
       "actions": [
-          {{
+          {
               "type": "UPDATE",
               "table": "TableName",
-              "filter": {{ "ColumnName": "Value" }}, 
-              "data": {{ "ColumnName": "NewValue" }}
-          }},
-          {{
+              "filter": { "ColumnName": "Value" }, 
+              "data": { "ColumnName": "NewValue" }
+          },
+          {
               "type": "UPDATE",
               "table": "TableName",
               "id": "RowID",
-              "data": {{ "ColumnName": "NewValue" }}
-          }}
+              "data": { "ColumnName": "NewValue" }
+          }
       ]
-   }}
+   }
 
    - Use "id" ONLY if you know the exact Primary Key value.
    - Use "filter" if you need to update multiple rows based on a condition.
-   - For "filter", if you want to update ALL rows, use empty filter "{{}}" or omit it. DO NOT use wildcard "*".
+   - For "filter", if you want to update ALL rows, use empty filter "{}" or omit it. DO NOT use wildcard "*".
    - CRITICAL: Use the ACTUAL Table Name (e.g., 'GeoArea', 'GPOINT'), NOT the filename (e.g. 'Sample.ta'). Refer to the [Database Structure] section.
 
 Example Format for Chat:
@@ -127,20 +266,74 @@ Example Format for Chat:
 
 Example Format for Modification:
 <thought>User wants to update...</thought>
-{{ "thought": "...", "actions": [...] }}
-"""
-    return prompt.strip()
+{ "thought": "...", "actions": [...] }
+""".strip()
 
-def query_ollama(model, prompt, stream=False):
-    """Send query to Ollama."""
-    url = f"{OLLAMA_BASE_URL}/api/generate"
+
+def build_prompt_prefix(global_schema="", mapping_text=None):
+    """提示词的静态部分：角色与要求、数据库结构、字段字典"""
+    if mapping_text is None:
+        mapping_text = get_mapping_definition()
+    return f"""{PROMPT_INSTRUCTIONS}
+
+[Database Structure (Global Knowledge)]
+{global_schema}
+
+[Dictionary & Field Mappings]
+{mapping_text}"""
+
+
+def build_turn_prompt(user_input, context_data=None, extra_schema=None, extra_mapping=None):
+    """
+    每轮变化的部分：当前数据与用户指令。
+    多轮对话复用上下文时，模型已经见过前缀，只需补充本轮新涉及的结构和字典。
+    context_data 可以是已打包好的文本（prompt_utils.pack_context）。
+    """
+    data_context_str = "无关联数据"
+    if isinstance(context_data, str):
+        data_context_str = context_data or data_context_str
+    elif context_data:
+        try:
+            data_context_str = json.dumps(context_data, ensure_ascii=False, indent=2)
+        except:
+            data_context_str = str(context_data)
+
+    parts = []
+    if extra_schema:
+        parts.append(f"[Additional Database Structure]\n{extra_schema}")
+    if extra_mapping:
+        parts.append(f"[Additional Field Mappings]\n{extra_mapping}")
+    parts.append(f"[Current Data Context]\n{data_context_str}")
+    parts.append(f"[User Instruction]\n{user_input}")
+    return "\n\n".join(parts)
+
+
+def build_geological_prompt(user_input, context_data=None, global_schema="", mapping_text=None):
+    prefix = build_prompt_prefix(global_schema, mapping_text)
+    return f"{prefix}\n\n{build_turn_prompt(user_input, context_data)}"
+
+def build_generate_payload(model, prompt, stream=False, context=None, keep_alive=None):
     payload = {
         "model": model,
         "prompt": prompt,
-        "stream": stream
+        "stream": stream,
+        "keep_alive": keep_alive_value(keep_alive)
     }
+    if context:
+        payload["context"] = context
+    return payload
+
+def query_ollama(model, prompt, stream=False, context=None, keep_alive=None):
+    """
+    Send query to Ollama.
+    context: 上一轮 /api/generate 返回的 context（已编码的对话 token），
+    传入后模型接着上一轮继续，prompt 只需包含本轮新增的内容。
+    """
+    url = f"{OLLAMA_BASE_URL}/api/generate"
+    payload = build_generate_payload(model, prompt, stream, context, keep_alive)
     try:
-        response = requests.post(url, json=payload, stream=stream)
+        response = SESSION.post(url, json=payload, stream=stream,
+                                timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT))
         if stream:
             return response
         else:
@@ -150,3 +343,79 @@ def query_ollama(model, prompt, stream=False):
                 return f"Error from Ollama: {response.text}"
     except Exception as e:
         return f"Error: {e}"
+
+def stream_generate(model, prompt, context=None, keep_alive=None, idle_interval=None):
+    """
+    流式生成，逐个返回 Ollama 的事件 dict（含 response / done / context）。
+    出错时抛出 OllamaStreamError；调用方提前停止迭代时上游请求随之关闭。
+    idle_interval：异步模式下超过该秒数没有输出时返回 None（用于心跳，例如模型仍在预填充）。
+    """
+    payload = build_generate_payload(model, prompt, True, context, keep_alive)
+    if OLLAMA_ASYNC_STREAM:
+        yield from ASYNC_RUNNER.iter_generate(OLLAMA_BASE_URL, payload,
+                                              OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, idle_interval)
+        return
+
+    try:
+        response = SESSION.post(f"{OLLAMA_BASE_URL}/api/generate", json=payload, stream=True,
+                                timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT))
+    except requests.RequestException as e:
+        raise OllamaStreamError(str(e))
+    try:
+        if response.status_code != 200:
+            raise OllamaStreamError(f"Error from Ollama ({response.status_code}): {response.text}")
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+    except requests.RequestException as e:
+        raise OllamaStreamError(str(e))
+    finally:
+        response.close()
+
+
+class ConversationStore:
+    """
+    按对话 ID 保存 Ollama 返回的 context 以及已经发送给模型的表/规则，
+    追问时只发送新增内容。LRU 限制数量，空闲超时后丢弃。
+    """
+
+    def __init__(self, max_items=CONVERSATION_MAX, ttl=CONVERSATION_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, conversation_id, model, prefix_key):
+        """返回可复用的对话状态；模型或数据库结构变化后不再复用"""
+        if not conversation_id:
+            return None
+        with self._lock:
+            state = self._items.get(conversation_id)
+            if not state:
+                return None
+            if time.monotonic() - state['updated'] > self.ttl or \
+                    state['model'] != model or state['prefix_key'] != prefix_key:
+                del self._items[conversation_id]
+                return None
+            self._items.move_to_end(conversation_id)
+            return state
+
+    def save(self, conversation_id, model, prefix_key, context, sent_rules, sent_tables):
+        if not conversation_id or not context:
+            return
+        with self._lock:
+            self._items[conversation_id] = {
+                'model': model,
+                'prefix_key': prefix_key,
+                'context': context,
+                'sent_rules': set(sent_rules),
+                'sent_tables': set(sent_tables),
+                'updated': time.monotonic()
+            }
+            self._items.move_to_end(conversation_id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def drop(self, conversation_id):
+        with self._lock:
+            self._items.pop(conversation_id, None)
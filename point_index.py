@@ -0,0 +1,240 @@
+"""
+跨表野外点索引
+扫描时把工程中所有含 ROUTECODE / GEOPOINT 字段的表（Gpoint、Attitude、Sample、Photo、Boundary
+以及 .db 描述表等）按 (路线号, 点号) 登记到旁路 SQLite，记录每一行的 (源文件, 表, rowid)。
+AI 问答组装某个点的上下文时只需一次索引查询加少量按 rowid 读取，不必逐表 PRAGMA 再全表扫描。
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+
+from metrics import log_event
+from schema_catalog import default_data_dir
+
+POINT_INDEX_PATH = os.environ.get('DGSS_POINT_INDEX_PATH') or os.path.join(default_data_dir(), 'point_index.sqlite')
+
+ROUTE_COLUMN = 'ROUTECODE'
+POINT_COLUMN = 'GEOPOINT'
+SKIP_TABLES = ('android_metadata', 'sqlite_sequence')
+
+
+def point_key(value):
+    """索引中统一按去掉首尾空白的文本比较，'12' 与 12 视为同一个点"""
+    if value is None:
+        return None
+    return str(value).strip()
+
+
+def key_columns(columns):
+    """返回表中路线号、点号字段的实际列名（不区分大小写），没有的为 None"""
+    by_upper = {col.upper(): col for col in columns}
+    return by_upper.get(ROUTE_COLUMN), by_upper.get(POINT_COLUMN)
+
+
+class PointIndex:
+    def __init__(self, path=POINT_INDEX_PATH, connect=None):
+        """connect: 打开源数据文件的函数（以只读方式）"""
+        self.path = path
+        self.connect = connect
+        self.available = False
+        self._write_lock = threading.Lock()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS indexed_files (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL
+                    )
+                """)
+                # route / point 为 NULL 表示该表没有这个字段（字段值为空时记为 ''）
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS points (
+                        route TEXT,
+                        point TEXT,
+                        source TEXT NOT NULL,
+                        tbl TEXT NOT NULL,
+                        src_rowid INTEGER NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS points_route_point ON points(route, point)")
+                conn.execute("CREATE INDEX IF NOT EXISTS points_point ON points(point)")
+                conn.execute("CREATE INDEX IF NOT EXISTS points_source ON points(source)")
+                conn.commit()
+                self.available = True
+            finally:
+                conn.close()
+        except Exception as e:
+            log_event(logging.WARNING, 'point_index_unavailable', path=path, error=str(e))
+
+    def _connect_index(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ------------------------------------------------------------------
+    # 建立索引
+    # ------------------------------------------------------------------
+
+    def update(self, entries, root=None):
+        """根据结构目录条目增量更新：只重建 (size, mtime) 变化的文件，返回重建的文件数"""
+        if not self.available:
+            return 0
+        if root:
+            self.prune(root, [entry['path'] for entry in entries])
+        rebuilt = 0
+        with self._write_lock:
+            conn = self._connect_index()
+            try:
+                indexed = dict(((row[0], (row[1], row[2]))
+                                for row in conn.execute("SELECT path, size, mtime_ns FROM indexed_files")))
+                for entry in entries:
+                    if entry['error'] or indexed.get(entry['path']) == (entry['size'], entry['mtime_ns']):
+                        continue
+                    try:
+                        self._index_file(conn, entry)
+                        rebuilt += 1
+                    except Exception as e:
+                        conn.rollback()
+                        log_event(logging.WARNING, 'point_index_failed', file=entry['path'], error=str(e))
+            finally:
+                conn.close()
+        if rebuilt:
+            log_event(logging.INFO, 'point_index_updated', files=rebuilt)
+        return rebuilt
+
+    def update_async(self, entries, root=None):
+        """在后台线程中更新索引；尚未建好索引的文件查询时退回逐表扫描"""
+        if not self.available:
+            return
+        threading.Thread(target=self.update, args=(list(entries), root), daemon=True).start()
+
+    def _delete_source(self, conn, path):
+        conn.execute("DELETE FROM points WHERE source = ?", (path,))
+        conn.execute("DELETE FROM indexed_files WHERE path = ?", (path,))
+
+    def _index_file(self, conn, entry):
+        path = entry['path']
+        src = self.connect(path)
+        try:
+            with conn:
+                self._delete_source(conn, path)
+                for table_name, info in entry['tables'].items():
+                    if table_name in SKIP_TABLES:
+                        continue
+                    route_col, point_col = key_columns(info['columns'])
+                    if not route_col and not point_col:
+                        continue
+                    cursor = src.execute(f"SELECT rowid, {route_col or 'NULL'}, {point_col or 'NULL'} FROM {table_name}")
+                    while True:
+                        rows = cursor.fetchmany(1000)
+                        if not rows:
+                            break
+                        batch = []
+                        for rowid, route, point in (tuple(row) for row in rows):
+                            # 两个字段都为空的行按点查询永远不会命中，不登记
+                            if route is None and point is None:
+                                continue
+                            batch.append((
+                                (point_key(route) if route is not None else '') if route_col else None,
+                                (point_key(point) if point is not None else '') if point_col else None,
+                                path, table_name, rowid
+                            ))
+                        conn.executemany(
+                            "INSERT INTO points (route, point, source, tbl, src_rowid) VALUES (?, ?, ?, ?, ?)",
+                            batch
+                        )
+                conn.execute("INSERT OR REPLACE INTO indexed_files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                             (path, entry['size'], entry['mtime_ns']))
+        finally:
+            src.close()
+
+    def prune(self, root, keep_paths):
+        """删除 root 目录下已不存在的文件的索引"""
+        if not self.available:
+            return
+        prefix = os.path.join(root, '')
+        keep = set(keep_paths)
+        with self._write_lock:
+            conn = self._connect_index()
+            try:
+                rows = conn.execute("SELECT path FROM indexed_files WHERE substr(path, 1, ?) = ?",
+                                    (len(prefix), prefix)).fetchall()
+                with conn:
+                    for (path,) in rows:
+                        if path not in keep:
+                            self._delete_source(conn, path)
+            finally:
+                conn.close()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def fresh_files(self, paths):
+        """返回 paths 中索引已是最新（大小与修改时间一致）的文件集合"""
+        if not self.available:
+            return set()
+        conn = self._connect_index()
+        try:
+            indexed = dict(((row[0], (row[1], row[2]))
+                            for row in conn.execute("SELECT path, size, mtime_ns FROM indexed_files")))
+        finally:
+            conn.close()
+        fresh = set()
+        for path in paths:
+            state = indexed.get(path)
+            if not state:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if state == (st.st_size, st.st_mtime_ns):
+                fresh.add(path)
+        return fresh
+
+    def lookup(self, route_code=None, geo_point=None, sources=None, point_scope=None):
+        """
+        查找与路线号/点号匹配的行，返回 [(source, table, rowid), ...]（按文件、表、rowid 排序）。
+        与逐表扫描的规则一致：两者都给出时，只有其中一个字段的表按该字段匹配。
+        sources 给定时只返回这些文件中的行。
+        point_scope 给定时（目录集合），只按点号匹配的行只保留这些目录下的文件：
+        没有路线号时的所有行，以及给出路线号时没有路线号字段的表中的行。
+        各路线的点号通常都从 1 开始编，这些行在其他路线的文件中多半是另一个点。
+        """
+        route = point_key(route_code) or None
+        point = point_key(geo_point) or None
+        if not self.available or (route is None and point is None):
+            return []
+        if route is not None and point is not None:
+            # 拆成三个可走索引的查询，而不是 (route = ? OR route IS NULL) AND ...
+            sql = ("SELECT source, tbl, src_rowid, route FROM points WHERE route = ? AND point = ? "
+                   "UNION ALL SELECT source, tbl, src_rowid, route FROM points WHERE route = ? AND point IS NULL "
+                   "UNION ALL SELECT source, tbl, src_rowid, route FROM points WHERE point = ? AND route IS NULL")
+            params = (route, point, route, point)
+        elif route is not None:
+            sql = "SELECT source, tbl, src_rowid, route FROM points WHERE route = ?"
+            params = (route,)
+        else:
+            sql = "SELECT source, tbl, src_rowid, route FROM points WHERE point = ?"
+            params = (point,)
+        conn = self._connect_index()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        hits = []
+        for source, table, rowid, row_route in rows:
+            if sources is not None and source not in sources:
+                continue
+            if (point_scope is not None and (route is None or row_route is None)
+                    and os.path.dirname(source) not in point_scope):
+                continue
+            hits.append((source, table, rowid))
+        return sorted(hits)
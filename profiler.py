@@ -0,0 +1,170 @@
+"""
+按请求的性能分析
+用户反馈"打开这个表很慢"时，对那一个请求做 cProfile（可选 tracemalloc 内存快照对比），
+结果按 时间_接口名 保存到分析目录中，只保留最近的若干份。
+默认关闭；以下任一条件满足时分析该请求：
+- 环境变量 DGSS_PROFILE=1（所有请求）或 DGSS_PROFILE=get_data,scan_folder（指定接口）
+- 请求头 X-DGSS-Profile: 1（或 memory，同时记录内存），可用 DGSS_PROFILE_HEADER=0 禁止
+"""
+
+import os
+import io
+import re
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+
+from metrics import log_event
+from schema_catalog import default_data_dir
+
+PROFILE_ENDPOINTS = os.environ.get('DGSS_PROFILE', '0').strip()
+PROFILE_HEADER_ENABLED = os.environ.get('DGSS_PROFILE_HEADER', '1') != '0'
+PROFILE_DIR = os.environ.get('DGSS_PROFILE_DIR') or os.path.join(default_data_dir(), 'profiles')
+# 最多保留的分析结果份数，超出时删除最旧的
+PROFILE_KEEP = int(os.environ.get('DGSS_PROFILE_KEEP', '50'))
+# 这些接口被分析时同时记录 tracemalloc 快照对比
+PROFILE_MEMORY_ENDPOINTS = os.environ.get('DGSS_PROFILE_MEMORY', 'get_data,scan_folder')
+# 文本报告中列出的函数数 / 内存分配位置数
+PROFILE_TOP = 40
+
+_NAME_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def _parse_endpoints(value):
+    if value in ('', '0'):
+        return set()
+    if value == '1':
+        return {'*'}
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class ProfileSession:
+    def __init__(self, profiler, endpoint, memory):
+        self.profiler = profiler
+        self.endpoint = endpoint
+        self.memory = memory
+        self.started_at = time.time()
+        self.name = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at)) + \
+            f"-{int(self.started_at * 1000) % 1000:03d}_{_NAME_RE.sub('_', endpoint)}"
+        self._profile = cProfile.Profile()
+        # 流式响应由 call_on_close 停止，teardown 时不能提前停止
+        self.deferred = False
+        self._stopped = False
+        self._started_tracing = False
+        self._snapshot = None
+        if memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._snapshot = tracemalloc.take_snapshot()
+        self._start = time.perf_counter()
+        self._profile.enable()
+
+    def stop(self):
+        """停止分析并写出结果；可重复调用"""
+        if self._stopped:
+            return
+        self._stopped = True
+        try:
+            self._profile.disable()
+            elapsed = time.perf_counter() - self._start
+            memory_diff = None
+            if self._snapshot is not None:
+                after = tracemalloc.take_snapshot()
+                memory_diff = after.compare_to(self._snapshot, 'lineno')
+                if self._started_tracing:
+                    tracemalloc.stop()
+            self.profiler._write(self, elapsed, memory_diff)
+        except Exception as e:
+            log_event(logging.WARNING, 'profile_failed', endpoint=self.endpoint, error=str(e))
+        finally:
+            self.profiler._lock.release()
+
+
+class RequestProfiler:
+    def __init__(self, directory=PROFILE_DIR, endpoints=PROFILE_ENDPOINTS, keep=PROFILE_KEEP,
+                 memory_endpoints=PROFILE_MEMORY_ENDPOINTS, header_enabled=PROFILE_HEADER_ENABLED):
+        self.directory = directory
+        self.endpoints = _parse_endpoints(endpoints)
+        self.memory_endpoints = _parse_endpoints(memory_endpoints)
+        self.keep = keep
+        self.header_enabled = header_enabled
+        # 同一时间只能有一个 cProfile 处于启用状态（Python 3.12 起为全局限制）
+        self._lock = threading.Lock()
+
+    def wants(self, endpoint, header=None):
+        """返回 (是否分析, 是否记录内存)"""
+        header = (header or '').strip().lower() if self.header_enabled else ''
+        by_header = header not in ('', '0')
+        if not by_header and '*' not in self.endpoints and endpoint not in self.endpoints:
+            return False, False
+        memory = header == 'memory' or '*' in self.memory_endpoints or endpoint in self.memory_endpoints
+        return True, memory
+
+    def start(self, endpoint, header=None):
+        """需要分析时开始并返回 ProfileSession，否则返回 None（已有请求正在分析时也跳过）"""
+        wanted, memory = self.wants(endpoint, header)
+        if not wanted or not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return ProfileSession(self, endpoint or 'unknown', memory)
+        except Exception as e:
+            self._lock.release()
+            log_event(logging.WARNING, 'profile_unavailable', endpoint=endpoint, error=str(e))
+            return None
+
+    def _write(self, session, elapsed, memory_diff):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, session.name)
+        session._profile.dump_stats(base + '.prof')
+
+        report = io.StringIO()
+        report.write(f"endpoint: {session.endpoint}\n")
+        report.write(f"started: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(session.started_at))}\n")
+        report.write(f"wall time: {elapsed * 1000:.1f} ms\n\n")
+        stats = pstats.Stats(session._profile, stream=report)
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+
+        if memory_diff is not None:
+            total = sum(stat.size_diff for stat in memory_diff)
+            with open(base + '.mem.txt', 'w', encoding='utf-8') as f:
+                f.write(f"endpoint: {session.endpoint}\nnet allocated: {total / 1024:.1f} KiB\n\n")
+                for stat in memory_diff[:PROFILE_TOP]:
+                    f.write(f"{stat}\n")
+        self._rotate()
+
+    def _rotate(self):
+        """只保留最近 keep 份（按名称中的时间排序）"""
+        names = sorted({entry.split('.', 1)[0] for entry in os.listdir(self.directory)})
+        for name in names[:max(0, len(names) - self.keep)]:
+            for suffix in ('.prof', '.txt', '.mem.txt'):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except OSError:
+                    pass
+
+    def list_profiles(self):
+        """已保存的分析结果，最新的在前"""
+        if not os.path.isdir(self.directory):
+            return []
+        grouped = {}
+        for entry in os.listdir(self.directory):
+            name = entry.split('.', 1)[0]
+            path = os.path.join(self.directory, entry)
+            item = grouped.setdefault(name, {'id': name, 'files': [], 'size': 0})
+            item['files'].append(entry)
+            item['size'] += os.path.getsize(path)
+        profiles = []
+        for name, item in grouped.items():
+            stamp, _, endpoint = name.partition('_')
+            item['endpoint'] = endpoint
+            item['time'] = stamp
+            item['files'].sort()
+            profiles.append(item)
+        profiles.sort(key=lambda item: item['id'], reverse=True)
+        return profiles
@@ -0,0 +1,392 @@
+"""
+AI 提示词工具
+DGSS 工程中数百个路线文件夹里的 Gpoint.ta、Attitude.ta 等文件结构完全相同，
+把每个文件的结构说明都放进提示词会让长度随工程规模线性增长（Ollama 预填充耗时主要取决于此）。
+这里按结构指纹把文件分组，每种结构只输出一次（附共享该结构的文件统计），
+并用紧凑格式和 token 预算把结构说明控制在大致固定的长度。
+"""
+
+import os
+import re
+import json
+import fnmatch
+import hashlib
+from collections import Counter
+
+from geological_mapping import GEOLOGICAL_CATEGORIES
+
+# 提示词中数据库结构部分的 token 上限
+SCHEMA_TOKEN_BUDGET = int(os.environ.get('DGSS_SCHEMA_TOKEN_BUDGET', '1500'))
+# 每种结构最多列出的示例文件数
+SCHEMA_FILE_EXAMPLES = 3
+# 提示词中保留的最相关规则（表）数，以及每个表最多列出的字段数
+PROMPT_TOP_K = int(os.environ.get('DGSS_PROMPT_TOP_K', '4'))
+PROMPT_FIELDS_PER_TABLE = int(os.environ.get('DGSS_PROMPT_FIELDS_PER_TABLE', '12'))
+
+
+def estimate_tokens(text):
+    """
+    粗略估计 token 数，不依赖具体模型的分词器：
+    中日韩字符约 1 个 token，其余字符约 4 个一个 token。
+    """
+    cjk = sum(1 for ch in text if '⺀' <= ch <= '鿿' or '豈' <= ch <= '﫿')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def schema_fingerprint(tables):
+    """表结构指纹：表名、字段（有序）和主键都相同的文件指纹相同"""
+    canonical = repr(sorted(
+        (name, tuple(info['columns']), info.get('primary_key'))
+        for name, info in tables.items()
+    ))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def format_tables_compact(tables):
+    """紧凑格式：每个表一行 Table(col1*, col2, ...)，* 标记主键"""
+    lines = []
+    for name, info in tables.items():
+        pk = info.get('primary_key')
+        cols = [f"{col}*" if col == pk else col for col in info['columns']]
+        lines.append(f"{name}({', '.join(cols)})")
+    return "\n".join(lines)
+
+
+def _describe_files(paths, root=None):
+    """按文件名统计共享同一结构的文件，例如 "312 files: Gpoint.ta x312" 并附少量示例路径"""
+    names = Counter(os.path.basename(p) for p in paths)
+    # 各路线的 .db 文件名都不同（R001.db、R002.db...），只列出最常见的几个，否则长度随工程规模增长
+    common = names.most_common(SCHEMA_FILE_EXAMPLES)
+    name_text = ", ".join(f"{name} x{count}" if count > 1 else name for name, count in common)
+    if len(names) > len(common):
+        name_text += f", ... {len(names) - len(common)} more names"
+    examples = []
+    for path in paths[:SCHEMA_FILE_EXAMPLES]:
+        examples.append(os.path.relpath(path, root) if root else os.path.basename(path))
+    text = f"{len(paths)} file{'s' if len(paths) > 1 else ''}: {name_text}"
+    if len(paths) > 1 and len(names) < len(paths):
+        text += f" (e.g. {'; '.join(examples)}{'; ...' if len(paths) > len(examples) else ''})"
+    return text
+
+
+def build_schema_summary(entries, root=None, token_budget=None, tables=None):
+    """
+    把结构目录条目编码为提示词中的数据库结构说明。
+    相同结构只输出一次，共享文件多的结构排在前面；超出 token 预算时
+    剩余结构只列出表名，仍放不下的只给出数量。
+    给定 tables 时只保留这些表（不含这些表的文件不出现）。
+    """
+    budget = SCHEMA_TOKEN_BUDGET if token_budget is None else token_budget
+    groups = {}
+    unreadable = []
+    for entry in entries:
+        if entry['error']:
+            unreadable.append(entry['path'])
+            continue
+        entry_tables = entry['tables']
+        if tables is not None:
+            entry_tables = {name: info for name, info in entry_tables.items() if name in tables}
+            if not entry_tables:
+                continue
+        key = schema_fingerprint(entry_tables)
+        if key not in groups:
+            groups[key] = {'tables': entry_tables, 'paths': []}
+        groups[key]['paths'].append(entry['path'])
+
+    if not groups and not unreadable:
+        return ""
+
+    # dict 保持首次出现顺序，sorted 稳定：文件数相同时按扫描顺序
+    ordered = sorted(groups.values(), key=lambda g: -len(g['paths']))
+    file_count = sum(len(g['paths']) for g in groups.values()) + len(unreadable)
+    header = f"{file_count} files, {len(groups)} distinct schemas. Format: Table(col, ...), * = primary key."
+    lines = [header]
+    used = estimate_tokens(header)
+
+    omitted = []
+    for index, group in enumerate(ordered, 1):
+        block = f"\n[S{index}] {_describe_files(group['paths'], root)}\n{format_tables_compact(group['tables'])}"
+        cost = estimate_tokens(block)
+        if omitted or used + cost > budget:
+            omitted.append(group)
+            continue
+        lines.append(block)
+        used += cost
+
+    if omitted:
+        table_names = list(dict.fromkeys(name for g in omitted for name in g['tables']))
+        files = sum(len(g['paths']) for g in omitted)
+        tail = f"\n[+{len(omitted)} more schemas in {files} files, tables: "
+        shown = []
+        for name in table_names:
+            if used + estimate_tokens(tail + ", ".join(shown + [name]) + "]") > budget:
+                break
+            shown.append(name)
+        rest = len(table_names) - len(shown)
+        lines.append(tail + ", ".join(shown) + (f", ... {rest} more" if rest else "") + "]")
+
+    if unreadable:
+        lines.append(f"\n({len(unreadable)} file(s) could not be read)")
+    return "\n".join(lines)
+
+
+# ----------------------------------------------------------------------
+# 相关性检索：只把与用户指令相关的表、字段和上下文放进提示词
+# ----------------------------------------------------------------------
+
+_WORD_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_CJK_RUN_RE = re.compile(r'[\u2e80-\u9fff\uf900-\ufaff]+')
+
+
+def _terms(text):
+    """
+    关键词集合：英文/字段名按单词（小写），中文按相邻两字（bigram），
+    这样 "岩石名称" 与 "这个点的岩石名称是什么" 可以匹配而无需分词词典。
+    """
+    text = str(text or '')
+    terms = {word.lower() for word in _WORD_RE.findall(text)}
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            terms.add(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class PromptRetriever:
+    """
+    把 GEOLOGICAL_CATEGORIES 的每条规则（分类 + 表 + 字段中文名）预先拆成关键词，
+    按用户指令和当前选中数据为规则和字段打分，返回最相关的 top-k。
+    """
+
+    def __init__(self, categories=GEOLOGICAL_CATEGORIES):
+        self.categories = categories
+        self._docs = []
+        for category, config in categories.items():
+            category_terms = _terms(category) | _terms(config.get('en_name', ''))
+            for rule in config['rules']:
+                self._docs.append({
+                    'category': category,
+                    'rule': rule,
+                    'category_terms': category_terms,
+                    'description_terms': _terms(rule.get('description', '')),
+                    'table_term': rule['table'].lower(),
+                    'pattern': os.path.normcase(rule['file_pattern']),
+                    'fields': [(name, label, name.lower(), _terms(label))
+                               for name, label in rule.get('fields', {}).items()]
+                })
+
+    def retrieve(self, instruction, context_data=None, file_name=None, top_k=None):
+        """
+        返回 {'rules': [{'category', 'rule', 'fields': [字段名...]}], 'tables': {表名}, 'others': [未选中的规则]}。
+        rules 按分类定义顺序排列，便于生成与全量字典格式一致的映射说明。
+        """
+        top_k = PROMPT_TOP_K if top_k is None else top_k
+        query = _terms(instruction)
+        # 上下文中的图层 (文件名, 表名)；旧格式的纯表名按当前文件名匹配规则
+        context_layers = [split_context_key(key) for key in context_data or {}]
+        context_tables = {table for _, table in context_layers}
+        context_layers = {(os.path.normcase(source or file_name or ''), table) for source, table in context_layers}
+
+        scored = []
+        for order, doc in enumerate(self._docs):
+            field_scores = []
+            for name, label, name_key, label_terms in doc['fields']:
+                score = 0
+                if name_key in query:
+                    score += 3
+                # 中文名每命中一个 bigram 计 1 分，完整命中（所有 bigram）额外加分
+                hits = len(label_terms & query)
+                if hits:
+                    score += hits + (2 if hits == len(label_terms) else 0)
+                field_scores.append((score, name))
+            score = sum(s for s, _ in field_scores)
+            score += 4 * len(doc['category_terms'] & query)
+            score += 2 * len(doc['description_terms'] & query)
+            if doc['table_term'] in query:
+                score += 3
+            # 当前选中的数据来自这个图层（表名和文件名都符合规则），优先保留
+            if any(table == doc['rule']['table'] and source and fnmatch.fnmatch(source, doc['pattern'])
+                   for source, table in context_layers):
+                score += 5
+            scored.append((score, order, doc, field_scores))
+
+        ranked = sorted((item for item in scored if item[0] > 0), key=lambda item: (-item[0], item[1]))
+        selected = sorted(ranked[:top_k], key=lambda item: item[1])
+        selected_orders = {item[1] for item in selected}
+
+        rules = []
+        for _, _, doc, field_scores in selected:
+            # 命中的字段在前，其余按定义顺序补足到上限
+            hit = [name for score, name in sorted(field_scores, key=lambda f: -f[0]) if score > 0]
+            rest = [name for score, name in field_scores if score == 0]
+            fields = (hit + rest)[:max(PROMPT_FIELDS_PER_TABLE, len(hit))]
+            rules.append({'category': doc['category'], 'rule': doc['rule'], 'fields': fields})
+
+        others = [{'category': doc['category'], 'rule': doc['rule']}
+                  for order, doc in enumerate(self._docs) if order not in selected_orders]
+        return {
+            'rules': rules,
+            'tables': {r['rule']['table'] for r in rules} | context_tables,
+            'others': others
+        }
+
+
+def context_key(source, table):
+    """上下文按来源图层分组的键："Sample.ta:GeoArea"（.ta/.la/.pa 图层的表都叫 GeoArea）"""
+    return f"{os.path.basename(source)}:{table}"
+
+
+def split_context_key(key):
+    """context_key 的逆操作，返回 (文件名, 表名)；旧格式的纯表名返回 (None, 表名)"""
+    source, sep, table = key.rpartition(':')
+    return (source, table) if sep else (None, key)
+
+
+def trim_context(context_data, tables=None):
+    """去掉上下文中的空值字段；给定 tables 时只保留这些表"""
+    if not context_data:
+        return context_data
+    trimmed = {}
+    for key, rows in context_data.items():
+        if tables is not None and split_context_key(key)[1] not in tables:
+            continue
+        trimmed[key] = [{k: v for k, v in row.items() if v not in (None, '')} for row in rows]
+    return trimmed
+
+
+# ----------------------------------------------------------------------
+# 上下文打包：在 token 预算内放入尽量多的表和行
+# ----------------------------------------------------------------------
+
+# 提示词中当前数据部分的 token 上限（<= 0 表示不限制，仍使用紧凑格式）
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('DGSS_CONTEXT_TOKEN_BUDGET', '800'))
+# 单个文本字段最多保留的字符数；预算不足时会进一步截短，但不少于 CONTEXT_TEXT_MIN_CHARS
+CONTEXT_TEXT_MAX_CHARS = int(os.environ.get('DGSS_CONTEXT_TEXT_MAX_CHARS', '300'))
+CONTEXT_TEXT_MIN_CHARS = 40
+
+_DIGITS_RE = re.compile(r'(\d+)(?!.*\d)')
+
+
+def mapped_fields(categories=GEOLOGICAL_CATEGORIES):
+    """
+    {表名: [(文件名模式, {字段名})]}：映射规则中为各图层的表定义了中文含义的字段。
+    .ta/.la/.pa 图层的表都叫 GeoArea，按文件名模式区分，不能按表名合并。
+    """
+    fields = {}
+    for config in categories.values():
+        for rule in config['rules']:
+            fields.setdefault(rule['table'], []).append(
+                (os.path.normcase(rule['file_pattern']), set(rule.get('fields', {}))))
+    return fields
+
+
+def layer_fields(field_map, key):
+    """上下文键（"Sample.ta:GeoArea"）对应图层的映射字段；没有匹配的规则返回 None（保留全部字段）"""
+    source, table = split_context_key(key)
+    rules = field_map.get(table, [])
+    if source is not None:
+        source = os.path.normcase(source)
+        rules = [item for item in rules if fnmatch.fnmatch(source, item[0])]
+    if not rules:
+        return None
+    return set().union(*(fields for _, fields in rules))
+
+
+_MAPPED_FIELDS = mapped_fields()
+
+
+def _point_number(value):
+    """点号中最后一段数字，例如 'D0012' -> 12；没有数字返回 None"""
+    match = _DIGITS_RE.search(str(value or ''))
+    return int(match.group(1)) if match else None
+
+
+def _point_distance(row, geo_point):
+    """行与选中点的距离：同一点为 0，没有点号的（路线级）行为 1，其余按点号数字相差计"""
+    if not geo_point:
+        return 0
+    value = next((v for k, v in row.items() if k.upper() == 'GEOPOINT'), None)
+    if value is None:
+        return 1
+    if str(value).strip() == str(geo_point).strip():
+        return 0
+    selected, current = _point_number(geo_point), _point_number(value)
+    if selected is None or current is None:
+        return float('inf')
+    return 1 + abs(selected - current)
+
+
+def _clip(value, max_chars):
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + '…', True
+    return value, False
+
+
+def _format_row(row, max_chars):
+    clipped = {}
+    truncated = 0
+    for key, value in row.items():
+        clipped[key], cut = _clip(value, max_chars)
+        truncated += cut
+    return json.dumps(clipped, ensure_ascii=False, separators=(',', ':'), default=str), truncated
+
+
+def _pack_rows(candidates, budget, max_chars):
+    """按优先级逐行放入，返回 (chosen, rows, dropped, truncated)"""
+    chosen = {}
+    used = rows = dropped = truncated = 0
+    for rank, layer, row in candidates:
+        header_cost = 0 if layer in chosen else estimate_tokens(f"[{layer}]\n")
+        line, cut = _format_row(row, max_chars)
+        cost = header_cost + estimate_tokens(line + "\n")
+        if budget > 0 and used + cost > budget:
+            dropped += 1
+            continue
+        chosen.setdefault(layer, []).append((rank, line))
+        used += cost
+        rows += 1
+        truncated += cut
+    return chosen, rows, dropped, truncated
+
+
+def pack_context(context_data, geo_point=None, token_budget=None, field_map=None):
+    """
+    把上下文行打包为提示词文本，返回 {'text', 'tokens', 'rows', 'dropped', 'truncated'}。
+    - 去掉空值字段；映射规则中定义了字段的图层只保留该图层自己的字段（按文件名模式匹配规则）
+    - 每行一个紧凑 JSON 对象，按来源图层分组（"[Sample.ta:GeoArea]" 开头）
+    - 离选中点最近的行优先，同等距离时各图层轮流取行，避免前面的图层占满预算
+    - 放不下时先把长文本逐步截短（不少于 CONTEXT_TEXT_MIN_CHARS），仍放不下再丢弃优先级低的行
+    """
+    budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    field_map = _MAPPED_FIELDS if field_map is None else field_map
+    result = {'text': '', 'tokens': 0, 'rows': 0, 'dropped': 0, 'truncated': 0}
+    if not context_data:
+        return result
+
+    candidates = []
+    for layer_order, (layer, rows) in enumerate(context_data.items()):
+        fields = layer_fields(field_map, layer)
+        for row_order, row in enumerate(rows):
+            cleaned = {k: v for k, v in row.items()
+                       if v not in (None, '') and (not fields or k in fields)}
+            if cleaned:
+                candidates.append(((_point_distance(row, geo_point), row_order, layer_order), layer, cleaned))
+    candidates.sort(key=lambda item: item[0])
+
+    max_chars = CONTEXT_TEXT_MAX_CHARS
+    while True:
+        chosen, rows, dropped, truncated = _pack_rows(candidates, budget, max_chars)
+        if not dropped or max_chars <= CONTEXT_TEXT_MIN_CHARS:
+            break
+        max_chars = max(CONTEXT_TEXT_MIN_CHARS, max_chars // 2)
+
+    blocks = []
+    for layer in context_data:
+        if layer in chosen:
+            # 图层内按原始顺序输出
+            lines = [line for _, line in sorted(chosen[layer], key=lambda item: item[0][1])]
+            blocks.append(f"[{layer}]\n" + "\n".join(lines))
+    result.update(rows=rows, dropped=dropped, truncated=truncated)
+    result['text'] = "\n".join(blocks)
+    result['tokens'] = estimate_tokens(result['text'])
+    return result
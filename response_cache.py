@@ -0,0 +1,162 @@
+"""
+AI 回答缓存
+同一模型、同一（规范化后的）问题、相同的上下文数据和数据库结构，得到的回答直接重放，
+不再重新生成。内存中为 LRU，可选写入旁路 SQLite 文件（按总大小上限淘汰最久未用的记录）。
+保存的是 Ollama 逐个返回的 token 序列和最终 context，重放时与实时生成的流式输出一致。
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from metrics import log_event
+from schema_catalog import default_data_dir
+
+RESPONSE_CACHE_ENABLED = os.environ.get('DGSS_RESPONSE_CACHE', '1') != '0'
+# 内存中缓存的回答数
+RESPONSE_CACHE_MAX = int(os.environ.get('DGSS_RESPONSE_CACHE_MAX', '128'))
+# 磁盘缓存的大小上限（MB），0 表示只用内存
+RESPONSE_CACHE_DISK_MB = float(os.environ.get('DGSS_RESPONSE_CACHE_DISK_MB', '50'))
+RESPONSE_CACHE_PATH = os.environ.get('DGSS_RESPONSE_CACHE_PATH') or os.path.join(default_data_dir(), 'response_cache.sqlite')
+
+_SPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCT = '?？。.!！~～'
+
+
+def normalize_instruction(text):
+    """全角/半角统一、合并空白、去掉句末标点并转小写，使措辞上的细微差别命中同一条缓存"""
+    text = unicodedata.normalize('NFKC', str(text or ''))
+    text = _SPACE_RE.sub(' ', text).strip().rstrip(_TRAILING_PUNCT).strip()
+    return text.lower()
+
+
+def fingerprint(value):
+    """任意可 JSON 序列化数据的稳定指纹（字典按键排序）"""
+    data = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def cache_key(model, instruction, context_data=None, schema_text='', history=None):
+    """
+    缓存键：模型 + 规范化问题 + 上下文行指纹 + 数据库结构指纹。
+    history 为复用的对话 context（追问时回答还取决于之前的对话）。
+    """
+    return fingerprint([
+        model,
+        normalize_instruction(instruction),
+        fingerprint(context_data),
+        hashlib.sha256(str(schema_text).encode('utf-8')).hexdigest(),
+        fingerprint(history) if history else None
+    ])
+
+
+class ResponseCache:
+    def __init__(self, max_items=RESPONSE_CACHE_MAX, disk_path=RESPONSE_CACHE_PATH,
+                 disk_max_bytes=RESPONSE_CACHE_DISK_MB * 1024 * 1024):
+        self.max_items = max_items
+        self.disk_max_bytes = int(disk_max_bytes)
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'disk_hits': 0}
+        self._conn = None
+        if disk_path and self.disk_max_bytes > 0:
+            try:
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                conn = sqlite3.connect(disk_path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        tokens TEXT NOT NULL,
+                        context TEXT,
+                        size INTEGER NOT NULL,
+                        last_used REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+                conn.commit()
+                self._conn = conn
+            except Exception as e:
+                log_event(logging.WARNING, 'response_cache_disk_unavailable', path=disk_path, error=str(e))
+
+    def get(self, key):
+        """返回 {'tokens': [...], 'context': [...]}，未命中返回 None"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self._stats['hits'] += 1
+                return item
+            if self._conn is not None:
+                row = self._conn.execute("SELECT tokens, context FROM responses WHERE key = ?", (key,)).fetchone()
+                if row:
+                    item = {'tokens': json.loads(row[0]), 'context': json.loads(row[1]) if row[1] else None}
+                    with self._conn:
+                        self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._remember_locked(key, item)
+                    self._stats['hits'] += 1
+                    self._stats['disk_hits'] += 1
+                    return item
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key, model, tokens, context=None):
+        item = {'tokens': list(tokens), 'context': context}
+        with self._lock:
+            self._remember_locked(key, item)
+            self._stats['stores'] += 1
+            if self._conn is None:
+                return
+            tokens_json = json.dumps(item['tokens'], ensure_ascii=False)
+            context_json = json.dumps(context) if context else None
+            size = len(tokens_json.encode('utf-8')) + len(context_json or '')
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, model, tokens, context, size, last_used) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, model, tokens_json, context_json, size, time.time())
+                    )
+                    self._trim_disk_locked()
+            except sqlite3.Error as e:
+                log_event(logging.WARNING, 'response_cache_write_failed', model=model, error=str(e))
+
+    def _remember_locked(self, key, item):
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def _trim_disk_locked(self):
+        """总大小超过上限时删除最久未使用的记录"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.disk_max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, memory_items=len(self._items))
+            if self._conn is not None:
+                count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+                stats.update(disk_items=count, disk_bytes=size, disk_max_bytes=self.disk_max_bytes)
+            return stats
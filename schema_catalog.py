@@ -0,0 +1,235 @@
+"""
+数据文件结构目录（Catalog）
+在旁路 SQLite 文件中持久化每个数据文件的路径、大小、修改时间、表、字段和主键，
+重新扫描时只重新打开 (大小, 修改时间) 发生变化的文件，服务重启后依然有效。
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import log_event
+from analyze_structure import inspect_database_structure, format_database_structure
+
+
+def default_data_dir():
+    """程序数据目录：优先使用 DGSS_DATA_DIR 环境变量，默认为用户目录下的 .dgss_viewer"""
+    return os.environ.get('DGSS_DATA_DIR') or os.path.join(os.path.expanduser('~'), '.dgss_viewer')
+
+
+CATALOG_PATH = os.environ.get('DGSS_CATALOG_PATH') or os.path.join(default_data_dir(), 'catalog.sqlite')
+# 并行读取文件结构的线程数；网络盘上打开文件以 I/O 等待为主，线程可以有效重叠
+SCAN_WORKERS = int(os.environ.get('DGSS_SCAN_WORKERS', '8'))
+
+
+def introspect_file(path):
+    """
+    打开数据文件读取结构，返回目录条目。
+    读取失败时不抛异常，错误信息记录在条目的 error 字段中。
+    """
+    st = os.stat(path)
+    entry = {
+        'path': path,
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'table_count': 0,
+        'tables': {},
+        'error': None
+    }
+    try:
+        structure = inspect_database_structure(path)
+        entry['table_count'] = structure['table_count']
+        entry['tables'] = structure['tables']
+    except Exception as e:
+        entry['error'] = str(e)
+    return entry
+
+
+def describe_entry(entry):
+    """把目录条目格式化为与 analyze_database_structure 相同的结构说明文本"""
+    if entry['error']:
+        return f"Error analyzing database structure: {entry['error']}"
+    return format_database_structure(os.path.basename(entry['path']), entry)
+
+
+class SchemaCatalog:
+    """以 (size, mtime) 为键缓存数据文件结构的持久化目录"""
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._init_schema()
+        except Exception as e:
+            # 目录不可写时退化为内存目录，仅本次运行有效
+            log_event(logging.WARNING, 'catalog_unavailable', path=path, error=str(e))
+            self.path = ':memory:'
+            self._conn = sqlite3.connect(':memory:', check_same_thread=False)
+            self._init_schema()
+
+    def _init_schema(self):
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                table_count INTEGER NOT NULL,
+                tables TEXT NOT NULL,
+                error TEXT,
+                scanned_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, path):
+        """读取目录中记录的条目，不检查是否过期"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, size, mtime_ns, table_count, tables, error FROM files WHERE path = ?",
+                (path,)
+            ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    @staticmethod
+    def _row_to_entry(row):
+        return {
+            'path': row[0],
+            'size': row[1],
+            'mtime_ns': row[2],
+            'table_count': row[3],
+            'tables': json.loads(row[4]),
+            'error': row[5]
+        }
+
+    def store_many(self, entries):
+        """
+        在一个事务中写入多个条目。
+        读取失败（error 不为空）的条目不写入：文件被锁定、共享盘短暂不可达等错误多半是暂时的，
+        记录下来会在文件修改之前一直显示为错误。
+        """
+        entries = [e for e in entries if not e['error']]
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, table_count, tables, error, scanned_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(e['path'], e['size'], e['mtime_ns'], e['table_count'],
+                      json.dumps(e['tables'], ensure_ascii=False), e['error'], now)
+                     for e in entries]
+                )
+
+    def remove_many(self, paths):
+        if not paths:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in paths])
+
+    def prune(self, root, keep_paths):
+        """删除 root 目录下已不存在（不在 keep_paths 中）的文件记录"""
+        prefix = os.path.join(root, '')
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+            ).fetchall()
+        keep = set(keep_paths)
+        self.remove_many([r[0] for r in rows if r[0] not in keep])
+
+    def get_many(self, paths):
+        """批量读取条目，返回 {path: entry}"""
+        result = {}
+        paths = list(paths)
+        # SQLite 默认变量上限 999，分块查询
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT path, size, mtime_ns, table_count, tables, error FROM files "
+                    f"WHERE path IN ({placeholders})", chunk
+                ).fetchall()
+            for row in rows:
+                result[row[0]] = self._row_to_entry(row)
+        return result
+
+    def refresh(self, paths, workers=None, progress=None):
+        """
+        返回与 paths 顺序一致的目录条目列表。
+        只有目录中不存在、(size, mtime) 已变化或上次读取失败的文件才会被重新打开；
+        stat 与打开文件在有界线程池中并行执行，结果顺序保持确定。
+        结果在一个事务中写回目录。无法访问的文件会被跳过。
+        progress 为 ScanProgress，每处理完一个文件推进一次。
+        """
+        paths = list(paths)
+        cached_entries = self.get_many(paths)
+
+        def load(path):
+            try:
+                st = os.stat(path)
+                cached = cached_entries.get(path)
+                if (cached and not cached['error']
+                        and cached['size'] == st.st_size and cached['mtime_ns'] == st.st_mtime_ns):
+                    return cached, False
+                return introspect_file(path), True
+            except OSError:
+                return None, False
+            finally:
+                if progress:
+                    progress.advance(path)
+
+        workers = max(1, workers or SCAN_WORKERS)
+        if progress:
+            progress.begin('introspecting', len(paths))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dgss-scan') as pool:
+            # map 按输入顺序返回结果，合并顺序与遍历顺序一致
+            results = list(pool.map(load, paths))
+
+        entries = [entry for entry, _ in results if entry]
+        self.store_many([entry for entry, changed in results if entry and changed])
+        return entries
+
+
+class ScanProgress:
+    """线程安全的扫描进度，供前端轮询"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {'running': False, 'phase': 'idle', 'total': 0, 'done': 0, 'current': None}
+
+    def start(self, root):
+        with self._lock:
+            self._state = {'running': True, 'phase': 'walking', 'root': root,
+                           'total': 0, 'done': 0, 'current': None}
+
+    def begin(self, phase, total):
+        with self._lock:
+            self._state.update({'phase': phase, 'total': total, 'done': 0, 'current': None})
+
+    def found(self, count):
+        """遍历阶段：已发现的文件数"""
+        with self._lock:
+            self._state['total'] = count
+
+    def advance(self, path):
+        with self._lock:
+            self._state['done'] += 1
+            self._state['current'] = os.path.basename(path)
+
+    def finish(self):
+        with self._lock:
+            self._state.update({'running': False, 'phase': 'done', 'current': None})
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._state)
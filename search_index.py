@@ -0,0 +1,305 @@
+"""
+跨文件全文检索索引
+扫描时把 GEOLOGICAL_CATEGORIES 中映射字段（岩性、描述、名称、位置等）的文本值
+写入旁路 SQLite 的 FTS5 表（trigram 分词，支持中文子串匹配），按 (源文件, 表, rowid) 定位原始行。
+"找出所有花岗岩" 因此只需一次索引查询，而不是对每个文件做一次 LIKE 全表扫描。
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+from metrics import log_event
+from schema_catalog import default_data_dir
+
+SEARCH_INDEX_PATH = os.environ.get('DGSS_SEARCH_INDEX_PATH') or os.path.join(default_data_dir(), 'search_index.sqlite')
+# 索引格式版本（PRAGMA user_version）；旧版本的索引在启动时清空重建
+INDEX_VERSION = 1
+
+
+def _readonly_connect(path):
+    uri = Path(os.path.abspath(path)).as_uri() + '?mode=ro'
+    return sqlite3.connect(uri, uri=True)
+
+
+class SearchIndex:
+    def __init__(self, path=SEARCH_INDEX_PATH, classifier=None, connect=None):
+        """
+        classifier: GeologicalClassifier，用于确定每个文件/表需要索引的字段
+        connect: 打开源数据文件的函数（默认以只读方式直接打开）
+        """
+        self.path = path
+        self.classifier = classifier
+        self.connect = connect or _readonly_connect
+        self.available = False
+        self._write_lock = threading.Lock()
+        self._build_thread = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS indexed_files (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL
+                    )
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS docs (
+                        id INTEGER PRIMARY KEY,
+                        source TEXT NOT NULL,
+                        tbl TEXT NOT NULL,
+                        col TEXT NOT NULL,
+                        src_rowid INTEGER NOT NULL
+                    )
+                """)
+                # 字段中有非文本值（数值、BLOB）的 (文件, 表, 字段)：这些值没有进入全文索引，
+                # 搜索这些字段时该文件仍需逐行 LIKE 扫描
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS untexted (
+                        source TEXT NOT NULL,
+                        tbl TEXT NOT NULL,
+                        col TEXT NOT NULL,
+                        PRIMARY KEY (source, tbl, col)
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS docs_source ON docs(source)")
+                conn.execute("CREATE INDEX IF NOT EXISTS docs_tbl_col ON docs(tbl, col)")
+                # trigram 分词需要 SQLite 3.34+；不可用时退回逐文件扫描
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS field_fts USING fts5(value, tokenize='trigram')")
+                if conn.execute("PRAGMA user_version").fetchone()[0] < INDEX_VERSION:
+                    # 旧索引没有记录非文本字段，全部重建
+                    conn.execute("DELETE FROM field_fts")
+                    conn.execute("DELETE FROM docs")
+                    conn.execute("DELETE FROM untexted")
+                    conn.execute("DELETE FROM indexed_files")
+                    conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+                conn.commit()
+                self.available = True
+            finally:
+                conn.close()
+        except Exception as e:
+            log_event(logging.WARNING, 'search_index_unavailable', path=path, error=str(e))
+
+    def _connect_index(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ------------------------------------------------------------------
+    # 建立索引
+    # ------------------------------------------------------------------
+
+    def fields_for(self, file_name, table_name, columns):
+        """返回文件中某表需要索引的映射字段"""
+        if not self.classifier:
+            return []
+        fields = []
+        for compiled in self.classifier.match_file(file_name, file_name, {table_name: {'columns': columns}}):
+            for field in compiled['rule'].get('fields', {}):
+                if field in columns and field not in fields:
+                    fields.append(field)
+        return fields
+
+    def update(self, entries, root=None):
+        """
+        根据结构目录条目增量更新索引：只重建 (size, mtime) 变化的文件。
+        给定 root 时先清理该目录下已不存在的文件。返回本次重建的文件数。
+        """
+        if not self.available:
+            return 0
+        if root:
+            self.prune(root, [entry['path'] for entry in entries])
+        rebuilt = 0
+        with self._write_lock:
+            conn = self._connect_index()
+            try:
+                indexed = dict(((row[0], (row[1], row[2]))
+                                for row in conn.execute("SELECT path, size, mtime_ns FROM indexed_files")))
+                for entry in entries:
+                    if entry['error'] or indexed.get(entry['path']) == (entry['size'], entry['mtime_ns']):
+                        continue
+                    try:
+                        self._index_file(conn, entry)
+                        rebuilt += 1
+                    except Exception as e:
+                        conn.rollback()
+                        log_event(logging.WARNING, 'search_index_failed', file=entry['path'], error=str(e))
+            finally:
+                conn.close()
+        if rebuilt:
+            log_event(logging.INFO, 'search_index_updated', files=rebuilt)
+        return rebuilt
+
+    def update_async(self, entries, root=None):
+        """在后台线程中更新索引，不阻塞扫描请求；未建好索引的文件搜索时退回逐文件扫描"""
+        if not self.available:
+            return
+        thread = threading.Thread(target=self.update, args=(list(entries), root), daemon=True)
+        thread.start()
+        self._build_thread = thread
+
+    def _delete_source(self, conn, path):
+        conn.execute("DELETE FROM field_fts WHERE rowid IN (SELECT id FROM docs WHERE source = ?)", (path,))
+        conn.execute("DELETE FROM docs WHERE source = ?", (path,))
+        conn.execute("DELETE FROM untexted WHERE source = ?", (path,))
+        conn.execute("DELETE FROM indexed_files WHERE path = ?", (path,))
+
+    def _index_file(self, conn, entry):
+        path = entry['path']
+        file_name = os.path.basename(path)
+        src = self.connect(path)
+        try:
+            with conn:
+                self._delete_source(conn, path)
+                for table_name, info in entry['tables'].items():
+                    fields = self.fields_for(file_name, table_name, info['columns'])
+                    if not fields:
+                        continue
+                    cursor = src.execute(f"SELECT rowid, {', '.join(fields)} FROM {table_name}")
+                    untexted = set()
+                    while True:
+                        rows = cursor.fetchmany(1000)
+                        if not rows:
+                            break
+                        for row in rows:
+                            for col, value in zip(fields, tuple(row)[1:]):
+                                # 只索引文本值；数值/BLOB 值记录字段，搜索时对该文件退回 LIKE 扫描
+                                if value is not None and not isinstance(value, str):
+                                    untexted.add(col)
+                                    continue
+                                if not value or not value.strip():
+                                    continue
+                                doc_id = conn.execute(
+                                    "INSERT INTO docs (source, tbl, col, src_rowid) VALUES (?, ?, ?, ?)",
+                                    (path, table_name, col, row[0])
+                                ).lastrowid
+                                conn.execute("INSERT INTO field_fts (rowid, value) VALUES (?, ?)", (doc_id, value))
+                    conn.executemany("INSERT OR IGNORE INTO untexted (source, tbl, col) VALUES (?, ?, ?)",
+                                     [(path, table_name, col) for col in sorted(untexted)])
+                conn.execute("INSERT OR REPLACE INTO indexed_files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                             (path, entry['size'], entry['mtime_ns']))
+        finally:
+            src.close()
+
+    def prune(self, root, keep_paths):
+        """删除 root 目录下已不存在的文件的索引"""
+        if not self.available:
+            return
+        prefix = os.path.join(root, '')
+        keep = set(keep_paths)
+        with self._write_lock:
+            conn = self._connect_index()
+            try:
+                rows = conn.execute("SELECT path FROM indexed_files WHERE substr(path, 1, ?) = ?",
+                                    (len(prefix), prefix)).fetchall()
+                with conn:
+                    for (path,) in rows:
+                        if path not in keep:
+                            self._delete_source(conn, path)
+            finally:
+                conn.close()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def fresh_files(self, paths, table_names=None, columns=None):
+        """
+        返回 paths 中索引已是最新（大小与修改时间一致）的文件集合。
+        给定 table_names 和 columns 时，这些字段中有非文本值的文件不算在内（索引中没有这些值）。
+        """
+        if not self.available:
+            return set()
+        conn = self._connect_index()
+        try:
+            indexed = dict(((row[0], (row[1], row[2]))
+                            for row in conn.execute("SELECT path, size, mtime_ns FROM indexed_files")))
+            if table_names and columns:
+                tables = list(table_names)
+                cols = list(columns)
+                sql = (f"SELECT DISTINCT source FROM untexted WHERE tbl IN ({', '.join('?' for _ in tables)}) "
+                       f"AND col IN ({', '.join('?' for _ in cols)})")
+                for (source,) in conn.execute(sql, tables + cols):
+                    indexed.pop(source, None)
+        finally:
+            conn.close()
+        fresh = set()
+        for path in paths:
+            state = indexed.get(path)
+            if not state:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if state == (st.st_size, st.st_mtime_ns):
+                fresh.add(path)
+        return fresh
+
+    def covers(self, table_names, columns):
+        """索引中是否存在这些表的所有给定字段"""
+        if not self.available or not columns:
+            return False
+        conn = self._connect_index()
+        try:
+            placeholders = ", ".join("?" for _ in table_names)
+            for col in columns:
+                hit = conn.execute(
+                    f"SELECT 1 FROM docs WHERE tbl IN ({placeholders}) AND col = ? LIMIT 1",
+                    list(table_names) + [col]
+                ).fetchone()
+                if not hit:
+                    return False
+            return True
+        finally:
+            conn.close()
+
+    def search(self, table_names, filters, sources, limit=50, offset=0):
+        """
+        在索引中查找同时满足所有 {字段: 关键字} 条件的行（子串匹配，不区分大小写）。
+        仅返回 sources 中的文件。结果按相关度排序：
+        返回 (total, [(source, table, rowid), ...])。
+        """
+        conn = self._connect_index()
+        try:
+            placeholders = ", ".join("?" for _ in table_names)
+            matched = None
+            for col, value in filters.items():
+                term = str(value)
+                if len(term) >= 3:
+                    # trigram 可用 MATCH 做索引检索，bm25 越小越相关
+                    phrase = '"' + term.replace('"', '""') + '"'
+                    sql = (f"SELECT d.source, d.tbl, d.src_rowid, bm25(field_fts) FROM field_fts "
+                           f"JOIN docs d ON d.id = field_fts.rowid "
+                           f"WHERE field_fts MATCH ? AND d.tbl IN ({placeholders}) AND d.col = ?")
+                    params = [phrase]
+                else:
+                    # 少于 3 个字符无法用 trigram 检索（FTS5 对这类 LIKE 也不返回结果），
+                    # 退回在索引表上做 instr 子串匹配（仍只扫一张表）
+                    sql = (f"SELECT d.source, d.tbl, d.src_rowid, length(field_fts.value) FROM field_fts "
+                           f"JOIN docs d ON d.id = field_fts.rowid "
+                           f"WHERE instr(lower(field_fts.value), lower(?)) > 0 "
+                           f"AND d.tbl IN ({placeholders}) AND d.col = ?")
+                    params = [term]
+                scores = {}
+                for source, tbl, rowid, score in conn.execute(sql, params + list(table_names) + [col]):
+                    if source not in sources:
+                        continue
+                    key = (source, tbl, rowid)
+                    scores[key] = min(scores.get(key, score), score)
+                if matched is None:
+                    matched = scores
+                else:
+                    matched = {k: matched[k] + v for k, v in scores.items() if k in matched}
+                if not matched:
+                    break
+        finally:
+            conn.close()
+
+        ranked = sorted((matched or {}).items(), key=lambda item: (item[1], item[0]))
+        return len(ranked), [key for key, _ in ranked[offset:offset + limit]]
@@ -8,6 +8,12 @@ document.addEventListener('DOMContentLoaded', () => {
 
     let ollamaAvailable = false;
 
+    // 对话 ID：同一对话的追问由服务端复用模型上下文，切换模型时开始新对话
+    function newConversationId() {
+        return Date.now().toString(36) + Math.random().toString(36).slice(2, 10);
+    }
+    let conversationId = newConversationId();
+
     // Check Status
     function checkStatus() {
         fetch('/api/ollama/status')
@@ -87,6 +93,7 @@ document.addEventListener('DOMContentLoaded', () => {
     if (modelSelect) {
         modelSelect.addEventListener('change', () => {
             localStorage.setItem('selected_model', modelSelect.value);
+            conversationId = newConversationId();
         });
     }
 
@@ -135,7 +142,10 @@ document.addEventListener('DOMContentLoaded', () => {
         const contentDiv = document.createElement('div');
         aiMsgDiv.appendChild(contentDiv);
 
-        let fullResponse = "";
+        // 操作计划卡片单独放置，不受 contentDiv.innerText 追加文字的影响
+        const actionsDiv = document.createElement('div');
+        aiMsgDiv.appendChild(actionsDiv);
+
         let isThinking = false;
 
         try {
@@ -145,20 +155,23 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({
                     model: model,
                     prompt: text,
-                    context: context
+                    context: context,
+                    conversationId: conversationId
                 })
             });
 
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
-
-            while (true) {
-                const { done, value } = await reader.read();
-                if (done) break;
+            // 命中回答缓存时标注，便于区分重放的回答
+            if (response.headers.get('X-Cache') === 'HIT') {
+                aiMsgDiv.title = '来自缓存（相同问题与数据）';
+                aiMsgDiv.classList.add('cached');
+            }
 
-                const chunk = decoder.decode(value, { stream: true });
-                fullResponse += chunk;
+            if (!response.ok) {
+                const result = await response.json().catch(() => ({}));
+                throw new Error(result.error || `HTTP ${response.status}`);
+            }
 
+            const handleToken = (chunk) => {
                 if (chunk.includes('<thought>')) {
                     isThinking = true;
                     thinkingDiv.style.display = 'none';
@@ -179,28 +192,64 @@ document.addEventListener('DOMContentLoaded', () => {
 
                 contentDiv.innerText += displayChunk;
                 chatContainer.scrollTop = chatContainer.scrollHeight;
-            }
-
-            const jsonMatch = fullResponse.match(/\{[\s\S]*"actions"[\s\S]*\}/);
-            if (jsonMatch) {
-                try {
-                    let jsonStr = jsonMatch[0];
-                    const actionPlan = JSON.parse(jsonStr);
-                    if (actionPlan.actions && actionPlan.actions.length > 0) {
-                        contentDiv.appendChild(createConfirmationCard(actionPlan.actions, context.filePath));
-                        chatContainer.scrollTop = chatContainer.scrollHeight;
+            };
+
+            // 服务端以 SSE 返回：queue（排队位置）/ token / actions（已校验的操作计划）/ done / error
+            const queueDiv = document.createElement('div');
+            queueDiv.className = 'queue-status';
+            const handleEvent = (block) => {
+                let event = 'message';
+                let dataText = '';
+                block.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataText += line.slice(5).trim();
+                });
+                if (!dataText) return; // 心跳
+                const data = JSON.parse(dataText);
+                if (event === 'queue') {
+                    queueDiv.textContent = `⏳ 排队中，第 ${data.position} 位...`;
+                    if (!queueDiv.parentNode) aiMsgDiv.insertBefore(queueDiv, contentDiv);
+                    return;
+                }
+                queueDiv.remove();
+                if (event === 'token') {
+                    handleToken(data.text);
+                } else if (event === 'actions') {
+                    if (data.actions.length > 0) {
+                        actionsDiv.appendChild(createConfirmationCard(data.actions, context.filePath, data.issues));
+                    } else if (data.issues.length > 0) {
+                        const note = document.createElement('div');
+                        note.className = 'plan-issues';
+                        note.textContent = `⚠️ 操作计划无法执行：${data.issues.join('；')}`;
+                        actionsDiv.appendChild(note);
                     }
-                } catch (e) {
-                    console.log("JSON parsing error ignored:", e);
+                    chatContainer.scrollTop = chatContainer.scrollHeight;
+                } else if (event === 'error') {
+                    contentDiv.innerText += `\n[Error: ${data.error}]`;
                 }
+            };
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+
+                buffer += decoder.decode(value, { stream: true });
+                const blocks = buffer.split('\n\n');
+                buffer = blocks.pop();
+                blocks.forEach(handleEvent);
             }
+            queueDiv.remove();
 
         } catch (err) {
             contentDiv.innerText += `\n[Error: ${err.message}]`;
         }
     }
 
-    function createConfirmationCard(actions, filePath) {
+    function createConfirmationCard(actions, filePath, issues = []) {
         const card = document.createElement('div');
         card.className = 'confirmation-card';
 
@@ -246,6 +295,14 @@ document.addEventListener('DOMContentLoaded', () => {
         });
         card.appendChild(list);
 
+        // 校验时被去掉的操作
+        if (issues.length > 0) {
+            const note = document.createElement('div');
+            note.className = 'plan-issues';
+            note.textContent = `已忽略 ${issues.length} 项：${issues.join('；')}`;
+            card.appendChild(note);
+        }
+
         const btnContainer = document.createElement('div');
         btnContainer.className = 'card-actions';
 
@@ -275,8 +332,97 @@ document.addEventListener('DOMContentLoaded', () => {
         return card;
     }
 
+    function formatSearchRow(row, index) {
+        let line = `[${index + 1}] `;
+        if (row._source) line += `(Source: ${row._source}) `;
+
+        // Format remaining keys
+        const details = Object.entries(row)
+            .filter(([k]) => k !== '_source')
+            .map(([k, v]) => `${k}=${v}`)
+            .join(', ');
+
+        return line + details + "\n";
+    }
+
+    // 纯查询：以 NDJSON 流式接收结果，每个文件搜索完成就追加显示
+    async function streamSearchActions(actions, filePath, cardElement) {
+        const response = await fetch('/api/ollama/execute', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                actions: actions,
+                filePath: filePath,
+                stream: true
+            })
+        });
+        if (!response.ok || !response.body) {
+            const result = await response.json().catch(() => ({}));
+            throw new Error(result.error || `HTTP ${response.status}`);
+        }
+
+        cardElement.innerHTML = `<div style="color:#333; padding:5px;">
+            <div class="search-status">⏳ 正在搜索...</div>
+            <div class="search-rows" style="max-height:300px; overflow:auto; margin-top:5px; border:1px solid #eee; background:#f9f9f9; padding:8px; font-family:monospace; font-size:12px; white-space:pre-wrap;"></div>
+        </div>`;
+        const statusEl = cardElement.querySelector('.search-status');
+        const rowsEl = cardElement.querySelector('.search-rows');
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let shown = 0;
+        let final = null;
+
+        const handleLine = (line) => {
+            if (!line.trim()) return;
+            const event = JSON.parse(line);
+            if (event.type === 'results') {
+                rowsEl.textContent += event.rows.map((row, i) => formatSearchRow(row, shown + i)).join('');
+                shown += event.rows.length;
+                statusEl.textContent = `⏳ 已找到 ${shown} 条，继续搜索...`;
+            } else if (event.type === 'done' || event.type === 'error') {
+                final = event;
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.forEach(handleLine);
+        }
+        handleLine(buffer);
+
+        if (!final || final.type === 'error') {
+            throw new Error((final && final.error) || '搜索中断');
+        }
+
+        if (shown > 0) {
+            const total = final.search_total || shown;
+            statusEl.textContent = `✅ 找到 ${total} 条数据${total > shown ? `，显示前 ${shown} 条` : ''}:`;
+        } else {
+            cardElement.innerHTML = `<div style="color:#666; text-align:center; padding:10px;">
+                ⚠️ 未找到符合条件的数据。
+            </div>`;
+        }
+        if (final.debug && final.debug.length > 0) {
+            cardElement.insertAdjacentHTML('beforeend', `<div style="margin-top:10px; font-size:11px; color:#666; background:#f5f5f5; padding:5px; border-radius:4px; max-height:100px; overflow-y:auto;">
+                <strong>调试日志:</strong><br>
+                ${final.debug.join('<br>')}
+            </div>`);
+        }
+    }
+
     async function executeActions(actions, filePath, cardElement) {
         try {
+            if (actions.every(a => a.type === 'SEARCH')) {
+                await streamSearchActions(actions, filePath, cardElement);
+                return;
+            }
+
             const response = await fetch('/api/ollama/execute', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
@@ -297,21 +443,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (isSearch) {
                     if (result.search_results && result.search_results.length > 0) {
                         msg += `<div style="color:#333; padding:5px;">
-                            <div>✅ 找到 ${result.search_results.length} 条数据:</div>
+                            <div>✅ 找到 ${result.search_total || result.search_results.length} 条数据${result.search_total > result.search_results.length ? `，显示前 ${result.search_results.length} 条` : ''}:</div>
                             <div style="max-height:300px; overflow:auto; margin-top:5px; border:1px solid #eee; background:#f9f9f9; padding:8px; font-family:monospace; font-size:12px; white-space:pre-wrap;">`;
 
                         // Render as text list
                         result.search_results.forEach((row, index) => {
-                            msg += `[${index + 1}] `;
-                            if (row._source) msg += `(Source: ${row._source}) `;
-
-                            // Format remaining keys
-                            const details = Object.entries(row)
-                                .filter(([k]) => k !== '_source')
-                                .map(([k, v]) => `${k}=${v}`)
-                                .join(', ');
-
-                            msg += details + "\n";
+                            msg += formatSearchRow(row, index);
                         });
 
                         msg += `</div></div>`;
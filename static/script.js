@@ -9,6 +9,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const tableListDisplay = document.getElementById('tableList');
     const statusDisplay = document.getElementById('status');
     const saveBtn = document.getElementById('saveBtn');
+    const tableSearchInput = document.getElementById('tableSearch');
     const tabGeological = document.getElementById('tabGeological');
     const tabRawFiles = document.getElementById('tabRawFiles');
 
@@ -49,6 +50,10 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentTab = 'geological'; // 'geological' or 'raw'
     let rawFilesCache = [];
     let geologicalDataCache = {};
+    let watchSeq = null; // 最近一次扫描对应的文件夹变化序号
+    let watchTimer = null;
+    const WATCH_POLL_MS = 3000;
+    const PAGE_SIZE = 500; // 每次滚动加载的行数
 
     // 标签页相关变量
     let tabs = [];
@@ -114,30 +119,50 @@ document.addEventListener('DOMContentLoaded', () => {
         let successCount = 0;
         let errorCount = 0;
 
+        // 所有修改一次提交：服务端在一个事务中执行
+        const edits = [];
         for (const [rowId, updates] of Object.entries(pendingChanges)) {
-            try {
-                const response = await fetch('/api/update', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        path: currentFile.path,
-                        tableName: currentTable,
-                        id: rowId,
-                        updates: updates
-                    })
-                });
+            for (const [column, value] of Object.entries(updates)) {
+                edits.push({ id: rowId, column: column, value: value });
+            }
+        }
 
-                if (response.ok) {
-                    successCount++;
-                } else {
-                    const errorText = await response.text();
-                    console.error('保存行时出错:', rowId, errorText);
-                    errorCount++;
+        try {
+            const response = await fetch('/api/update-batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    path: currentFile.path,
+                    tableName: currentTable,
+                    edits: edits
+                })
+            });
+
+            const result = await response.json();
+            if (response.ok) {
+                successCount = result.updated;
+                errorCount = result.failed;
+                // 只保留失败的修改，便于用户处理后重试
+                const remaining = {};
+                result.results.forEach(r => {
+                    if (r.status === 'updated') return;
+                    console.error('保存单元格时出错:', r.id, r.column, r.status);
+                    if (!remaining[r.id]) remaining[r.id] = {};
+                    remaining[r.id][r.column] = pendingChanges[r.id][r.column];
+                });
+                if (errorCount > 0) {
+                    pendingChanges = remaining;
+                    if (currentTabIndex !== -1 && tabs[currentTabIndex]) {
+                        tabs[currentTabIndex].pendingChanges = remaining;
+                    }
                 }
-            } catch (error) {
-                console.error('保存行时出错:', rowId, error);
-                errorCount++;
+            } else {
+                console.error('保存时出错:', result.error);
+                errorCount = edits.length;
             }
+        } catch (error) {
+            console.error('保存时出错:', error);
+            errorCount = edits.length;
         }
 
         if (errorCount === 0) {
@@ -221,6 +246,36 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // 扫描期间轮询后端进度，返回停止函数
+    function startScanProgressPolling() {
+        let stopped = false;
+        const timer = setInterval(async () => {
+            try {
+                const response = await fetch('/api/scan/progress');
+                const progress = await response.json();
+                if (stopped || !progress.running) return;
+
+                let text;
+                if (progress.phase === 'walking') {
+                    text = `扫描中... 已发现 ${progress.total} 个文件`;
+                } else {
+                    text = `扫描中... ${progress.done}/${progress.total}`;
+                    if (progress.current) text += ` ${progress.current}`;
+                }
+                statusDisplay.textContent = text;
+                const emptyState = fileList.querySelector('.empty-state');
+                if (emptyState) emptyState.textContent = text;
+            } catch (error) {
+                // 进度查询失败不影响扫描本身
+            }
+        }, 500);
+
+        return () => {
+            stopped = true;
+            clearInterval(timer);
+        };
+    }
+
     async function scanFolder() {
         const path = folderPathInput.value.trim();
         if (!path) return;
@@ -228,6 +283,7 @@ document.addEventListener('DOMContentLoaded', () => {
         localStorage.setItem('dgss_last_path', path);
         statusDisplay.textContent = '扫描中...';
         fileList.innerHTML = '<div class="empty-state">扫描中...</div>';
+        const stopProgressPolling = startScanProgressPolling();
 
         try {
             if (currentTab === 'geological') {
@@ -241,6 +297,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
                 if (response.ok) {
                     geologicalDataCache = data;
+                    startFolderWatchPolling(response.headers.get('X-DGSS-Watch-Seq'));
                     renderGeologicalList(data);
                     let totalItems = 0;
                     Object.values(data).forEach(category => {
@@ -262,6 +319,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
                 if (response.ok) {
                     rawFilesCache = data.files;
+                    startFolderWatchPolling(response.headers.get('X-DGSS-Watch-Seq'));
                     renderRawFileList(data.files);
                     statusDisplay.textContent = `找到 ${data.files.length} 个文件`;
                 } else {
@@ -272,7 +330,70 @@ document.addEventListener('DOMContentLoaded', () => {
         } catch (error) {
             console.error('错误:', error);
             statusDisplay.textContent = '扫描文件夹时出错';
+        } finally {
+            stopProgressPolling();
+        }
+    }
+
+    // 扫描后定时拉取后端监视到的文件夹变化，按差量更新文件列表和地质分类，不重新遍历目录
+    function startFolderWatchPolling(seq) {
+        if (seq === null) return;
+        watchSeq = parseInt(seq, 10);
+        if (watchTimer) return;
+        watchTimer = setInterval(async () => {
+            try {
+                const response = await fetch(`/api/watch/changes?since=${watchSeq}`);
+                const delta = await response.json();
+                if (delta.reset) {
+                    // 变化记录已过期（或切换了目录），只能重新扫描
+                    clearInterval(watchTimer);
+                    watchTimer = null;
+                    scanFolder();
+                    return;
+                }
+                if (delta.seq === watchSeq) return;
+                watchSeq = delta.seq;
+                applyFolderChanges(delta);
+            } catch (error) {
+                // 查询失败时下次再试
+            }
+        }, WATCH_POLL_MS);
+    }
+
+    function applyFolderChanges(delta) {
+        // 修改过的文件先移除旧条目再加入新条目
+        const replaced = new Set([...delta.removed, ...delta.files.map(file => file.path)]);
+        if (replaced.size === 0) return;
+
+        if (currentTab === 'raw' || rawFilesCache.length > 0) {
+            rawFilesCache = rawFilesCache.filter(file => !replaced.has(file.path)).concat(delta.files);
+        }
+        if (currentTab === 'geological' || Object.keys(geologicalDataCache).length > 0) {
+            Object.entries(delta.geological).forEach(([category, config]) => {
+                if (!geologicalDataCache[category]) {
+                    geologicalDataCache[category] = { icon: config.icon, en_name: config.en_name, items: [] };
+                }
+            });
+            Object.entries(geologicalDataCache).forEach(([category, config]) => {
+                const added = delta.geological[category] ? delta.geological[category].items : [];
+                config.items = (config.items || []).filter(item => !replaced.has(item.filePath)).concat(added);
+            });
         }
+
+        const activeItem = fileList.querySelector('.file-item.active');
+        const activeText = activeItem ? activeItem.textContent : null;
+        if (currentTab === 'geological') {
+            renderGeologicalList(geologicalDataCache);
+        } else {
+            renderRawFileList(rawFilesCache);
+        }
+        // 重新渲染后恢复选中项
+        if (activeText) {
+            fileList.querySelectorAll('.file-item').forEach(el => {
+                if (el.textContent === activeText) el.classList.add('active');
+            });
+        }
+        statusDisplay.textContent = `文件夹已更新：新增/修改 ${delta.files.length} 个，删除 ${delta.removed.length} 个`;
     }
 
     function renderRawFileList(files) {
@@ -437,16 +558,7 @@ document.addEventListener('DOMContentLoaded', () => {
         dataContainer.innerHTML = '<div class="placeholder-content"><p>加载中...</p></div>';
 
         try {
-            const response = await fetch('/api/data', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    path: item.filePath,
-                    tableName: item.tableName
-                })
-            });
-
-            const data = await response.json();
+            const { response, data } = await fetchTablePage(item.filePath, item.tableName, { cursor: null });
 
             if (response.ok) {
                 // 保存数据到当前标签页
@@ -528,16 +640,7 @@ document.addEventListener('DOMContentLoaded', () => {
         dataContainer.innerHTML = '<div class="placeholder-content"><p>加载中...</p></div>';
 
         try {
-            const response = await fetch('/api/data', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    path: file.path,
-                    tableName: tableName
-                })
-            });
-
-            const data = await response.json();
+            const { response, data } = await fetchTablePage(file.path, tableName, { cursor: null });
 
             if (response.ok) {
                 // 保存数据到当前标签页
@@ -558,6 +661,34 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // 服务端视图参数：排序、筛选和快速搜索
+    function viewParams(view) {
+        if (!view) return {};
+        return {
+            sort: view.sort,
+            filters: view.filters,
+            search: view.search,
+            searchColumns: view.searchColumns
+        };
+    }
+
+    // 分页读取表数据：paging 为 { cursor } (键集分页) 或 { offset }；view 为服务端排序/筛选/搜索条件
+    async function fetchTablePage(path, tableName, paging, view = null) {
+        const response = await fetch('/api/data', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                path: path,
+                tableName: tableName,
+                limit: PAGE_SIZE,
+                ...paging,
+                ...viewParams(view)
+            })
+        });
+        const data = await response.json();
+        return { response, data };
+    }
+
     function renderTableList(tables, currentTable, file, element) {
         tableListDisplay.innerHTML = '';
         if (!tables) return;
@@ -572,8 +703,53 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     function renderTable(data) {
+        const sourcePath = currentFile ? currentFile.path : null;
+
+        // 排序和搜索都交给服务端，只取回第一页
+        async function reloadView(view) {
+            if (!sourcePath) return;
+            statusDisplay.textContent = '正在查询...';
+            try {
+                const { response, data: page } = await fetchTablePage(sourcePath, data.tableName, { cursor: null }, view);
+                if (!response.ok) {
+                    statusDisplay.textContent = page.error || '查询出错';
+                    return;
+                }
+                if (currentFile === null || currentFile.path !== sourcePath) return;
+                // 未保存的修改按行 ID 覆盖到新取回的行上
+                if (page.primaryKey) {
+                    page.rows.forEach(row => {
+                        const changes = pendingChanges[row[page.primaryKey]];
+                        if (changes) Object.assign(row, changes);
+                    });
+                }
+                if (tabs[currentTabIndex]) tabs[currentTabIndex].data = page;
+                renderTable(page);
+                statusDisplay.textContent = page.view && page.total !== page.tableTotal
+                    ? `匹配 ${page.total} / ${page.tableTotal} 行`
+                    : `共 ${page.total} 行`;
+            } catch (error) {
+                console.error('查询出错:', error);
+                statusDisplay.textContent = '查询出错';
+            }
+        }
+
+        let searchTimer = null;
+        tableSearchInput.value = (data.view && data.view.search) || '';
+        tableSearchInput.oninput = () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                reloadView({
+                    ...(data.view || {}),
+                    search: tableSearchInput.value.trim(),
+                    searchColumns: data.columns
+                });
+            }, 300);
+        };
+
         if (!data.rows || data.rows.length === 0) {
-            dataContainer.innerHTML = '<div class="placeholder-content"><p>此表中没有数据</p></div>';
+            const message = data.view ? '没有符合条件的行' : '此表中没有数据';
+            dataContainer.innerHTML = `<div class="placeholder-content"><p>${message}</p></div>`;
             return;
         }
 
@@ -602,15 +778,21 @@ document.addEventListener('DOMContentLoaded', () => {
         let startHeight = 0;
         let currentRow = null;
 
-        // 排序状态
-        let sortColumn = null;
-        let sortDirection = 'asc'; // 'asc' or 'desc'
+        // 排序状态（服务端返回的当前视图）
+        const currentSort = data.view && data.view.sort && data.view.sort.length > 0 ? data.view.sort[0] : null;
+        let sortColumn = currentSort ? currentSort.column : null;
+        let sortDirection = currentSort ? currentSort.direction : 'asc'; // 'asc' or 'desc'
 
         function renderRows() {
             tbody.innerHTML = '';
+            appendRows(data.rows, 0);
+        }
+
+        function appendRows(rows, startIndex) {
             const fragment = document.createDocumentFragment();
 
-            data.rows.forEach((row, index) => {
+            rows.forEach((row, offset) => {
+                const index = startIndex + offset;
                 // Ensure each row has a unique UI ID for DOM tracking
                 if (!row._ui_id) {
                     row._ui_id = 'row_' + Date.now() + '_' + index + '_' + Math.random().toString(36).substr(2, 9);
@@ -713,30 +895,6 @@ document.addEventListener('DOMContentLoaded', () => {
             tbody.appendChild(fragment);
         }
 
-        function reorderRows() {
-            // Create a map of existing rows for O(1) lookup
-            const rowMap = new Map();
-            Array.from(tbody.children).forEach(tr => {
-                if (tr.dataset.uiId) {
-                    rowMap.set(tr.dataset.uiId, tr);
-                }
-            });
-
-            const fragment = document.createDocumentFragment();
-            data.rows.forEach(row => {
-                const tr = rowMap.get(row._ui_id);
-                if (tr) {
-                    fragment.appendChild(tr); // Moves the element
-                } else {
-                    // Fallback if row not found (shouldn't happen if logic is correct)
-                    console.warn('Row element not found for reordering, rebuilding...');
-                    renderRows();
-                    return;
-                }
-            });
-            tbody.appendChild(fragment);
-        }
-
         const headerRow = document.createElement('tr');
         data.columns.forEach((col, index) => {
             const th = document.createElement('th');
@@ -754,6 +912,9 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
             th.setAttribute('data-column-index', index);
+            if (col === sortColumn) {
+                th.classList.add(sortDirection === 'asc' ? 'sort-asc' : 'sort-desc');
+            }
 
             // Sorting
             th.addEventListener('click', (e) => {
@@ -767,32 +928,11 @@ document.addEventListener('DOMContentLoaded', () => {
                     sortDirection = 'asc';
                 }
 
-                // Update UI
-                thead.querySelectorAll('th').forEach(h => {
-                    h.classList.remove('sort-asc', 'sort-desc');
+                // 在服务端排序后重新取第一页：本地只有已加载的部分行
+                reloadView({
+                    ...(data.view || {}),
+                    sort: [{ column: col, direction: sortDirection }]
                 });
-                th.classList.add(sortDirection === 'asc' ? 'sort-asc' : 'sort-desc');
-                // Sort Data
-                data.rows.sort((a, b) => {
-                    let valA = a[col];
-                    let valB = b[col];
-
-                    // Try numeric sort
-                    const numA = parseFloat(valA);
-                    const numB = parseFloat(valB);
-                    if (!isNaN(numA) && !isNaN(numB)) {
-                        valA = numA;
-                    } else {
-                        valA = String(valA || '').toLowerCase();
-                        valB = String(valB || '').toLowerCase();
-                    }
-
-                    if (valA < valB) return sortDirection === 'asc' ? -1 : 1;
-                    if (valA > valB) return sortDirection === 'asc' ? 1 : -1;
-                    return 0;
-                });
-
-                reorderRows();
             });
 
             // Column Resizer
@@ -851,6 +991,147 @@ document.addEventListener('DOMContentLoaded', () => {
 
         renderRows();
 
+        // 滚动到底部附近时加载下一页
+        let loadingMore = false;
+
+        async function loadMoreRows() {
+            if (loadingMore || !data.hasMore || !sourcePath || !tbody.isConnected) return;
+            loadingMore = true;
+            statusDisplay.textContent = '正在加载更多数据...';
+
+            const paging = data.paging === 'keyset'
+                ? { cursor: data.nextCursor }
+                : { offset: data.nextOffset || data.rows.length };
+
+            try {
+                const { response, data: page } = await fetchTablePage(sourcePath, data.tableName, paging, data.view);
+                if (!response.ok) {
+                    statusDisplay.textContent = page.error || '加载更多数据时出错';
+                    return;
+                }
+                // 表已被切换时丢弃结果
+                if (!tbody.isConnected) return;
+
+                const startIndex = data.rows.length;
+                data.rows.push(...page.rows);
+                data.hasMore = page.hasMore;
+                data.nextCursor = page.nextCursor;
+                data.nextOffset = page.nextOffset;
+                data.total = page.total;
+                appendRows(page.rows, startIndex);
+                updateLoadMoreBar();
+                statusDisplay.textContent = `已加载 ${data.rows.length} / ${data.total} 行`;
+            } catch (error) {
+                console.error('加载更多数据时出错:', error);
+                statusDisplay.textContent = '加载更多数据时出错';
+            } finally {
+                loadingMore = false;
+            }
+        }
+
+        dataContainer.onscroll = () => {
+            if (dataContainer.scrollTop + dataContainer.clientHeight >= dataContainer.scrollHeight - 200) {
+                loadMoreRows();
+            }
+        };
+
+        // 底部加载状态栏：显示已加载行数，并提供流式"加载全部"
+        const loadMoreBar = document.createElement('div');
+        loadMoreBar.className = 'load-more-bar';
+        const loadMoreText = document.createElement('span');
+        const loadAllBtn = document.createElement('button');
+        loadAllBtn.className = 'load-all-btn';
+        loadAllBtn.textContent = '加载全部';
+        loadAllBtn.addEventListener('click', loadAllRows);
+        loadMoreBar.appendChild(loadMoreText);
+        loadMoreBar.appendChild(loadAllBtn);
+
+        function updateLoadMoreBar() {
+            loadMoreBar.style.display = data.hasMore ? 'flex' : 'none';
+            loadMoreText.textContent = `已加载 ${data.rows.length} / ${data.total} 行`;
+        }
+
+        // 以 NDJSON 流读取剩余所有行，边读边渲染
+        async function loadAllRows() {
+            if (loadingMore || !data.hasMore || !sourcePath) return;
+            loadingMore = true;
+            loadAllBtn.disabled = true;
+            statusDisplay.textContent = '正在加载全部数据...';
+
+            const paging = data.paging === 'keyset'
+                ? { cursor: data.nextCursor }
+                : { offset: data.nextOffset || data.rows.length };
+
+            try {
+                const response = await fetch('/api/data', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({
+                        path: sourcePath,
+                        tableName: data.tableName,
+                        format: 'ndjson',
+                        ...paging,
+                        ...viewParams(data.view)
+                    })
+                });
+                if (!response.ok) {
+                    const error = await response.json();
+                    throw new Error(error.error);
+                }
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let allColumns = [];
+
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    if (!tbody.isConnected) {
+                        reader.cancel();
+                        return;
+                    }
+
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+
+                    const batch = [];
+                    lines.forEach(line => {
+                        if (!line) return;
+                        const item = JSON.parse(line);
+                        if (Array.isArray(item)) {
+                            const row = {};
+                            allColumns.forEach((col, i) => { row[col] = item[i]; });
+                            batch.push(row);
+                        } else if (item.meta) {
+                            allColumns = item.meta.allColumns;
+                        } else if (item.error) {
+                            throw new Error(item.error);
+                        }
+                    });
+
+                    if (batch.length > 0) {
+                        const startIndex = data.rows.length;
+                        data.rows.push(...batch);
+                        appendRows(batch, startIndex);
+                        statusDisplay.textContent = `已加载 ${data.rows.length} / ${data.total} 行`;
+                    }
+                }
+
+                data.hasMore = false;
+                data.total = data.rows.length;
+                statusDisplay.textContent = `已加载全部 ${data.rows.length} 行`;
+            } catch (error) {
+                console.error('加载全部数据时出错:', error);
+                statusDisplay.textContent = '加载全部数据时出错';
+            } finally {
+                loadingMore = false;
+                loadAllBtn.disabled = false;
+                updateLoadMoreBar();
+            }
+        }
+
         // Row Resizing Global Listeners
         document.addEventListener('mousemove', (e) => {
             if (!isResizingRow || !currentRow) return;
@@ -898,6 +1179,19 @@ document.addEventListener('DOMContentLoaded', () => {
             cell.focus();
         }
 
+        function recordCellChange(cell, value, directRowId) {
+            const row = cell.parentElement;
+            const rId = directRowId || row.dataset.rowId; // Correct ID retrieval
+            const col = cell.getAttribute('data-column');
+
+            cell.textContent = value;
+            if (!pendingChanges[rId]) pendingChanges[rId] = {};
+            pendingChanges[rId][col] = value;
+            cell.classList.add('modified');
+            saveBtn.classList.add('visible');
+            statusDisplay.textContent = '有未保存的更改...';
+        }
+
         function enterEditMode(cell, directRowId, selectAll = true) {
             if (cell.getAttribute('data-column') === 'GeoID') return;
             cell.contentEditable = true;
@@ -921,15 +1215,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 cell.removeEventListener('keydown', keyHandler);
 
                 if (cell.textContent !== originalText) {
-                    const row = cell.parentElement;
-                    const rId = directRowId || row.dataset.rowId; // Correct ID retrieval
-                    const col = cell.getAttribute('data-column');
-
-                    if (!pendingChanges[rId]) pendingChanges[rId] = {};
-                    pendingChanges[rId][col] = cell.textContent;
-                    cell.classList.add('modified');
-                    saveBtn.classList.add('visible');
-                    statusDisplay.textContent = '有未保存的更改...';
+                    recordCellChange(cell, cell.textContent, directRowId);
                 }
             };
 
@@ -997,13 +1283,8 @@ document.addEventListener('DOMContentLoaded', () => {
             if (e.key === 'Delete' || e.key === 'Backspace') {
                 if (!lastSelected.isContentEditable) {
                     selectedCells.forEach(cell => {
-                        if (cell.getAttribute('data-column') !== 'GeoID') {
-                            // Trigger edit logic to save change
-                            const originalText = cell.textContent;
-                            cell.textContent = '';
-                            // Manually trigger update logic
-                            enterEditMode(cell);
-                            cell.blur(); // Commit immediately
+                        if (cell.getAttribute('data-column') !== 'GeoID' && cell.textContent !== '') {
+                            recordCellChange(cell, '');
                         }
                     });
                 }
@@ -1042,14 +1323,33 @@ document.addEventListener('DOMContentLoaded', () => {
                 e.preventDefault();
                 navigator.clipboard.readText().then(text => {
                     if (!text) return;
-                    // Simple paste to single cell or first cell of selection
-                    const targetCell = selectedCells[0];
-                    if (targetCell.getAttribute('data-column') !== 'GeoID') {
-                        enterEditMode(targetCell);
-                        targetCell.textContent = text; // This might need more complex logic for multi-cell paste
-                        targetCell.blur();
-                        showToast('已粘贴');
+                    // 按 Tab / 换行拆成二维区域（与复制格式一致），去掉末尾空行
+                    const grid = text.replace(/\r/g, '').replace(/\n$/, '').split('\n').map(line => line.split('\t'));
+                    let pasted = 0;
+
+                    const pasteInto = (cell, value) => {
+                        if (!cell || cell.getAttribute('data-column') === 'GeoID') return;
+                        if (cell.textContent === value) return;
+                        recordCellChange(cell, value);
+                        pasted++;
+                    };
+
+                    if (grid.length === 1 && grid[0].length === 1) {
+                        // 单个值：填充到所有选中的单元格
+                        selectedCells.forEach(cell => pasteInto(cell, grid[0][0]));
+                    } else {
+                        // 多行多列：从第一个选中单元格开始铺开
+                        const firstCell = selectedCells[0];
+                        const bodyRows = Array.from(tbody.children);
+                        const startRow = bodyRows.indexOf(firstCell.parentElement);
+                        const startCol = Array.from(firstCell.parentElement.children).indexOf(firstCell);
+                        grid.forEach((values, r) => {
+                            const tr = bodyRows[startRow + r];
+                            if (!tr) return;
+                            values.forEach((value, c) => pasteInto(tr.children[startCol + c], value));
+                        });
                     }
+                    if (pasted > 0) showToast(`已粘贴 ${pasted} 个单元格`);
                 });
                 return;
             }
@@ -1097,6 +1397,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
         dataContainer.appendChild(table);
         dataContainer.appendChild(selectionRange);
+        dataContainer.appendChild(loadMoreBar);
+        updateLoadMoreBar();
     }
 
     function showToast(message) {
@@ -0,0 +1,181 @@
+"""
+表元数据缓存
+按 (文件, 表) 缓存 PRAGMA table_info 的结果：字段名（实际大小写）、声明类型、类型亲和性和主键，
+文件修改时间变化后自动失效。修改数据前据此把 ID 和值一次性转换为字段的存储类型，
+不必在 UPDATE 影响 0 行后再换类型重试。
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# 缓存的 (文件, 表) 数量上限
+TABLE_META_MAX = int(os.environ.get('DGSS_TABLE_META_MAX', '4096'))
+
+# 没有定义主键时按这些常见字段名推断（DGSS 数据常用 ROUTECODE、GEOPOINT 等作为标识）
+FALLBACK_KEY_NAMES = ('ROUTECODE', 'GEOPOINT', 'GUID', 'GEOLABEL', 'ID', '_ID', 'GEOID', 'CODE')
+
+_INT_RE = re.compile(r'^[+-]?\d+$')
+
+
+def detect_primary_key(columns_info):
+    """从 PRAGMA table_info 的结果中确定主键列名，找不到返回 None"""
+    # 1. Check for defined primary key
+    for col_info in columns_info:
+        if col_info[5] == 1:
+            return col_info[1]
+
+    # 2. Check for common ID names
+    for col_info in columns_info:
+        if col_info[1].upper() in FALLBACK_KEY_NAMES:
+            return col_info[1]
+
+    return None
+
+
+def type_affinity(declared_type):
+    """按 SQLite 规则（datatype3 §3.1）由声明类型得到类型亲和性"""
+    declared = (declared_type or '').upper()
+    if 'INT' in declared:
+        return 'INTEGER'
+    if 'CHAR' in declared or 'CLOB' in declared or 'TEXT' in declared:
+        return 'TEXT'
+    if not declared or 'BLOB' in declared:
+        return 'BLOB'
+    if 'REAL' in declared or 'FLOA' in declared or 'DOUB' in declared:
+        return 'REAL'
+    return 'NUMERIC'
+
+
+def coerce_value(value, affinity):
+    """
+    把前端传来的值（表格编辑得到的一律是字符串）转换为字段的存储类型。
+    无法转换时原样返回，由 SQLite 按亲和性处理。
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    if affinity in ('INTEGER', 'NUMERIC', 'REAL') and isinstance(value, str):
+        text = value.strip()
+        if affinity != 'REAL' and _INT_RE.match(text):
+            return int(text)
+        try:
+            return float(text)
+        except ValueError:
+            return value
+    if affinity == 'TEXT' and isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+class TableMetaCache:
+    def __init__(self, connect, max_entries=TABLE_META_MAX):
+        """connect: 以只读方式打开数据文件的函数（连接池）"""
+        self.connect = connect
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (path, table) -> (mtime_ns, meta)
+        self._entries = OrderedDict()
+
+    def get(self, file_path, table_name):
+        """
+        返回表的元数据，表不存在时返回 None：
+        {'table', 'columns', 'types', 'affinity', 'primary_key', 'pk_storage'}
+        """
+        key = (os.path.abspath(file_path), table_name)
+        mtime_ns = os.stat(file_path).st_mtime_ns
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] == mtime_ns:
+                self._entries.move_to_end(key)
+                return cached[1]
+
+        meta = self._load(file_path, table_name)
+        with self._lock:
+            self._entries[key] = (mtime_ns, meta)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return meta
+
+    def _load(self, file_path, table_name):
+        conn = self.connect(file_path)
+        try:
+            columns_info = [tuple(row) for row in conn.execute(f"PRAGMA table_info({table_name})")]
+            if not columns_info:
+                return None
+            primary_key = detect_primary_key(columns_info)
+            meta = {
+                'table': table_name,
+                'columns': [info[1] for info in columns_info],
+                'types': {info[1]: info[2] for info in columns_info},
+                'affinity': {info[1]: type_affinity(info[2]) for info in columns_info},
+                'primary_key': primary_key,
+                'pk_storage': None
+            }
+            if primary_key and meta['affinity'][primary_key] == 'BLOB':
+                # 未声明类型的字段不做类型转换，按库中实际存储的类型转换 ID
+                row = conn.execute(f"SELECT typeof({primary_key}) FROM {table_name} "
+                                   f"WHERE {primary_key} IS NOT NULL LIMIT 1").fetchone()
+                meta['pk_storage'] = row[0] if row else None
+            return meta
+        finally:
+            conn.close()
+
+    def touch(self, file_path):
+        """
+        本程序自己修改数据（不改表结构）后调用：记录新的修改时间，
+        避免下一次编辑因为自己的写入而重新读取元数据。
+        """
+        path = os.path.abspath(file_path)
+        try:
+            mtime_ns = os.stat(file_path).st_mtime_ns
+        except OSError:
+            return
+        with self._lock:
+            for key, (_, meta) in list(self._entries.items()):
+                if key[0] == path:
+                    self._entries[key] = (mtime_ns, meta)
+
+    def invalidate(self, file_path=None):
+        with self._lock:
+            if file_path is None:
+                self._entries.clear()
+                return
+            path = os.path.abspath(file_path)
+            for key in [k for k in self._entries if k[0] == path]:
+                del self._entries[key]
+
+
+def column_name(meta, name):
+    """按实际大小写返回字段名（SQLite 字段名不区分大小写），不存在返回 None"""
+    if name in meta['types']:
+        return name
+    lowered = str(name).lower()
+    for col in meta['columns']:
+        if col.lower() == lowered:
+            return col
+    return None
+
+
+def coerce_id(meta, row_id):
+    """把主键取值转换为库中的存储类型"""
+    pk = meta['primary_key']
+    affinity = meta['affinity'][pk]
+    if affinity == 'BLOB':
+        affinity = {'integer': 'INTEGER', 'real': 'REAL', 'text': 'TEXT'}.get(meta['pk_storage'], 'BLOB')
+    return coerce_value(row_id, affinity)
+
+
+def coerce_updates(meta, updates):
+    """
+    把 {字段: 值} 转换为实际大小写的字段名和存储类型的值。
+    有不存在的字段时抛出 KeyError。
+    """
+    result = {}
+    for name, value in updates.items():
+        col = column_name(meta, name)
+        if col is None:
+            raise KeyError(name)
+        result[col] = coerce_value(value, meta['affinity'][col])
+    return result
@@ -0,0 +1,230 @@
+"""
+表视图查询
+把 /api/data 的排序（sort）、筛选（filters）和快速搜索（search）参数编译为参数化的 WHERE / ORDER BY：
+字段名按表元数据校验后加引号，值按字段类型转换后作为参数传入，不拼接进 SQL。
+经常排序的列（如 ROUTECODE、GEOPOINT）在只读连接上建立临时排序索引
+（TEMP 表 + 索引，不修改数据文件本身），之后的排序和翻页按索引顺序读取，不必每页全表排序。
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+
+from metrics import log_event
+from table_meta import column_name, coerce_value
+
+# DGSS_AUTO_INDEX=0 关闭临时排序索引
+AUTO_INDEX_ENABLED = os.environ.get('DGSS_AUTO_INDEX', '1') != '0'
+# 行数少于该值的表直接排序即可，不建索引
+AUTO_INDEX_MIN_ROWS = int(os.environ.get('DGSS_AUTO_INDEX_MIN_ROWS', '5000'))
+# 同一 (文件, 表, 列) 第几次排序请求（翻页也算）时建索引
+AUTO_INDEX_AFTER = int(os.environ.get('DGSS_AUTO_INDEX_AFTER', '2'))
+
+# 筛选条件中 IN 列表的最大长度（SQLite 默认变量上限 999）
+MAX_IN_VALUES = 500
+
+_COMPARE_OPS = {'=': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _like_pattern(text, prefix_only=False):
+    escaped = str(text).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%' if prefix_only else '%' + escaped + '%'
+
+
+def _require_column(meta, name):
+    col = column_name(meta, name) if name is not None else None
+    if col is None:
+        raise ValueError(f"Unknown column: {name}")
+    return col
+
+
+def parse_sort(meta, sort):
+    """sort 为 {"column", "direction"}、字段名或它们的列表，返回 [(字段, 'ASC'/'DESC')]"""
+    if not sort:
+        return []
+    items = sort if isinstance(sort, list) else [sort]
+    result = []
+    for item in items:
+        if isinstance(item, str):
+            item = {'column': item}
+        if not isinstance(item, dict):
+            raise ValueError(f"Invalid sort: {item}")
+        direction = str(item.get('direction') or 'asc').upper()
+        if direction not in ('ASC', 'DESC'):
+            raise ValueError(f"Invalid sort direction: {item.get('direction')}")
+        result.append((_require_column(meta, item.get('column')), direction))
+    return result
+
+
+def compile_filter(meta, item):
+    """{"column", "op", "value"} -> (SQL 片段, 参数列表)，字段引用带表别名 t"""
+    if not isinstance(item, dict):
+        raise ValueError(f"Invalid filter: {item}")
+    col = _require_column(meta, item.get('column'))
+    ref = 't.' + quote_identifier(col)
+    op = str(item.get('op') or '=').lower()
+    value = item.get('value')
+    affinity = meta['affinity'].get(col)
+
+    if op in _COMPARE_OPS:
+        if value is None:
+            raise ValueError(f"Filter on {col} needs a value")
+        if affinity == 'BLOB' and op not in ('=', '!='):
+            # 未声明类型的字段不转换参数，字符串 '5' 与库中的数字比较时总是更大；
+            # 范围比较按数值进行（看起来不像数字的值原样保留）
+            affinity = 'NUMERIC'
+        return f"{ref} {_COMPARE_OPS[op]} ?", [coerce_value(value, affinity)]
+    if op in ('contains', 'startswith'):
+        return f"{ref} LIKE ? ESCAPE '\\'", [_like_pattern(value if value is not None else '', op == 'startswith')]
+    if op == 'in':
+        values = value if isinstance(value, list) else [value]
+        if not values or len(values) > MAX_IN_VALUES:
+            raise ValueError(f"Filter on {col} needs 1-{MAX_IN_VALUES} values")
+        return f"{ref} IN ({', '.join('?' for _ in values)})", [coerce_value(v, affinity) for v in values]
+    if op == 'isnull':
+        return f"({ref} IS NULL OR {ref} = '')", []
+    if op == 'notnull':
+        return f"({ref} IS NOT NULL AND {ref} != '')", []
+    raise ValueError(f"Unknown filter operator: {item.get('op')}")
+
+
+def compile_view(meta, body):
+    """
+    由请求参数生成视图：{'sort', 'where', 'params', 'echo'}；没有排序、筛选和搜索时返回 None。
+    - sort: {"column": "GEOPOINT", "direction": "desc"} 或其列表
+    - filters: [{"column": "LITHO", "op": "contains", "value": "花岗"}, ...]，
+      op 为 = != < <= > >= contains startswith in isnull notnull（isnull 同时匹配空字符串）
+    - search: 在 searchColumns（默认所有字段）中模糊匹配的文字
+    字段名不存在或参数无效时抛出 ValueError。
+    """
+    sort = parse_sort(meta, body.get('sort'))
+    filters = body.get('filters') or []
+    if not isinstance(filters, list):
+        filters = [filters]
+    search = str(body.get('search') or '').strip()
+    if not (sort or filters or search):
+        return None
+
+    clauses, params = [], []
+    for item in filters:
+        sql, values = compile_filter(meta, item)
+        clauses.append(sql)
+        params.extend(values)
+    search_columns = []
+    if search:
+        requested = body.get('searchColumns') or meta['columns']
+        search_columns = [_require_column(meta, name) for name in requested]
+        pattern = _like_pattern(search)
+        clauses.append('(' + ' OR '.join(f"t.{quote_identifier(col)} LIKE ? ESCAPE '\\'"
+                                         for col in search_columns) + ')')
+        params.extend([pattern] * len(search_columns))
+
+    return {
+        'sort': sort,
+        'where': ' AND '.join(clauses),
+        'params': params,
+        'echo': {
+            'sort': [{'column': col, 'direction': direction.lower()} for col, direction in sort],
+            'filters': filters,
+            'search': search,
+            'searchColumns': search_columns
+        }
+    }
+
+
+def count_query(table_name, view):
+    sql = f"SELECT COUNT(*) FROM {quote_identifier(table_name)} AS t"
+    if view['where']:
+        sql += f" WHERE {view['where']}"
+    return sql, list(view['params'])
+
+
+def view_query(table_name, view, sort_table=None, rowid=True):
+    """
+    视图的 SELECT 语句（不含 LIMIT），结果列与 SELECT * 相同。
+    排序时以 rowid 打破平局，使 OFFSET 翻页的顺序稳定；sort_table 为临时排序索引表名。
+    文字比较不区分大小写（与原来前端的排序一致）。
+    """
+    if sort_table:
+        sql = (f"SELECT t.* FROM temp.{quote_identifier(sort_table)} AS s "
+               f"CROSS JOIN {quote_identifier(table_name)} AS t ON t.rowid = s.rid")
+    else:
+        sql = f"SELECT t.* FROM {quote_identifier(table_name)} AS t"
+    if view['where']:
+        sql += f" WHERE {view['where']}"
+    if view['sort']:
+        if sort_table:
+            direction = view['sort'][0][1]
+            order = [f"s.k COLLATE NOCASE {direction}", f"s.rid {direction}"]
+        else:
+            order = [f"t.{quote_identifier(col)} COLLATE NOCASE {direction}" for col, direction in view['sort']]
+            if rowid:
+                order.append(f"t.rowid {view['sort'][-1][1]}")
+        sql += " ORDER BY " + ", ".join(order)
+    return sql, list(view['params'])
+
+
+class SortIndexer:
+    """
+    统计每个 (文件, 表, 列) 的排序请求次数，达到阈值后在当前连接上建立临时排序索引：
+    TEMP 表 (k=列值, rid=rowid) 加 (k COLLATE NOCASE, rid) 索引。
+    临时表随连接存在（连接池复用连接，文件被替换时连接重开），
+    并记录建立时的 PRAGMA data_version，其他连接写入后自动重建。
+    只应在只读连接上使用：本连接自己的写入不会改变 data_version。
+    """
+
+    def __init__(self, enabled=AUTO_INDEX_ENABLED, min_rows=AUTO_INDEX_MIN_ROWS, after=AUTO_INDEX_AFTER):
+        self.enabled = enabled
+        self.min_rows = min_rows
+        self.after = after
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def sort_table(self, conn, file_path, table_name, view, total):
+        """
+        返回可用于 view_query 的临时排序表名；不需要或无法建立时返回 None。
+        只用于单列排序且没有筛选/搜索的视图：有筛选时结果通常很少，直接排序比沿索引逐行过滤更快。
+        """
+        if (not self.enabled or not view or len(view['sort']) != 1 or view['where']
+                or total < self.min_rows):
+            return None
+        column = view['sort'][0][0]
+        key = (file_path, table_name, column)
+        with self._lock:
+            if len(self._hits) > 10000:
+                self._hits.clear()
+            hits = self._hits[key] = self._hits.get(key, 0) + 1
+        if hits < self.after:
+            return None
+
+        name = 'dgss_sort_' + hashlib.md5(f"{table_name}\0{column}".encode('utf-8')).hexdigest()[:16]
+        try:
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS dgss_sort_meta "
+                         "(name TEXT PRIMARY KEY, data_version INTEGER)")
+            row = conn.execute("SELECT data_version FROM temp.dgss_sort_meta WHERE name = ?", (name,)).fetchone()
+            if row and row[0] == version:
+                return name
+            start = time.perf_counter()
+            with conn:
+                conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+                conn.execute(f"CREATE TEMP TABLE {name} (k, rid INTEGER)")
+                conn.execute(f"INSERT INTO temp.{name} (k, rid) "
+                             f"SELECT {quote_identifier(column)}, rowid FROM main.{quote_identifier(table_name)}")
+                conn.execute(f"CREATE INDEX temp.{name}_k ON {name} (k COLLATE NOCASE, rid)")
+                conn.execute("INSERT OR REPLACE INTO temp.dgss_sort_meta (name, data_version) VALUES (?, ?)",
+                             (name, version))
+            log_event(logging.INFO, 'sort_index_built', file=file_path, table=table_name, column=column,
+                      ms=round((time.perf_counter() - start) * 1000))
+            return name
+        except Exception as e:
+            # WITHOUT ROWID 表、临时目录不可写等情况：直接排序
+            log_event(logging.INFO, 'sort_index_unavailable', file=file_path, table=table_name, column=column,
+                      error=str(e))
+            return None
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# 测试使用独立的数据目录，不监视文件夹，不连接本机的 Ollama
+_DATA_DIR = tempfile.mkdtemp(prefix='dgss-test-')
+os.environ.setdefault('DGSS_DATA_DIR', _DATA_DIR)
+os.environ.setdefault('DGSS_WATCH', '0')
+os.environ.setdefault('DGSS_OLLAMA_URL', 'http://127.0.0.1:9')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,29 @@
+from action_plan import ActionPlanScanner
+
+PLAN = '{"thought": "查找", "actions": [{"type": "SEARCH", "table": "GeoArea", "filter": {"LITHO": "花岗岩"}}]}'
+
+
+def feed_all(text, chunk=3):
+    scanner = ActionPlanScanner()
+    plans = []
+    for start in range(0, len(text), chunk):
+        plans.extend(scanner.feed(text[start:start + chunk]))
+    return plans, scanner.finish()
+
+
+def test_plan_after_prose():
+    plans, rest = feed_all("好的，我来查找。" + PLAN + " 稍等。")
+    assert [p['actions'][0]['type'] for p in plans] == ['SEARCH']
+    assert rest == []
+
+
+def test_plan_after_unmatched_brace():
+    # 说明文字中多出的 '{' 不能挡住后面的计划
+    plans, rest = feed_all("set {a, b ... " + PLAN)
+    assert plans == []
+    assert [p['actions'][0]['table'] for p in rest] == ['GeoArea']
+
+
+def test_plan_after_closed_invalid_object():
+    plans, rest = feed_all("字段 {a, b} 中 {x " + PLAN + "}")
+    assert [p['actions'][0]['filter'] for p in plans + rest] == [{'LITHO': '花岗岩'}]
@@ -0,0 +1,65 @@
+import json
+import sqlite3
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def make_table(path, without_rowid=False):
+    conn = sqlite3.connect(str(path))
+    if without_rowid:
+        conn.execute("CREATE TABLE GeoArea (GEOPOINT TEXT PRIMARY KEY, NAME TEXT) WITHOUT ROWID")
+        rows = [(f"D{i:04d}", f"点{i}") for i in range(7)]
+    else:
+        # ROUTECODE 被当作主键，但在 DGSS 表中并不唯一
+        conn.execute("CREATE TABLE GeoArea (ROUTECODE TEXT, NAME TEXT)")
+        rows = [('R2', 'a'), ('R1', 'b'), ('R2', 'c'), (None, 'd'), ('R1', 'e'), ('R2', 'f'), (None, 'g')]
+    conn.executemany("INSERT INTO GeoArea VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def test_keyset_paging_across_duplicate_keys(client, tmp_path):
+    path = make_table(tmp_path / 'route.db')
+    names, page_cursor, pages = [], None, 0
+    while True:
+        data = client.post('/api/data', json={'path': path, 'cursor': page_cursor, 'limit': 2}).get_json()
+        assert data['paging'] == 'keyset'
+        assert data['primaryKey'] == 'ROUTECODE'
+        names += [row['NAME'] for row in data['rows']]
+        pages += 1
+        if not data['hasMore']:
+            break
+        page_cursor = data['nextCursor']
+    # 同一主键值跨页时既不重复也不遗漏，按 (主键, rowid) 排序
+    assert names == ['d', 'g', 'b', 'e', 'a', 'c', 'f']
+    assert pages == 4
+
+
+def test_without_rowid_table_falls_back_to_offset(client, tmp_path):
+    path = make_table(tmp_path / 'norowid.db', without_rowid=True)
+    data = client.post('/api/data', json={'path': path, 'cursor': None, 'limit': 5}).get_json()
+    assert data['paging'] == 'offset'
+    assert [row['GEOPOINT'] for row in data['rows']] == [f"D{i:04d}" for i in range(5)]
+
+    # 流式导出与分页使用同一策略，不会在输出中途出错
+    response = client.post('/api/data', json={'path': path, 'cursor': None, 'format': 'ndjson'})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0]['meta']['paging'] == 'offset'
+    assert [values[0] for values in lines[1:-1]] == [f"D{i:04d}" for i in range(7)]
+    assert lines[-1] == {'done': True, 'count': 7}
+
+
+def test_stream_keyset_rows_match_pages(client, tmp_path):
+    path = make_table(tmp_path / 'route.db')
+    response = client.post('/api/data', json={'path': path, 'cursor': None, 'format': 'ndjson'})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0]['meta']['paging'] == 'keyset'
+    assert [values[1] for values in lines[1:-1]] == ['d', 'g', 'b', 'e', 'a', 'c', 'f']
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+
+from db_pool import ConnectionPool
+
+
+def make_db(path):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE GeoArea (ROUTECODE TEXT)")
+    conn.execute("INSERT INTO GeoArea VALUES ('R001')")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def raw(conn):
+    return conn._conn
+
+
+def test_released_connection_is_reused(tmp_path):
+    path = make_db(tmp_path / 'R001.db')
+    pool = ConnectionPool(max_handles=4)
+    first = pool.acquire(path, readonly=True)
+    handle = raw(first)
+    first.close()
+    first.close()  # 重复 close 不会重复归还
+    second = pool.acquire(path, readonly=True)
+    assert raw(second) is handle
+    assert pool.stats()['open'] == 1
+    second.close()
+
+
+def test_mtime_change_reopens_connection(tmp_path):
+    path = make_db(tmp_path / 'R001.db')
+    pool = ConnectionPool(max_handles=4)
+    conn = pool.acquire(path, readonly=True)
+    handle = raw(conn)
+    conn.close()
+
+    # 平板同步覆盖了文件：修改时间变化后旧句柄作废
+    writer = sqlite3.connect(path)
+    writer.execute("INSERT INTO GeoArea VALUES ('R002')")
+    writer.commit()
+    writer.close()
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    conn = pool.acquire(path, readonly=True)
+    assert raw(conn) is not handle
+    assert conn.execute("SELECT COUNT(*) FROM GeoArea").fetchone()[0] == 2
+    assert pool.stats()['open'] == 1
+    conn.close()
+
+
+def test_own_writes_keep_connection(tmp_path):
+    path = make_db(tmp_path / 'R001.db')
+    pool = ConnectionPool(max_handles=4)
+    conn = pool.acquire(path)
+    handle = raw(conn)
+    conn.execute("INSERT INTO GeoArea VALUES ('R003')")
+    conn.commit()
+    conn.close()
+    conn = pool.acquire(path)
+    assert raw(conn) is handle
+    conn.close()
+
+
+def test_invalidate_and_handle_limit(tmp_path):
+    paths = [make_db(tmp_path / f"R{i:03d}.db") for i in range(3)]
+    pool = ConnectionPool(max_handles=2)
+    for path in paths:
+        pool.acquire(path, readonly=True).close()
+    # 超出上限时淘汰最久未使用的空闲句柄
+    assert pool.stats() == {'open': 2, 'idle': 2, 'max': 2}
+    pool.invalidate(paths[2])
+    assert pool.stats()['open'] == 1
@@ -0,0 +1,34 @@
+from geological_classifier import GeologicalClassifier
+
+CATEGORIES = {
+    '地质点': {
+        'icon': 'p',
+        'en_name': 'Points',
+        'rules': [
+            {'file_pattern': 'Gpoint.ta', 'table': 'GeoArea', 'description': '地质点图层'},
+            {'file_pattern': '*.ta', 'table': 'GeoArea', 'description': '任意点图层'},
+        ]
+    }
+}
+
+
+def classify(files):
+    return GeologicalClassifier(CATEGORIES).classify(files)
+
+
+def file_info(name):
+    return {'name': name, 'relative_path': f"R001/{name}", 'full_path': f"/p/R001/{name}",
+            'tables': {'GeoArea': {'columns': ['ROUTECODE', 'GEOPOINT']}}}
+
+
+def test_duplicate_matches_keep_the_first_rule():
+    items = classify([file_info('Gpoint.ta')])['地质点']['items']
+    assert [(item['fileName'], item['description']) for item in items] == [('R001/Gpoint.ta', '地质点图层')]
+
+
+def test_items_follow_rule_then_file_order():
+    items = classify([file_info('Photo.ta'), file_info('Gpoint.ta')])['地质点']['items']
+    assert [(item['fileName'], item['description']) for item in items] == [
+        ('R001/Gpoint.ta', '地质点图层'),
+        ('R001/Photo.ta', '任意点图层'),
+    ]
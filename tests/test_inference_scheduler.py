@@ -0,0 +1,43 @@
+from inference_scheduler import InferenceScheduler
+
+
+def test_priority_then_arrival_order():
+    scheduler = InferenceScheduler(max_concurrent=1)
+    running = scheduler.enqueue(priority=1)
+    assert running.granted
+    first_new = scheduler.enqueue(priority=1)
+    second_new = scheduler.enqueue(priority=1)
+    follow_up = scheduler.enqueue(priority=0)
+    # 追问（priority=0）排在先到的新问题前面
+    assert [t.position() for t in (follow_up, first_new, second_new)] == [1, 2, 3]
+
+    running.release()
+    assert follow_up.granted and not first_new.granted
+    follow_up.release()
+    assert first_new.granted
+    first_new.release()
+    assert second_new.granted
+    second_new.release()
+    assert scheduler.stats() == {'active': 0, 'queued': 0, 'max': 1}
+
+
+def test_cancelled_ticket_leaves_queue():
+    scheduler = InferenceScheduler(max_concurrent=1)
+    running = scheduler.enqueue()
+    waiting = scheduler.enqueue()
+    cancelled = scheduler.enqueue()
+    cancelled.release()
+    cancelled.release()
+    assert scheduler.stats()['queued'] == 1
+    assert not waiting.wait(timeout=0.01)
+    running.release()
+    assert waiting.wait(timeout=0.01)
+    waiting.release()
+    assert scheduler.stats()['active'] == 0
+
+
+def test_concurrency_limit():
+    scheduler = InferenceScheduler(max_concurrent=2)
+    tickets = [scheduler.enqueue() for _ in range(3)]
+    assert [t.granted for t in tickets] == [True, True, False]
+    assert tickets[2].position() == 1
@@ -0,0 +1,54 @@
+import os
+import sqlite3
+
+import pytest
+
+import app
+from point_index import PointIndex
+from schema_catalog import introspect_file
+
+
+def make_file(path, table, columns, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute(f"CREATE TABLE {table} ({', '.join(columns)})")
+    conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' for _ in columns)})", rows)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    # 两条路线的点号都从 D00001 开始编，D00006 在两条路线中是不同的点
+    root = str(tmp_path)
+    files = [
+        make_file(os.path.join(root, 'L0002', 'L0002.db'), 'GPOINT', ['GEOPOINT', 'NOTE'],
+                  [('D00006', 'L0002 描述')]),
+        make_file(os.path.join(root, 'L0002', 'Gpoint.ta'), 'Gpoint', ['ROUTECODE', 'GEOPOINT', 'NOTE'],
+                  [('L0002', 'D00006', 'L0002 点')]),
+        make_file(os.path.join(root, 'L0003', 'L0003.db'), 'GPOINT', ['GEOPOINT', 'NOTE'],
+                  [('D00006', 'L0003 描述')]),
+        make_file(os.path.join(root, 'L0003', 'Gpoint.ta'), 'Gpoint', ['ROUTECODE', 'GEOPOINT', 'NOTE'],
+                  [('L0003', 'D00006', 'L0003 点')]),
+    ]
+    index = PointIndex(os.path.join(root, 'points.sqlite'),
+                       connect=lambda path: app.get_db_connection(path, readonly=True))
+    assert index.update([introspect_file(path) for path in files]) == len(files)
+    monkeypatch.setattr(app, 'POINT_INDEX', index)
+    monkeypatch.setattr(app, 'GLOBAL_DB_FILES', files)
+    return files
+
+
+def notes(context):
+    return sorted(row['NOTE'] for rows in context.values() for row in rows)
+
+
+def test_point_without_route_stays_in_current_route(project):
+    context = app.get_context_data(project[0], None, 'D00006')
+    assert notes(context) == ['L0002 描述', 'L0002 点']
+
+
+def test_point_with_route_matches_route_rows(project):
+    context = app.get_context_data(project[0], 'L0003', 'D00006')
+    assert notes(context) == ['L0002 描述', 'L0003 描述', 'L0003 点']
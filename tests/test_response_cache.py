@@ -0,0 +1,35 @@
+from response_cache import ResponseCache, cache_key
+
+
+def test_key_normalizes_instruction_but_not_data():
+    base = cache_key('qwen', '找出所有花岗岩？', {'GeoArea': [{'LITHO': '花岗岩'}]}, 'schema')
+    assert cache_key('qwen', ' 找出所有花岗岩 ', {'GeoArea': [{'LITHO': '花岗岩'}]}, 'schema') == base
+    assert cache_key('qwen', '找出所有花岗岩', {'GeoArea': [{'LITHO': '砂岩'}]}, 'schema') != base
+    assert cache_key('qwen', '找出所有花岗岩', {'GeoArea': [{'LITHO': '花岗岩'}]}, 'schema2') != base
+    assert cache_key('llama', '找出所有花岗岩', {'GeoArea': [{'LITHO': '花岗岩'}]}, 'schema') != base
+
+
+def test_memory_hit_and_lru_expiry():
+    cache = ResponseCache(max_items=2, disk_path=None)
+    cache.put('a', 'm', ['好', '的'], context=[1, 2])
+    cache.put('b', 'm', ['b'])
+    assert cache.get('a') == {'tokens': ['好', '的'], 'context': [1, 2]}
+    cache.put('c', 'm', ['c'])
+    # b 最久未使用，被淘汰
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_disk_store_survives_restart_and_trims_by_size(tmp_path):
+    path = str(tmp_path / 'responses.sqlite')
+    cache = ResponseCache(max_items=8, disk_path=path, disk_max_bytes=10_000)
+    cache.put('a', 'm', ['花岗岩'] * 10, context=[7])
+    restarted = ResponseCache(max_items=8, disk_path=path, disk_max_bytes=10_000)
+    assert restarted.get('a') == {'tokens': ['花岗岩'] * 10, 'context': [7]}
+
+    # 超出大小上限时删除最久未使用的记录
+    small = ResponseCache(max_items=8, disk_path=path, disk_max_bytes=400)
+    small.put('big', 'm', ['x' * 300])
+    fresh = ResponseCache(max_items=8, disk_path=path, disk_max_bytes=400)
+    assert fresh.get('a') is None
+    assert fresh.get('big') is not None
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+
+import schema_catalog
+from schema_catalog import SchemaCatalog
+
+INSPECT = schema_catalog.inspect_database_structure
+
+
+def make_db(path, columns='ROUTECODE TEXT, GEOPOINT TEXT'):
+    conn = sqlite3.connect(str(path))
+    conn.execute(f"CREATE TABLE GeoArea ({columns})")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def counting_inspect(monkeypatch, fail=False):
+    calls = []
+    def inspect(path):
+        calls.append(path)
+        if fail:
+            raise sqlite3.OperationalError('database is locked')
+        return INSPECT(path)
+
+    monkeypatch.setattr(schema_catalog, 'inspect_database_structure', inspect)
+    return calls
+
+
+def test_unchanged_files_are_reused(tmp_path, monkeypatch):
+    path = make_db(tmp_path / 'R001.db')
+    catalog = SchemaCatalog(str(tmp_path / 'catalog.sqlite'))
+    calls = counting_inspect(monkeypatch)
+
+    first = catalog.refresh([path])
+    assert first[0]['tables']['GeoArea']['columns']
+    # 重新创建目录对象（相当于服务重启），(size, mtime) 未变时不再打开文件
+    catalog = SchemaCatalog(str(tmp_path / 'catalog.sqlite'))
+    assert catalog.refresh([path]) == first
+    assert calls == [path]
+
+
+def test_changed_files_are_reintrospected(tmp_path, monkeypatch):
+    path = make_db(tmp_path / 'R001.db')
+    catalog = SchemaCatalog(str(tmp_path / 'catalog.sqlite'))
+    calls = counting_inspect(monkeypatch)
+    catalog.refresh([path])
+
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Photo (CODE TEXT)")
+    conn.commit()
+    conn.close()
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    entry = catalog.refresh([path])[0]
+    assert set(entry['tables']) == {'GeoArea', 'Photo'}
+    assert calls == [path, path]
+
+
+def test_failed_introspection_is_retried(tmp_path, monkeypatch):
+    path = make_db(tmp_path / 'R001.db')
+    catalog = SchemaCatalog(str(tmp_path / 'catalog.sqlite'))
+    counting_inspect(monkeypatch, fail=True)
+    assert catalog.refresh([path])[0]['error']
+    assert catalog.get(path) is None
+
+    # 文件没有变化，但上次的错误不会被缓存
+    calls = counting_inspect(monkeypatch)
+    entry = catalog.refresh([path])[0]
+    assert entry['error'] is None and 'GeoArea' in entry['tables']
+    assert calls == [path]
@@ -0,0 +1,42 @@
+from prompt_utils import build_schema_summary, estimate_tokens
+
+
+def entry(path, tables, error=None):
+    return {'path': path, 'tables': tables, 'error': error}
+
+
+GPOINT = {'GeoArea': {'columns': ['GeoID', 'ROUTECODE', 'GEOPOINT'], 'primary_key': 'GeoID'}}
+ROUTE_DB = {'GPOINT': {'columns': ['GEOPOINT', 'DESC'], 'primary_key': None}}
+
+
+def project(routes):
+    entries = []
+    for i in range(routes):
+        entries.append(entry(f"/p/R{i:03d}/Gpoint.ta", GPOINT))
+        entries.append(entry(f"/p/R{i:03d}/R{i:03d}.db", ROUTE_DB))
+    return entries
+
+
+def test_identical_schemas_are_listed_once():
+    text = build_schema_summary(project(50), root='/p')
+    assert text.startswith("100 files, 2 distinct schemas.")
+    assert text.count("GeoArea(GeoID*, ROUTECODE, GEOPOINT)") == 1
+    assert text.count("GPOINT(GEOPOINT, DESC)") == 1
+    assert "Gpoint.ta x50" in text
+
+
+def test_summary_size_does_not_grow_with_project():
+    small = build_schema_summary(project(2), root='/p')
+    large = build_schema_summary(project(500), root='/p')
+    assert estimate_tokens(large) - estimate_tokens(small) < 20
+
+
+def test_budget_and_table_filter():
+    entries = project(3) + [entry('/p/bad.db', {}, error='locked')]
+    entries += [entry(f"/p/extra{i}.db", {f"T{i}": {'columns': [f"C{j}" for j in range(30)]}}) for i in range(20)]
+    text = build_schema_summary(entries, root='/p', token_budget=200)
+    assert estimate_tokens(text) <= 220
+    assert "more schemas" in text and "could not be read" in text
+
+    only = build_schema_summary(entries, root='/p', tables={'GPOINT'})
+    assert "GPOINT(" in only and "GeoArea" not in only
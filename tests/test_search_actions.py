@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+
+import app
+
+
+def make_db(path, count):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE GeoArea (ROUTECODE TEXT, LITHO_A TEXT)")
+    conn.executemany("INSERT INTO GeoArea VALUES (?, ?)", [('R001', f'花岗岩{i}') for i in range(count)])
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    # 未建索引的两个文件：SEARCH 走逐文件扫描
+    files = [make_db(tmp_path / 'R001.db', 3), make_db(tmp_path / 'R002.db', 3)]
+    monkeypatch.setattr(app, 'GLOBAL_DB_FILES', files)
+    return files
+
+
+def execute(action):
+    client = app.app.test_client()
+    return client.post('/api/ollama/execute', json={'actions': [dict(action, type='SEARCH', table='GeoArea')]})
+
+
+def test_scan_total_is_marked_inexact_after_early_stop(project):
+    data = execute({'filter': {'LITHO_A': '花岗岩'}, 'limit': 4}).get_json()
+    assert len(data['search_results']) == 4
+    assert data['search_total'] == 4
+    assert data['search_total_exact'] is False
+
+    data = execute({'filter': {'LITHO_A': '花岗岩'}, 'limit': 50}).get_json()
+    assert data['search_total'] == 6
+    assert data['search_total_exact'] is True
+
+
+def test_offset_is_rejected_on_scan_path(project):
+    response = execute({'filter': {'LITHO_A': '花岗岩'}, 'limit': 2, 'offset': 2})
+    assert response.status_code == 400
+    assert 'offset' in response.get_json()['error']
+
+
+def test_streamed_offset_reports_error(project):
+    client = app.app.test_client()
+    response = client.post('/api/ollama/execute', json={
+        'stream': True,
+        'actions': [{'type': 'SEARCH', 'table': 'GeoArea', 'filter': {'LITHO_A': '花岗岩'}, 'offset': 1}]
+    })
+    assert '"type": "error"' in response.get_data(as_text=True)
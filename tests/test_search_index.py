@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from geological_classifier import GeologicalClassifier
+from schema_catalog import introspect_file
+from search_index import SearchIndex
+
+CATEGORIES = {
+    '样品': {
+        'icon': 's',
+        'en_name': 'Samples',
+        'rules': [{'file_pattern': '*.db', 'table': 'Sample',
+                   'fields': {'NAME': '样品岩性', 'CODE': '样品编号'}}]
+    }
+}
+
+
+def make_db(path, rows):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE Sample (NAME TEXT, CODE)")
+    conn.executemany("INSERT INTO Sample VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / 'search.sqlite'), classifier=GeologicalClassifier(CATEGORIES))
+    if not index.available:
+        pytest.skip('SQLite without FTS5 trigram tokenizer')
+    return index
+
+
+def test_text_values_are_searchable(index, tmp_path):
+    path = make_db(tmp_path / 'R001.db', [('灰白色花岗岩', 'S-1'), ('砂岩', 'S-2')])
+    assert index.update([introspect_file(path)]) == 1
+    assert index.covers(['Sample'], ['NAME'])
+    assert index.fresh_files([path], ['Sample'], ['NAME']) == {path}
+    total, hits = index.search(['Sample'], {'NAME': '花岗岩'}, {path})
+    assert total == 1 and hits == [(path, 'Sample', 1)]
+
+
+def test_numeric_values_keep_file_scanned(index, tmp_path):
+    # CODE 没有声明类型，部分编号以整数存储，不在全文索引中
+    text_only = make_db(tmp_path / 'R001.db', [('花岗岩', 'S-1')])
+    mixed = make_db(tmp_path / 'R002.db', [('花岗岩', 'S-2'), ('闪长岩', 1024)])
+    index.update([introspect_file(text_only), introspect_file(mixed)])
+
+    assert index.fresh_files([text_only, mixed]) == {text_only, mixed}
+    # 按 CODE 搜索时 R002 需要逐文件扫描，按纯文本的 NAME 搜索时仍走索引
+    assert index.fresh_files([text_only, mixed], ['Sample'], ['CODE']) == {text_only}
+    assert index.fresh_files([text_only, mixed], ['Sample'], ['NAME']) == {text_only, mixed}
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+
+import pytest
+
+from table_meta import TableMetaCache, type_affinity, coerce_value, coerce_id, coerce_updates
+
+
+@pytest.mark.parametrize('declared, affinity', [
+    ('INTEGER', 'INTEGER'), ('BIGINT', 'INTEGER'), ('VARCHAR(20)', 'TEXT'), ('TEXT', 'TEXT'),
+    ('', 'BLOB'), (None, 'BLOB'), ('REAL', 'REAL'), ('DOUBLE', 'REAL'), ('DECIMAL(10,2)', 'NUMERIC'),
+])
+def test_type_affinity(declared, affinity):
+    assert type_affinity(declared) == affinity
+
+
+def test_coerce_numeric_columns():
+    assert coerce_value('42', 'INTEGER') == 42
+    assert coerce_value(' 3.5 ', 'INTEGER') == 3.5
+    assert coerce_value('7', 'REAL') == 7.0 and isinstance(coerce_value('7', 'REAL'), float)
+    assert coerce_value('-12', 'NUMERIC') == -12
+    # 无法转换时原样交给 SQLite
+    assert coerce_value('N/A', 'INTEGER') == 'N/A'
+    assert coerce_value(12, 'TEXT') == '12'
+
+
+def test_untyped_columns_are_not_coerced():
+    assert coerce_value('42', 'BLOB') == '42'
+    assert coerce_value(42, 'BLOB') == 42
+    assert coerce_value(None, 'INTEGER') is None
+    assert coerce_value(True, 'TEXT') is True
+
+
+def make_db(path, pk_value):
+    conn = sqlite3.connect(str(path))
+    # GEOID 没有声明类型：按库中实际存储的类型转换 ID
+    conn.execute("CREATE TABLE GeoArea (GEOID, DIP INTEGER, NOTE TEXT, X)")
+    conn.execute("INSERT INTO GeoArea VALUES (?, 30, 'a', 1)", (pk_value,))
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def load(path):
+    return TableMetaCache(lambda p: sqlite3.connect(p)).get(path, 'GeoArea')
+
+
+def test_untyped_primary_key_follows_storage(tmp_path):
+    meta = load(make_db(tmp_path / 'int.db', 5))
+    assert meta['primary_key'] == 'GEOID' and meta['pk_storage'] == 'integer'
+    assert coerce_id(meta, '5') == 5
+
+    meta = load(make_db(tmp_path / 'text.db', '005'))
+    assert meta['pk_storage'] == 'text'
+    assert coerce_id(meta, 5) == '5'
+
+
+def test_coerce_updates_matches_column_case(tmp_path):
+    meta = load(make_db(tmp_path / 'R001.db', 1))
+    assert coerce_updates(meta, {'dip': '45', 'note': 7, 'x': '2'}) == {'DIP': 45, 'NOTE': '7', 'X': '2'}
+    with pytest.raises(KeyError):
+        coerce_updates(meta, {'MISSING': 1})
+
+
+def test_meta_cache_reloads_after_mtime_change(tmp_path):
+    path = make_db(tmp_path / 'R001.db', 1)
+    calls = []
+
+    def connect(p):
+        calls.append(p)
+        return sqlite3.connect(p)
+
+    cache = TableMetaCache(connect)
+    assert cache.get(path, 'GeoArea') is cache.get(path, 'GeoArea')
+    assert len(calls) == 1
+
+    conn = sqlite3.connect(path)
+    conn.execute("ALTER TABLE GeoArea ADD COLUMN LITHO TEXT")
+    conn.commit()
+    conn.close()
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert 'LITHO' in cache.get(path, 'GeoArea')['columns']
+    assert len(calls) == 2
@@ -0,0 +1,41 @@
+import sqlite3
+
+from table_meta import TableMetaCache
+from table_query import compile_view, view_query
+
+
+def make_meta(tmp_path):
+    path = str(tmp_path / 'sample.db')
+    conn = sqlite3.connect(path)
+    # WEIGHT 没有声明类型（BLOB 亲和性），值按写入时的类型存储
+    conn.execute("CREATE TABLE Sample (ID INTEGER PRIMARY KEY, CODE TEXT, WEIGHT)")
+    conn.executemany("INSERT INTO Sample (CODE, WEIGHT) VALUES (?, ?)",
+                     [('S1', 2), ('S2', 12.5), ('S3', 30), ('S4', None)])
+    conn.commit()
+    conn.close()
+    return path, TableMetaCache(sqlite3.connect).get(path, 'Sample')
+
+
+def run_view(path, body, meta):
+    view = compile_view(meta, body)
+    sql, params = view_query('Sample', view)
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute(sql.replace('t.*', 't.CODE', 1), params)]
+    finally:
+        conn.close()
+
+
+def test_range_filter_on_untyped_column_compares_numbers(tmp_path):
+    path, meta = make_meta(tmp_path)
+    assert meta['affinity']['WEIGHT'] == 'BLOB'
+    body = {'filters': [{'column': 'WEIGHT', 'op': '>', 'value': '10'}], 'sort': 'CODE'}
+    assert run_view(path, body, meta) == ['S2', 'S3']
+    body = {'filters': [{'column': 'weight', 'op': '<=', 'value': '12.5'}], 'sort': 'CODE'}
+    assert run_view(path, body, meta) == ['S1', 'S2']
+
+
+def test_equality_filter_on_untyped_column_keeps_text(tmp_path):
+    path, meta = make_meta(tmp_path)
+    view = compile_view(meta, {'filters': [{'column': 'WEIGHT', 'op': '=', 'value': '007'}]})
+    assert view['params'] == ['007']
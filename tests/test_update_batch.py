@@ -0,0 +1,42 @@
+import sqlite3
+
+import app
+
+
+def make_db(path):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE GeoArea (GeoID INTEGER PRIMARY KEY, LITHO_A TEXT, DIP)")
+    conn.executemany("INSERT INTO GeoArea (LITHO_A, DIP) VALUES (?, ?)", [('花岗岩', 30), ('砂岩', 45)])
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def post(path, edits):
+    return app.app.test_client().post('/api/update-batch', json={'path': path, 'tableName': 'GeoArea', 'edits': edits})
+
+
+def test_batch_update_coerces_ids_and_values(tmp_path):
+    path = make_db(tmp_path / 'R001.db')
+    response = post(path, [{'id': '1', 'column': 'litho_a', 'value': '闪长岩'},
+                           {'id': 9, 'column': 'LITHO_A', 'value': 'x'},
+                           {'id': 2, 'column': 'NOPE', 'value': 'x'}])
+    assert response.status_code == 200
+    assert [r['status'] for r in response.get_json()['results']] == ['updated', 'not_found', 'invalid_column']
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT LITHO_A FROM GeoArea WHERE GeoID = 1").fetchone() == ('闪长岩',)
+    conn.close()
+
+
+def test_non_scalar_ids_are_rejected(tmp_path):
+    path = make_db(tmp_path / 'R001.db')
+    response = post(path, [{'id': 1, 'column': 'LITHO_A', 'value': 'a'},
+                           {'id': [1], 'column': 'LITHO_A', 'value': 'b'},
+                           {'id': {'GeoID': 2}, 'column': 'LITHO_A', 'value': 'c'},
+                           {'id': 2, 'column': 'LITHO_A', 'value': ['d']}])
+    assert response.status_code == 400
+    assert response.get_json()['invalid'] == [1, 2, 3]
+    # 整批拒绝，没有写入任何修改
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT LITHO_A FROM GeoArea ORDER BY GeoID").fetchall() == [('花岗岩',), ('砂岩',)]
+    conn.close()